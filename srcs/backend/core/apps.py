@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        from core import signals  # noqa: F401
+        from core import metrics  # noqa: F401  (counts database statements)
@@ -0,0 +1,25 @@
+"""
+Channel layers that time group_send (core.metrics), by event type. Configured
+in CHANNEL_LAYERS in place of the channels / channels_redis classes.
+"""
+import time
+from channels.layers import InMemoryChannelLayer as BaseInMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer as BaseRedisChannelLayer
+from core.metrics import GROUP_SEND_LATENCY
+
+
+class GroupSendMetricsMixin:
+    async def group_send(self, group, message):
+        start = time.perf_counter()
+        try:
+            await super().group_send(group, message)
+        finally:
+            GROUP_SEND_LATENCY.labels(message.get('type', '')).observe(time.perf_counter() - start)
+
+
+class RedisChannelLayer(GroupSendMetricsMixin, BaseRedisChannelLayer):
+    pass
+
+
+class InMemoryChannelLayer(GroupSendMetricsMixin, BaseInMemoryChannelLayer):
+    pass
@@ -0,0 +1,65 @@
+"""
+Wire encoding of WebSocket frames.
+
+Frames are JSON text, encoded with orjson (stdlib json if it is missing). A
+client that offers the "msgpack" subprotocol gets the same frames as
+MessagePack binary messages instead, and may send MessagePack too.
+
+Broadcasts are encoded once, by whoever sends them to the group: the
+channel-layer event carries the finished frame (encoded_event), and every
+recipient socket writes it out as it is. MessagePack sockets convert that JSON
+once per process and frame, not once per recipient.
+"""
+import json
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = 'msgpack'
+
+
+def dumps(frame):
+    """JSON text of a frame"""
+    if orjson is not None:
+        return orjson.dumps(frame, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(frame)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def pack(frame):
+    return msgpack.packb(frame, use_bin_type=True)
+
+
+def unpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+@lru_cache(maxsize=1024)
+def json_to_msgpack(text):
+    # Every MessagePack recipient of a broadcast in this process shares one conversion
+    return pack(loads(text))
+
+
+def encoded_event(handler, frame):
+    """Channel-layer event for `handler` whose frame is encoded here, once for all recipients"""
+    return {'type': handler, 'text': dumps(frame)}
+
+
+def negotiate(scope):
+    """Subprotocol to accept for this connection, or None for JSON text frames"""
+    if msgpack is not None and MSGPACK in scope.get('subprotocols', ()):
+        return MSGPACK
+    return None
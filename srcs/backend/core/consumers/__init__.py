@@ -3,3 +3,4 @@ from .dm import DMConsumer
 from .online import OnlineStatusConsumer
 from .sudoku import SudokuConsumer
 from .notifications import NotificationConsumer
+from .multiplex import SessionConsumer
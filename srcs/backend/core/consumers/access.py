@@ -0,0 +1,37 @@
+from core.membership import access_group
+
+
+class CircleAccessMixin:
+    """
+    For consumers that join a circle's broadcast group. Each socket also joins
+    access_{circle}_{user}, where core.signals sends membership_revoked when the
+    user leaves or is kicked; the socket then drops out of the circle group and
+    closes, instead of receiving broadcasts until the client reconnects.
+    """
+    revoked = False
+
+    async def join_circle_access(self, circle_id):
+        self.access_group_name = access_group(circle_id, self.user.id)
+        await self.channel_layer.group_add(self.access_group_name, self.channel_name)
+
+    async def leave_circle_access(self):
+        if hasattr(self, 'access_group_name'):
+            await self.channel_layer.group_discard(self.access_group_name, self.channel_name)
+
+    async def membership_revoked(self, event):
+        if self.revoked:
+            return
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.leave_circle_access()
+        await self.send_frame({
+            'type': 'membership_revoked',
+            'circle_id': event['circle_id']
+        })
+        self.revoked = True
+        await self.close(code=4403)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        # Broadcasts already queued on this channel before the revocation are dropped
+        if self.revoked:
+            return
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
@@ -1,147 +1,120 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from core.db_executor import database_sync_to_async
 from django.contrib.auth.models import User
-from core.models import Circle, Message
-from rest_framework.authtoken.models import Token
-
-class ChatConsumer(AsyncWebsocketConsumer):
+from core.models import Message
+from core.fanout import send_to_groups, notification_event
+from core.membership import get_member_ids
+from core.consumers.access import CircleAccessMixin
+from core.consumers.publish import BufferedPublishMixin
+from core.consumers.resume import ResumableRoomMixin
+from core.consumers.codec import FrameCodecMixin
+from core.consumers.instrument import InstrumentedConsumerMixin
+from core.consumers.session import ChatSession
+from core.log import DEBUG_ENABLED, get_logger
+
+log = get_logger(__name__)
+
+class ChatConsumer(CircleAccessMixin, BufferedPublishMixin, ResumableRoomMixin, FrameCodecMixin, InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = 'chat_%s' % self.room_name
 
-        # Extract token from query string
-        try:
-            query_string = self.scope['query_string'].decode()
-            print(f"DEBUG: WS Connection attempt. Query: {query_string}")
-            if 'token=' not in query_string:
-                print("DEBUG: No token in query string")
-                await self.close()
-                return
-            token_key = query_string.split('token=')[1].split('&')[0]
-            print(f"DEBUG: Extracted token: {token_key}")
-            self.user = await self.get_user_from_token(token_key)
-            print(f"DEBUG: User found: {self.user}")
-        except Exception as e:
-            print(f"DEBUG: Error extracting token: {e}")
-            await self.close()
-            return
-
-        if not self.user:
-            print("DEBUG: User authentication failed")
+        # Resolved once by TokenAuthMiddleware
+        self.user = self.scope.get('user')
+        if not self.user or self.user.is_anonymous:
+            if DEBUG_ENABLED:
+                log.debug('chat.rejected', reason='anonymous')
             await self.close()
             return
             
         # Check membership
-        is_member = await self.check_membership(self.user, self.room_name)
-        if not is_member:
-            print(f"DEBUG: User {self.user} is not member of circle {self.room_name}")
+        try:
+            circle_id = int(self.room_name)
+        except ValueError:
+            await self.close()
+            return
+        member_ids = await self.load_members(circle_id)
+        if self.user.id not in member_ids:
+            if DEBUG_ENABLED:
+                log.debug('chat.rejected', reason='not_member', user=self.user.id, circle=self.room_name)
             await self.close()
             return
 
+        # Everything later frames need, so they never look anything up
+        self.session = ChatSession(self.user, circle_id, member_ids)
+        self.room_group_name = self.session.room_group_name
+
         # Join room group
         try:
-            print(f"DEBUG: Adding to group {self.room_group_name}")
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
-            print("DEBUG: Added to group successfully")
+            await self.join_circle_access(self.room_name)
         except Exception as e:
-            print(f"DEBUG: Error adding to group (Redis error?): {e}")
+            log.error('chat.group_add_failed', group=self.room_group_name, error=e)
             await self.close()
             return
 
-        print("DEBUG: Accepting connection")
+        if DEBUG_ENABLED:
+            log.debug('chat.connected', user=self.user.id, group=self.room_group_name)
         await self.accept()
+        await self.send_room_state()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'session'):
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await self.leave_circle_access()
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.revoked:
+            return
+        data = self.decode_frame(text_data, bytes_data)
+        if data.get('type') == 'resume':
+            # Reconnected: replay what this client missed
+            await self.resume(data.get('last_seq'))
+            return
         message = data['message']
 
-        # Save to DB
-        await self.save_message(self.user, message, self.room_name)
-
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'sender_username': self.user.username,
-                'sender_id': self.user.id
-            }
+        # Saved in a batch with other sockets' messages, then acknowledged and broadcast
+        await self.save_and_publish(
+            Message(circle_id=self.session.circle_id, sender=self.user, content=message),
+            data.get('client_id'),
+            self.broadcast
         )
 
-        # Send notification to all circle members
-        member_ids = await self.get_circle_members(self.room_name)
-        for member_id in member_ids:
-            if member_id != self.user.id:
-                print(f"DEBUG: Sending notification to member {member_id}")
-                await self.channel_layer.group_send(
-                    f'notifications_{member_id}',
-                    {
-                        'type': 'send_notification',
-                        'notification': {
-                            'type': 'circle_message',
-                            'sender': self.user.username,
-                            'circle_id': self.room_name,
-                            'message': message
-                        }
-                    }
-                )
-
-    # Receive message from room group
-    async def chat_message(self, event):
-        message = event['message']
-        sender_username = event['sender_username']
-        sender_id = event['sender_id']
-
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+    async def broadcast(self, saved):
+        session = self.session
+        # Sequenced and buffered for reconnecting clients, then sent to the room group
+        await self.broadcast_frame({
             'type': 'chat_message',
-            'message': message,
-            'sender': {'username': sender_username, 'id': sender_id}
-        }))
+            'id': saved.id,
+            'timestamp': saved.timestamp.isoformat(),
+            'message': saved.content,
+            'sender': {'username': session.username, 'id': session.user_id}
+        })
 
-    async def task_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'task_update',
-            'action': event['action']
-        }))
-
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
-        try:
-            return Token.objects.get(key=token_key).user
-        except Token.DoesNotExist:
-            return None
+        # Send notification to all circle members
+        await send_to_groups(session.notification_groups, notification_event({
+            'type': 'circle_message',
+            'sender': session.username,
+            'circle_id': session.room_name,
+            'message': saved.content
+        }), channel_layer=self.channel_layer)
 
-    @database_sync_to_async
-    def check_membership(self, user, circle_id):
-        try:
-            circle = Circle.objects.get(id=circle_id)
-            return user in circle.members.all()
-        except Circle.DoesNotExist:
-            return False
+    async def task_update(self, event):
+        # Versioned delta, encoded by core.views.tasks.publish_task_event
+        await self.send_encoded(event['text'])
 
-    @database_sync_to_async
-    def save_message(self, user, content, circle_id):
-        circle = Circle.objects.get(id=circle_id)
-        Message.objects.create(sender=user, content=content, circle=circle)
+    async def circle_members_changed(self, event):
+        # Sent by core.signals after commit; the only time the member set is reloaded
+        self.session.set_members(await self.load_members(self.session.circle_id))
 
     @database_sync_to_async
-    def get_circle_members(self, circle_id):
-        try:
-            circle = Circle.objects.get(id=circle_id)
-            return list(circle.members.values_list('id', flat=True))
-        except Circle.DoesNotExist:
-            return []
+    def load_members(self, circle_id):
+        return get_member_ids(circle_id)
@@ -0,0 +1,33 @@
+from core.codec import MSGPACK, dumps, loads, pack, unpack, json_to_msgpack, negotiate
+
+
+class FrameCodecMixin:
+    """
+    For every consumer: frames go out through send_frame (a dict) or
+    send_encoded (an encoded_event's text), and come in through decode_frame,
+    in whichever wire format core.codec negotiated at accept.
+    """
+    wire_format = 'json'
+
+    async def accept(self, subprotocol=None, headers=None):
+        subprotocol = subprotocol or negotiate(self.scope)
+        if subprotocol == MSGPACK:
+            self.wire_format = MSGPACK
+        await super().accept(subprotocol=subprotocol, headers=headers)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return unpack(bytes_data)
+        return loads(text_data)
+
+    async def send_frame(self, frame):
+        if self.wire_format == MSGPACK:
+            await self.send(bytes_data=pack(frame))
+        else:
+            await self.send(text_data=dumps(frame))
+
+    async def send_encoded(self, text):
+        if self.wire_format == MSGPACK:
+            await self.send(bytes_data=json_to_msgpack(text))
+        else:
+            await self.send(text_data=text)
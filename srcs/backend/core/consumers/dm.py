@@ -1,34 +1,34 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from core.db_executor import database_sync_to_async
 from django.contrib.auth.models import User
 from core.models import DirectMessage
-from rest_framework.authtoken.models import Token
+from core.conversations import mark_read
+from core.fanout import notification_event
+from core.consumers.publish import BufferedPublishMixin
+from core.consumers.resume import ResumableRoomMixin
+from core.consumers.codec import FrameCodecMixin
+from core.consumers.instrument import InstrumentedConsumerMixin
+from core.consumers.session import DMSession
+from core.log import DEBUG_ENABLED, get_logger
 
-class DMConsumer(AsyncWebsocketConsumer):
+log = get_logger(__name__)
+
+class DMConsumer(BufferedPublishMixin, ResumableRoomMixin, FrameCodecMixin, InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.target_user_id = int(self.scope['url_route']['kwargs']['user_id'])
         
-        # Extract token from query string
-        try:
-            query_string = self.scope['query_string'].decode()
-            if 'token=' not in query_string:
-                await self.close()
-                return
-            token_key = query_string.split('token=')[1].split('&')[0]
-            self.user = await self.get_user_from_token(token_key)
-        except Exception as e:
+        # Resolved once by TokenAuthMiddleware
+        self.user = self.scope.get('user')
+        if not self.user or self.user.is_anonymous:
             await self.close()
             return
 
-        if not self.user:
+        # The peer is checked here once instead of on every message
+        if not await self.peer_exists(self.target_user_id):
             await self.close()
             return
-
-        # Ensure consistent room name for both users (order by ID)
-        users = sorted([self.user.id, self.target_user_id])
-        self.room_name = f"dm_{users[0]}_{users[1]}"
-        self.room_group_name = f"chat_{self.room_name}"
+        self.session = DMSession(self.user, self.target_user_id)
+        self.room_group_name = self.session.room_group_name
 
         # Join room group
         await self.channel_layer.group_add(
@@ -37,8 +37,11 @@ class DMConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        await self.send_room_state()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'session'):
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -46,60 +49,49 @@ class DMConsumer(AsyncWebsocketConsumer):
         )
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode_frame(text_data, bytes_data)
+        if data.get('type') == 'mark_read':
+            # The receiver has the conversation open
+            await database_sync_to_async(mark_read)(self.session.user_id, self.session.peer_id)
+            return
+        if data.get('type') == 'resume':
+            # Reconnected: replay what this client missed
+            await self.resume(data.get('last_seq'))
+            return
         message = data['message']
 
-        # Save to DB
-        await self.save_message(self.user, message, self.target_user_id)
-
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'sender_username': self.user.username,
-                'sender_id': self.user.id
-            }
+        # Saved in a batch with other sockets' messages, then acknowledged and broadcast
+        await self.save_and_publish(
+            DirectMessage(sender=self.user, receiver_id=self.session.peer_id, content=message),
+            data.get('client_id'),
+            self.broadcast
         )
 
+    async def broadcast(self, saved):
+        session = self.session
+        # Sequenced and buffered for reconnecting clients, then sent to the room group
+        await self.broadcast_frame({
+            'type': 'chat_message',
+            'id': saved.id,
+            'timestamp': saved.timestamp.isoformat(),
+            'message': saved.content,
+            'sender': {'username': session.username, 'id': session.user_id}
+        })
+
         # Send notification to receiver
-        print(f"DEBUG: Sending notification to target user {self.target_user_id}")
+        if DEBUG_ENABLED:
+            log.debug('dm.notify', sample=0.01, peer=session.peer_id)
         await self.channel_layer.group_send(
-            f'notifications_{self.target_user_id}',
-            {
-                'type': 'send_notification',
-                'notification': {
-                    'type': 'direct_message',
-                    'sender': self.user.username,
-                    'sender_id': self.user.id,
-                    'message': message
-                }
-            }
+            session.notification_groups[0],
+            notification_event({
+                'type': 'direct_message',
+                'sender': session.username,
+                'sender_id': session.user_id,
+                'message': saved.content
+            })
         )
 
-    # Receive message from room group
-    async def chat_message(self, event):
-        message = event['message']
-        sender_username = event['sender_username']
-        sender_id = event['sender_id']
-
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': message,
-            'sender': {'username': sender_username, 'id': sender_id}
-        }))
-
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
-        try:
-            return Token.objects.get(key=token_key).user
-        except Token.DoesNotExist:
-            return None
-
     @database_sync_to_async
-    def save_message(self, user, content, target_user_id):
-        receiver = User.objects.get(id=target_user_id)
-        DirectMessage.objects.create(sender=user, content=content, receiver=receiver)
+    def peer_exists(self, user_id):
+        return User.objects.filter(id=user_id).exists()
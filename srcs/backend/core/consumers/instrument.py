@@ -0,0 +1,45 @@
+import time
+from core.loop_monitor import start_loop_monitor, watch_handler
+from core.metrics import WS_OPEN, WS_FRAMES_IN, WS_FRAMES_OUT, WS_HANDLER_LATENCY
+
+
+class InstrumentedConsumerMixin:
+    """
+    For every consumer, last before AsyncWebsocketConsumer so only frames that
+    really go out are counted: open connections, frames in and out, and the
+    latency of each handler (websocket.receive, chat_message, ...), labelled by
+    consumer class. Topics of ws/session/ count as transport "session".
+    Handlers are also watched for slowness and timeouts (core.loop_monitor).
+    """
+    metrics_open = None
+
+    async def dispatch(self, message):
+        consumer, handler = type(self).__name__, message['type']
+        start = time.perf_counter()
+        try:
+            async with watch_handler(consumer, handler):
+                await super().dispatch(message)
+        finally:
+            WS_HANDLER_LATENCY.labels(consumer, handler).observe(time.perf_counter() - start)
+
+    async def websocket_receive(self, message):
+        WS_FRAMES_IN.labels(type(self).__name__).inc()
+        await super().websocket_receive(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None or bytes_data is not None:
+            WS_FRAMES_OUT.labels(type(self).__name__).inc()
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol=subprotocol, headers=headers)
+        start_loop_monitor()
+        transport = 'session' if 'session_topic' in self.scope else 'socket'
+        self.metrics_open = WS_OPEN.labels(type(self).__name__, transport)
+        self.metrics_open.inc()
+
+    async def websocket_disconnect(self, message):
+        if self.metrics_open is not None:
+            self.metrics_open.dec()
+            self.metrics_open = None
+        await super().websocket_disconnect(message)
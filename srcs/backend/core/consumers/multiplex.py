@@ -0,0 +1,181 @@
+import asyncio
+import re
+from channels.generic.websocket import AsyncWebsocketConsumer
+from core.codec import dumps, loads
+from core.consumers.codec import FrameCodecMixin
+from core.consumers.instrument import InstrumentedConsumerMixin
+from core.consumers.chat import ChatConsumer
+from core.consumers.dm import DMConsumer
+from core.consumers.sudoku import SudokuConsumer
+from core.consumers.notifications import NotificationConsumer
+from core.consumers.online import OnlineStatusConsumer
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# topic name -> (consumer, URL kwarg its argument fills), as routed in core.routing
+TOPICS = {
+    'chat': (ChatConsumer.as_asgi(), 'room_name'),
+    'dm': (DMConsumer.as_asgi(), 'user_id'),
+    'sudoku': (SudokuConsumer.as_asgi(), 'circle_id'),
+    'notifications': (NotificationConsumer.as_asgi(), None),
+    'presence': (OnlineStatusConsumer.as_asgi(), None),
+}
+# Every topic argument is a circle or user id
+TOPIC_RE = re.compile(r'(?P<name>\w+)(?::(?P<arg>\d+))?')
+MAX_TOPICS = 16
+
+
+class Topic:
+    """One subscription: an instance of the topic's consumer fed from a queue"""
+
+    def __init__(self, name, queue, task):
+        self.name = name
+        self.queue = queue
+        self.task = task
+        self.accepted = False
+        self.unsubscribed = False
+
+
+class SessionConsumer(FrameCodecMixin, InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    """
+    ws/session/: every stream of a dashboard tab over one socket.
+
+    Frames starting with "{" are session control:
+        {"type": "subscribe", "topic": "chat:5"}     also dm:<user>, sudoku:<circle>,
+        {"type": "unsubscribe", "topic": "chat:5"}   notifications, presence
+    Every other frame is "<topic>\\n<payload>", in both directions; the payload
+    is exactly what the topic's own socket (ws/chat/5/ etc.) would carry. With
+    the msgpack subprotocol, stream frames are binary (the payload MessagePack)
+    while control frames stay JSON text.
+
+    Each subscription runs the topic's existing consumer as if it had its own
+    socket, with the session's already authenticated scope. The server reports
+    {"type": "subscribed", "topic"} once the consumer accepts, and
+    {"type": "unsubscribed", "topic", "code"} when it rejects or closes
+    (e.g. 4403 when the membership is revoked), or 1011 when it crashes.
+
+    What one socket saves is the connection, the handshake and the token
+    lookup per stream. It does not merge channel-layer state: every topic's
+    consumer still registers its own channel name and joins its own groups,
+    exactly as on its own socket, so a session with five topics holds five
+    channels and as many group memberships as five sockets would.
+    """
+
+    async def connect(self):
+        # Resolved once by TokenAuthMiddleware, for every topic of the session
+        self.user = self.scope.get('user')
+        if not self.user or self.user.is_anonymous:
+            await self.close()
+            return
+        self.topics = {}
+        self.closing = set()  # tasks still winding down after their topic closed
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'topics'):
+            return
+        await asyncio.gather(*(self.unsubscribe(topic, close_code) for topic in list(self.topics)))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            topic, _, payload = bytes_data.partition(b'\n')
+            return await self.forward(topic.decode(), {'type': 'websocket.receive', 'bytes': payload})
+        if not text_data:
+            return
+        if text_data.startswith('{'):
+            data = loads(text_data)
+            if data.get('type') == 'subscribe':
+                await self.subscribe(data.get('topic'))
+            elif data.get('type') == 'unsubscribe':
+                await self.unsubscribe(data.get('topic'))
+            return
+        topic, _, payload = text_data.partition('\n')
+        await self.forward(topic, {'type': 'websocket.receive', 'text': payload})
+
+    async def forward(self, topic, message):
+        subscription = self.topics.get(topic)
+        if subscription is not None and subscription.accepted:
+            await subscription.queue.put(message)
+
+    async def subscribe(self, topic):
+        match = TOPIC_RE.fullmatch(topic or '')
+        if not match or match['name'] not in TOPICS:
+            return await self.send_control('error', topic, error='unknown topic')
+        app, kwarg = TOPICS[match['name']]
+        if bool(kwarg) != bool(match['arg']):
+            return await self.send_control('error', topic, error='unknown topic')
+        if topic in self.topics:
+            return await self.send_control('error', topic, error='already subscribed')
+        if len(self.topics) >= MAX_TOPICS:
+            return await self.send_control('error', topic, error='too many topics')
+
+        scope = dict(
+            self.scope,
+            url_route={'args': (), 'kwargs': {kwarg: match['arg']} if kwarg else {}},
+            session_topic=topic,
+        )
+        queue = asyncio.Queue()
+        await queue.put({'type': 'websocket.connect'})
+        subscription = Topic(topic, queue, None)
+        subscription.task = asyncio.ensure_future(app(scope, queue.get, self.topic_sender(subscription)))
+        subscription.task.add_done_callback(self.topic_done(subscription))
+        self.topics[topic] = subscription
+
+    async def unsubscribe(self, topic, code=1000):
+        subscription = self.topics.pop(topic, None)
+        if subscription is None:
+            return
+        # The client asked for it, so no unsubscribed frame follows
+        subscription.unsubscribed = True
+        await subscription.queue.put({'type': 'websocket.disconnect', 'code': code})
+        try:
+            await asyncio.wait_for(subscription.task, timeout=10)
+        except asyncio.TimeoutError:
+            subscription.task.cancel()
+        except Exception as e:
+            log.error('session.topic_close_failed', topic=topic, user=self.user.id, error=e)
+
+    def topic_sender(self, subscription):
+        async def send(message):
+            if subscription.unsubscribed:
+                return
+            if message['type'] == 'websocket.accept':
+                subscription.accepted = True
+                await self.send_control('subscribed', subscription.name)
+            elif message['type'] == 'websocket.send':
+                if message.get('text') is not None:
+                    await self.send(text_data=f"{subscription.name}\n{message['text']}")
+                elif message.get('bytes') is not None:
+                    await self.send(bytes_data=subscription.name.encode() + b'\n' + message['bytes'])
+            elif message['type'] == 'websocket.close':
+                # Rejected or closed by the consumer: let it finish as if the socket went away
+                subscription.unsubscribed = True
+                self.topics.pop(subscription.name, None)
+                self.closing.add(subscription.task)
+                subscription.task.add_done_callback(self.closing.discard)
+                await subscription.queue.put({'type': 'websocket.disconnect', 'code': message.get('code', 1000)})
+                await self.send_control(
+                    'unsubscribed', subscription.name,
+                    code=message.get('code', 1000) if subscription.accepted else 1006
+                )
+        return send
+
+    def topic_done(self, subscription):
+        def done(task):
+            if task.cancelled() or task.exception() is None:
+                return
+            log.error('session.topic_failed', topic=subscription.name, user=self.user.id, error=task.exception())
+            # Closed or unsubscribed already: the client has been told
+            if self.topics.get(subscription.name) is not subscription:
+                return
+            # Crashed: free the slot and tell the client, as for a server error close
+            subscription.unsubscribed = True
+            del self.topics[subscription.name]
+            notify = asyncio.ensure_future(self.send_control('unsubscribed', subscription.name, code=1011))
+            self.closing.add(notify)
+            notify.add_done_callback(self.closing.discard)
+        return done
+
+    async def send_control(self, type, topic, **fields):
+        await self.send(text_data=dumps({'type': type, 'topic': topic, **fields}))
@@ -1,111 +1,70 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
-from core.models import UserProfile
-from rest_framework.authtoken.models import Token
+from core.db_executor import database_sync_to_async
+from core.presence import (
+    get_presence_store, get_presence_audience, presence_group, announce, start_maintenance
+)
+from core.consumers.codec import FrameCodecMixin
+from core.consumers.instrument import InstrumentedConsumerMixin
+from core.log import DEBUG_ENABLED, get_logger
 
-class OnlineStatusConsumer(AsyncWebsocketConsumer):
+log = get_logger(__name__)
+
+class OnlineStatusConsumer(FrameCodecMixin, InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
-        self.user = self.scope["user"]
-        
-        # We expect user to be authenticated via middleware or standard session if possible
-        # Since we use token auth in other consumers, let's try to extract token if user is anonymous
-        if self.user.is_anonymous:
-            # Try extracting token from query
-            try:
-                query_string = self.scope['query_string'].decode()
-                print(f"DEBUG: Presence connection attempt. Query: {query_string}")
-                if 'token=' in query_string:
-                    token_key = query_string.split('token=')[1].split('&')[0]
-                    self.user = await self.get_user_from_token(token_key)
-                    print(f"DEBUG: Presence token found user: {self.user}")
-            except Exception as e:
-                print(f"DEBUG: Presence auth error: {e}")
-                pass
+        # Resolved once by TokenAuthMiddleware (token) or the session stack
+        self.user = self.scope.get("user")
 
         if not self.user or self.user.is_anonymous:
-            print("DEBUG: Presence rejected - Anonymous")
+            if DEBUG_ENABLED:
+                log.debug('presence.rejected', reason='anonymous')
             await self.close()
             return
-            
-        self.room_group_name = 'global_presence'
-        print(f"DEBUG: User {self.user} joining global_presence")
 
-        # Join room group
+        # Each user only hears about the people they share a circle or DM with
+        self.room_group_name = presence_group(self.user.id)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
         await self.accept()
-        
-        # Mark as online
-        await self.set_online_status(True)
-        
-        # Broadcast online status
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'user_id': self.user.id,
-                'status': 'online'
-            }
-        )
-        
-        # Send current online users list to the new connection
-        online_users = await self.get_online_users()
-        await self.send(text_data=json.dumps({
+        start_maintenance()
+
+        self.store = get_presence_store()
+        self.audience = await database_sync_to_async(get_presence_audience)(self.user.id)
+
+        # Only the first tab of a user is a status change worth broadcasting
+        became_online = await self.store.connect(self.user.id, self.channel_name)
+        if became_online:
+            await announce(self.user.id, 'online', self.audience)
+
+        # Send current online users (among the audience) to the new connection
+        online_users = await self.store.online_among(self.audience | {self.user.id})
+        await self.send_frame({
             'type': 'initial_state',
             'online_users': online_users
-        }))
+        })
 
     async def disconnect(self, close_code):
-        if hasattr(self, 'user') and not self.user.is_anonymous:
-            # Mark as offline
-            await self.set_online_status(False)
-            
-            # Broadcast offline status
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_status',
-                    'user_id': self.user.id,
-                    'status': 'offline'
-                }
-            )
-
-            # Leave room group
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+        if not hasattr(self, 'store'):
+            return
 
-    async def user_status(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'user_status',
-            'user_id': event['user_id'],
-            'status': event['status']
-        }))
+        went_offline = await self.store.disconnect(self.user.id, self.channel_name)
+        if went_offline:
+            await announce(self.user.id, 'offline', self.audience)
 
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
-        try:
-            return Token.objects.get(key=token_key).user
-        except Token.DoesNotExist:
-            return None
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
 
-    @database_sync_to_async
-    def set_online_status(self, is_online):
-        try:
-            # Safely get or create profile to avoid RelatedObjectDoesNotExist errors
-            profile, created = UserProfile.objects.get_or_create(user=self.user)
-            profile.is_online = is_online
-            profile.save()
-            print(f"DEBUG: Set {self.user.username} online={is_online}")
-        except Exception as e:
-            print(f"DEBUG: Error setting online status: {e}")
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode_frame(text_data, bytes_data)
+        if data.get('type') == 'heartbeat' and hasattr(self, 'store'):
+            # Swept while the tab was still open (e.g. a stalled network): online again
+            if await self.store.heartbeat(self.user.id, self.channel_name):
+                await announce(self.user.id, 'online', self.audience)
 
-    @database_sync_to_async
-    def get_online_users(self):
-        return list(UserProfile.objects.filter(is_online=True).values_list('user_id', flat=True))
+    async def user_status(self, event):
+        # Encoded once by core.presence.announce
+        await self.send_encoded(event['text'])
@@ -0,0 +1,51 @@
+import asyncio
+from core.message_writer import message_writer
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+
+class BufferedPublishMixin:
+    """
+    For consumers whose messages go through message_writer. receive() only
+    queues the message and returns, so one socket can have several messages
+    waiting for the same batch; each is then acknowledged to the sender
+    (message_saved / message_failed) and broadcast in the order it arrived.
+    Once max_unpublished are waiting, receive() waits too, which stops
+    reading from the socket until the database catches up.
+    """
+    max_unpublished = 50
+    last_publish = None
+    unpublished = 0
+
+    async def save_and_publish(self, message, client_id, broadcast):
+        future = message_writer.submit(message)
+        self.unpublished += 1
+        self.last_publish = asyncio.ensure_future(self.publish(future, self.last_publish, client_id, broadcast))
+        if self.unpublished >= self.max_unpublished:
+            await asyncio.wait([self.last_publish])
+
+    async def publish(self, future, previous, client_id, broadcast):
+        try:
+            try:
+                saved = await future
+            except Exception:
+                saved = None
+            # Keep the sender's order even when an earlier broadcast is slower
+            if previous is not None:
+                await asyncio.wait([previous])
+
+            if saved is None:
+                await self.send_frame({'type': 'message_failed', 'client_id': client_id})
+                return
+            await self.send_frame({
+                'type': 'message_saved',
+                'client_id': client_id,
+                'id': saved.id,
+                'timestamp': saved.timestamp.isoformat()
+            })
+            await broadcast(saved)
+        except Exception as e:
+            log.error('chat.publish_failed', user=self.user.id, error=e)
+        finally:
+            self.unpublished -= 1
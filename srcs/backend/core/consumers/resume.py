@@ -0,0 +1,68 @@
+from core.codec import encoded_event
+from core.replay import get_replay_store
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Rooms that broadcast a frame the replay buffer could not take, in this process
+unsequenced_rooms = set()
+
+
+class ResumableRoomMixin:
+    """
+    For consumers that broadcast chat_message frames to room_group_name. Each
+    frame gets the room's next sequence number and goes into the replay buffer
+    (core.replay). On connect the client is told the room's current seq; after
+    a reconnect it sends {"type": "resume", "last_seq": n} and receives the
+    frames it missed, or {"type": "resync"} when it has to refetch the history
+    over REST because the buffer no longer reaches back that far (also sent to
+    the whole room after a frame went out unsequenced).
+
+    The seq is assigned before the frame is sent, so concurrent senders can
+    deliver N+1 before N: clients resume from the last seq they have seen
+    without gaps, not the highest.
+    """
+
+    async def send_room_state(self):
+        try:
+            seq = await get_replay_store().current(self.room_group_name)
+        except Exception as e:
+            log.error('replay.read_failed', room=self.room_group_name, error=e)
+            return
+        await self.send_frame({'type': 'chat_state', 'seq': seq})
+
+    async def resume(self, last_seq):
+        try:
+            last_seq = int(last_seq)
+            current, frames = await get_replay_store().since(self.room_group_name, last_seq)
+        except Exception as e:
+            log.error('replay.resume_failed', room=self.room_group_name, error=e)
+            current, frames = None, None
+        if frames is None:
+            await self.send_frame({'type': 'resync', 'seq': current})
+            return
+        for frame in frames:
+            await self.send_frame(frame)
+
+    async def broadcast_frame(self, frame):
+        room = self.room_group_name
+        try:
+            frame['seq'] = await get_replay_store().append(room, frame)
+        except Exception as e:
+            # Delivered live all the same, but no reconnecting client can replay it
+            log.error('replay.append_failed', room=room, error=e)
+            frame['seq'] = None
+            unsequenced_rooms.add(room)
+        else:
+            if room in unsequenced_rooms:
+                # Frames went out without a seq since the last one: have everyone reload
+                # the history, then count on from this frame
+                unsequenced_rooms.discard(room)
+                await self.channel_layer.group_send(
+                    room, encoded_event('chat_message', {'type': 'resync', 'seq': frame['seq'] - 1})
+                )
+        await self.channel_layer.group_send(room, encoded_event('chat_message', frame))
+
+    # Receive message from room group
+    async def chat_message(self, event):
+        await self.send_encoded(event['text'])
@@ -0,0 +1,39 @@
+from core.fanout import notification_group
+from core.membership import chat_group
+
+
+class ChatSession:
+    """
+    Everything a circle chat socket needs per frame, resolved once at connect:
+    the user, the circle, its member set and the groups messages go to. The
+    member set is refreshed when core.signals reports a change, so steady-state
+    frames need no lookups.
+    """
+
+    def __init__(self, user, circle_id, member_ids):
+        self.user = user
+        self.user_id = user.id
+        self.username = user.username
+        self.circle_id = circle_id
+        self.room_name = str(circle_id)
+        self.room_group_name = chat_group(circle_id)
+        self.set_members(member_ids)
+
+    def set_members(self, member_ids):
+        self.member_ids = member_ids
+        self.notification_groups = [notification_group(member_id) for member_id in member_ids if member_id != self.user_id]
+
+
+class DMSession:
+    """The same for a DM socket: the user, the peer and the conversation's groups"""
+
+    def __init__(self, user, peer_id):
+        self.user = user
+        self.user_id = user.id
+        self.username = user.username
+        self.peer_id = peer_id
+        # Consistent room name for both users (ordered by ID)
+        low, high = sorted((user.id, peer_id))
+        self.room_name = f'dm_{low}_{high}'
+        self.room_group_name = f'chat_{self.room_name}'
+        self.notification_groups = [notification_group(peer_id)]
@@ -1,26 +1,21 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
-from core.models import Circle, SudokuGame
-from rest_framework.authtoken.models import Token
-
-class SudokuConsumer(AsyncWebsocketConsumer):
+from core.db_executor import database_sync_to_async
+from core.codec import encoded_event
+from core.membership import is_member
+from core.consumers.access import CircleAccessMixin
+from core.consumers.codec import FrameCodecMixin
+from core.consumers.instrument import InstrumentedConsumerMixin
+from core.sudoku.boards import board_registry
+from core.sudoku.engine import DIFFICULTIES
+from core.sudoku.pool import puzzle_pool
+
+class SudokuConsumer(CircleAccessMixin, FrameCodecMixin, InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.circle_id = self.scope['url_route']['kwargs']['circle_id']
         self.room_group_name = f'sudoku_{self.circle_id}'
+        # Resolved once by TokenAuthMiddleware
         self.user = self.scope.get("user")
 
-        # Basic Auth check (Token auth fallback if anonymous)
-        if not self.user or self.user.is_anonymous:
-             try:
-                query_string = self.scope['query_string'].decode()
-                if 'token=' in query_string:
-                    token_key = query_string.split('token=')[1].split('&')[0]
-                    self.user = await self.get_user_from_token(token_key)
-             except:
-                 pass
-        
         if not self.user or self.user.is_anonymous:
              await self.close()
              return
@@ -35,132 +30,121 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        await self.join_circle_access(self.circle_id)
 
         await self.accept()
+        # Start filling the puzzle pool before anyone asks for a game
+        puzzle_pool.start()
+
+        # The in-memory board is authoritative while anyone is playing
+        self.board_key = int(self.circle_id)
+        board = await board_registry.acquire(self.board_key)
 
         # Send current game state
-        game_state = await self.get_game_state(self.circle_id)
-        if game_state:
-             await self.send(text_data=json.dumps({
+        if board:
+             await self.send_frame({
                 'type': 'game_state',
-                'board': game_state['board'],
-                'initial_board': game_state['initial_board'],
-                'solution': game_state['solution'],
-                'difficulty': game_state['difficulty'],
-                'is_solved': game_state['is_solved']
-            }))
+                **board.state()
+            })
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'board_key'):
+            await board_registry.release(self.board_key)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await self.leave_circle_access()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.revoked:
+            return
+        data = self.decode_frame(text_data, bytes_data)
         event_type = data.get('type')
 
         if event_type == 'update_cell':
-            row = data['row']
-            col = data['col']
-            value = data['value']
+            try:
+                row, col, value = int(data['row']), int(data['col']), int(data['value'])
+            except (KeyError, TypeError, ValueError):
+                return
             
-            # Update DB
-            await self.update_game_cell(self.circle_id, row, col, value)
+            # Apply in memory; persisted by the registry's write-behind flush
+            board = board_registry.get(self.board_key)
+            result = board.set_cell(row, col, value) if board else None
+            if result is None:
+                return
+            conflict, solved = result
             
-            # Broadcast
+            # Broadcast, encoded once for every player
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                encoded_event('board_update', {
                     'type': 'board_update',
                     'row': row,
                     'col': col,
                     'value': value,
                     'sender_id': self.user.id
-                }
+                })
             )
+
+            if conflict:
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    encoded_event('cell_conflict', {
+                        'type': 'cell_conflict',
+                        'row': row,
+                        'col': col,
+                        'value': value,
+                        'cells': board.conflicting_cells(row, col),
+                        'sender_id': self.user.id
+                    })
+                )
+
+            if solved:
+                # Written through so a finished game survives a restart
+                await board_registry.flush_circle(self.board_key, board)
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    encoded_event('game_solved', {
+                        'type': 'game_solved',
+                        'sender_id': self.user.id
+                    })
+                )
             
         elif event_type == 'new_game':
-            board = data['board']
-            initial_board = data['initial_board']
-            solution = data.get('solution', [])
+            # Puzzles come from the server's pool; whatever board a client sends is ignored
             difficulty = data.get('difficulty', 'easy')
+            if difficulty not in DIFFICULTIES:
+                return
+            puzzle, solution = await puzzle_pool.get(difficulty)
+            initial_board = puzzle
+            board = [row[:] for row in puzzle]
             
-            await self.create_or_update_game(self.circle_id, board, initial_board, solution, difficulty)
+            await board_registry.new_game(self.board_key, board, initial_board, solution, difficulty)
             
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'new_game_started',
+                encoded_event('new_game_started', {
+                    'type': 'new_game',
                     'board': board,
                     'initial_board': initial_board,
-                    'solution': solution,
                     'difficulty': difficulty
-                }
+                })
             )
 
+    # Group events arrive already encoded
     async def board_update(self, event):
-        await self.send(text_data=json.dumps(event))
-
-    async def new_game_started(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'new_game',
-            'board': event['board'],
-            'initial_board': event['initial_board'],
-            'solution': event.get('solution', []),
-            'difficulty': event['difficulty']
-        }))
-
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
-        try:
-            return Token.objects.get(key=token_key).user
-        except Token.DoesNotExist:
-            return None
+        await self.send_encoded(event['text'])
 
-    @database_sync_to_async
-    def check_membership(self, user, circle_id):
-        try:
-            circle = Circle.objects.get(id=circle_id)
-            return user in circle.members.all()
-        except Circle.DoesNotExist:
-            return False
+    async def cell_conflict(self, event):
+        await self.send_encoded(event['text'])
 
-    @database_sync_to_async
-    def get_game_state(self, circle_id):
-        try:
-            game = SudokuGame.objects.get(circle_id=circle_id)
-            return {
-                'board': game.board,
-                'initial_board': game.initial_board,
-                'solution': game.solution,
-                'difficulty': game.difficulty,
-                'is_solved': game.is_solved
-            }
-        except SudokuGame.DoesNotExist:
-            return None
+    async def game_solved(self, event):
+        await self.send_encoded(event['text'])
 
-    @database_sync_to_async
-    def update_game_cell(self, circle_id, row, col, value):
-        try:
-            game = SudokuGame.objects.get(circle_id=circle_id)
-            board = game.board
-            board[row][col] = value
-            game.board = board
-            game.save()
-        except SudokuGame.DoesNotExist:
-            pass
+    async def new_game_started(self, event):
+        await self.send_encoded(event['text'])
 
     @database_sync_to_async
-    def create_or_update_game(self, circle_id, board, initial_board, solution, difficulty):
-        circle = Circle.objects.get(id=circle_id)
-        SudokuGame.objects.update_or_create(
-            circle=circle,
-            defaults={
-                'board': board,
-                'initial_board': initial_board,
-                'solution': solution,
-                'difficulty': difficulty,
-                'is_solved': False
-            }
-        )
+    def check_membership(self, user, circle_id):
+        return is_member(user.id, circle_id)
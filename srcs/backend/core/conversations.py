@@ -0,0 +1,96 @@
+"""
+Direct-message conversations.
+
+Every pair of users that has exchanged DMs has one Conversation row holding
+the last message and each side's unread count. DMConsumer updates it in the
+same transaction that saves the message, so the inbox is served from that one
+indexed table instead of grouping DirectMessage by peer, and the unread badges
+(core.unread) read the same counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, DateTimeField, F, Q, Value, When
+from core.models import Conversation, DirectMessage
+from core.unread import cache_increment, cache_clear
+
+
+def unread_field(conversation_user_low, user_id):
+    return 'unread_low' if user_id == conversation_user_low else 'unread_high'
+
+
+def record_message(message):
+    """Make message the conversation's latest and count it unread for the receiver;
+    call inside the transaction that saves it"""
+    record_messages([message])
+
+
+def record_messages(messages):
+    """record_message for a batch of saved DMs, with one UPDATE per conversation"""
+    threads = {}
+    for message in messages:
+        threads.setdefault(Conversation.pair(message.sender_id, message.receiver_id), []).append(message)
+
+    for (low, high), thread in threads.items():
+        last = max(thread, key=lambda message: (message.timestamp, message.id))
+        unread = {}
+        for message in thread:
+            field = unread_field(low, message.receiver_id)
+            unread[field] = unread.get(field, 0) + 1
+
+        conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high)
+        # Two sends can commit out of order; only move last_message forward
+        newer = Q(last_message_at__lte=last.timestamp)
+        changes = {
+            'last_message_id': Case(
+                When(newer, then=Value(last.id)), default=F('last_message_id'), output_field=BigIntegerField()
+            ),
+            'last_message_at': Case(
+                When(newer, then=Value(last.timestamp)), default=F('last_message_at'), output_field=DateTimeField()
+            ),
+            **{field: F(field) + count for field, count in unread.items()},
+        }
+        if not conversation.update(**changes):
+            try:
+                with transaction.atomic():
+                    Conversation.objects.create(
+                        user_low_id=low, user_high_id=high,
+                        last_message=last, last_message_at=last.timestamp, **unread
+                    )
+            except IntegrityError:
+                # The other side's first message created the row first
+                conversation.update(**changes)
+
+    received = {}
+    for message in messages:
+        key = (message.receiver_id, message.sender_id)
+        received[key] = received.get(key, 0) + 1
+    for (receiver_id, sender_id), count in received.items():
+        transaction.on_commit(lambda r=receiver_id, s=sender_id, c=count: cache_increment(r, s, c))
+
+
+@transaction.atomic
+def mark_read(user_id, peer_id):
+    """Mark everything peer sent to user as read; returns the number of messages"""
+    low, high = Conversation.pair(user_id, peer_id)
+    # The conversation row is locked first, so a DM committing meanwhile is
+    # either marked read here or counted again afterwards, never lost
+    Conversation.objects.filter(user_low_id=low, user_high_id=high).update(**{unread_field(low, user_id): 0})
+    updated = DirectMessage.objects.filter(receiver_id=user_id, sender_id=peer_id, is_read=False).update(is_read=True)
+    transaction.on_commit(lambda: cache_clear(user_id, peer_id))
+    return updated
+
+
+def conversations_of(user_id):
+    return Conversation.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id))
+
+
+def inbox_of(user_id):
+    """
+    The user's conversations as its two sides, for KeysetPagination: each
+    side's page is a range scan of its own inbox index, where the OR above
+    would have to read and sort every conversation of the user.
+    """
+    return [
+        Conversation.objects.filter(user_low_id=user_id),
+        # A conversation with oneself is already on the low side
+        Conversation.objects.filter(user_high_id=user_id).exclude(user_low_id=user_id),
+    ]
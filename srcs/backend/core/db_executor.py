@@ -0,0 +1,63 @@
+"""
+The thread pool behind consumers' database calls.
+
+channels' database_sync_to_async is thread-sensitive: every consumer in the
+process shares one thread for the ORM, so a slow query stalls every socket
+waiting on the database. database_sync_to_async here runs the same calls on a
+pool of DB_EXECUTOR_THREADS threads (each with its own connection, closed
+after the call unless CONN_MAX_AGE says otherwise) and reports how busy the
+pool is: calls running, calls queued and how long they waited for a thread.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from core.metrics import DB_EXECUTOR_THREADS, DB_EXECUTOR_ACTIVE, DB_EXECUTOR_QUEUED, DB_EXECUTOR_WAIT
+
+DB_EXECUTOR_SIZE = getattr(settings, 'DB_EXECUTOR_THREADS', 8)
+
+
+class MonitoredExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix='db')
+        self.size = max_workers
+        self.queued = DB_EXECUTOR_QUEUED.labels()
+        self.active = DB_EXECUTOR_ACTIVE.labels()
+        self.wait = DB_EXECUTOR_WAIT.labels()
+        DB_EXECUTOR_THREADS.labels().set(max_workers)
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        self.queued.inc()
+
+        def run():
+            self.queued.dec()
+            self.wait.observe(time.perf_counter() - submitted)
+            self.active.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.active.dec()
+
+        return super().submit(run)
+
+    def run_on_each_thread(self, fn):
+        """Run fn once on every pool thread, e.g. to instrument each thread's connection"""
+        barrier = threading.Barrier(self.size)
+
+        def run():
+            fn()
+            # Holding each thread until all have run guarantees no thread runs it twice
+            barrier.wait(timeout=30)
+
+        for future in [self.submit(run) for _ in range(self.size)]:
+            future.result()
+
+
+db_executor = MonitoredExecutor(DB_EXECUTOR_SIZE)
+
+
+def database_sync_to_async(func):
+    """channels.db.database_sync_to_async, on db_executor"""
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=db_executor)
@@ -0,0 +1,171 @@
+"""
+Background dispatch for channel-layer sends triggered by REST views.
+
+Views describe what should be sent (a job) and queue it on transaction commit,
+so the response returns as soon as the write is durable and nothing is ever
+sent for a write that rolled back. Jobs are executed either in-process
+(default; see InProcessQueue for which event loop) or, with
+NOTIFICATION_DISPATCH_BACKEND = 'redis', by `manage.py dispatch_worker` reading
+a Redis stream.
+"""
+import asyncio
+import json
+import threading
+from channels.layers import get_channel_layer
+from channels_redis.core import RedisChannelLayer as BaseRedisChannelLayer
+from django.conf import settings
+from django.db import transaction
+from core.fanout import notify_users, notify_circle, send_to_groups
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+STREAM_NAME = 'notifications:dispatch'
+STREAM_GROUP = 'dispatchers'
+STREAM_MAXLEN = 100_000
+
+
+def group_send_later(group, message):
+    enqueue({'kind': 'group_send', 'group': group, 'message': message})
+
+
+def send_to_groups_later(groups, message):
+    enqueue({'kind': 'send_to_groups', 'groups': list(groups), 'message': message})
+
+
+def notify_users_later(user_ids, notification, exclude=None):
+    enqueue({'kind': 'notify_users', 'user_ids': list(user_ids), 'notification': notification, 'exclude': exclude})
+
+
+def notify_circle_later(circle_id, notification, exclude=None):
+    enqueue({'kind': 'notify_circle', 'circle_id': circle_id, 'notification': notification, 'exclude': exclude})
+
+
+def enqueue(job):
+    # Runs right away when not inside an atomic block
+    transaction.on_commit(lambda: get_queue().put(job))
+
+
+async def run_job(job):
+    kind = job.get('kind')
+    if kind == 'group_send':
+        await get_channel_layer().group_send(job['group'], job['message'])
+    elif kind == 'send_to_groups':
+        await send_to_groups(job['groups'], job['message'])
+    elif kind == 'notify_users':
+        await notify_users(job['user_ids'], job['notification'], exclude=job.get('exclude'))
+    elif kind == 'notify_circle':
+        await notify_circle(job['circle_id'], job['notification'], exclude=job.get('exclude'))
+    else:
+        log.error('dispatch.unknown_job', job=job)
+
+
+class InProcessQueue:
+    """
+    asyncio.Queue drained by one worker task.
+
+    channels_redis can be used from any event loop, so with it the worker runs
+    on a daemon thread with its own loop, away from the sockets. The in-memory
+    layer can only be used from the loop its consumers run on, so with it the
+    worker runs there: DispatchLoopMiddleware binds it to the server's loop on
+    the first ASGI call, and jobs queued before that have no consumer to reach
+    and are dropped.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.queue = None
+        self.lock = threading.Lock()
+        self.threaded = None
+
+    def uses_thread(self):
+        if self.threaded is None:
+            self.threaded = isinstance(get_channel_layer(), BaseRedisChannelLayer)
+        return self.threaded
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            ready = threading.Event()
+            thread = threading.Thread(target=self.run, args=(ready,), name='notification-dispatch', daemon=True)
+            thread.start()
+            ready.wait()
+
+    def run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.queue = asyncio.Queue()
+        self.loop = loop
+        ready.set()
+        loop.run_until_complete(self.work())
+
+    def bind(self, loop):
+        """Run the worker on loop, the one serving the consumers, unless it has its own thread"""
+        if self.loop is loop or self.uses_thread():
+            return
+        with self.lock:
+            if self.loop is not loop:
+                self.queue = asyncio.Queue()
+                loop.create_task(self.work())
+                # Jobs left on a previous loop (e.g. a finished test's) go with it
+                self.loop = loop
+
+    def put(self, job):
+        if self.uses_thread():
+            self.start()
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, job)
+        except (AttributeError, RuntimeError):
+            # No server loop yet, or it was closed: no consumer is listening
+            log.warning('dispatch.no_event_loop', kind=job.get('kind'))
+
+    async def work(self):
+        # One job at a time keeps task_update events in commit order;
+        # each job still fans out concurrently
+        queue = self.queue
+        while True:
+            job = await queue.get()
+            try:
+                await run_job(job)
+            except Exception as e:
+                log.error('dispatch.failed', kind=job.get('kind'), error=e)
+
+
+class RedisStreamQueue:
+    """Jobs go to a Redis stream and are executed by manage.py dispatch_worker"""
+
+    def connection(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def bind(self, loop):
+        pass
+
+    def put(self, job):
+        self.connection().xadd(STREAM_NAME, {'job': json.dumps(job)}, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                backend = getattr(settings, 'NOTIFICATION_DISPATCH_BACKEND', 'inprocess')
+                _queue = RedisStreamQueue() if backend == 'redis' else InProcessQueue()
+    return _queue
+
+
+class DispatchLoopMiddleware:
+    """ASGI middleware binding the in-process queue to the loop serving the application"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        get_queue().bind(asyncio.get_running_loop())
+        return await self.app(scope, receive, send)
@@ -0,0 +1,73 @@
+"""
+Notification fan-out.
+
+Every user listens on their own notifications_{id} group, so telling a circle
+about something means one group_send per member. Doing those one after the
+other costs a Redis round-trip per member; here they are issued concurrently in
+bounded batches so channels_redis can pipeline them over its connection pool,
+and fan-out latency stays roughly flat as circles grow.
+"""
+import asyncio
+from asgiref.sync import async_to_sync
+from core.db_executor import database_sync_to_async
+from channels.layers import get_channel_layer
+from core.codec import encoded_event
+from core.membership import get_member_ids
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Sends in flight at once; keeps a 10k-member circle from opening 10k sockets to Redis
+FANOUT_BATCH_SIZE = 100
+
+
+def notification_group(user_id):
+    return f'notifications_{user_id}'
+
+
+def notification_event(notification):
+    # Encoded once here; every member's socket sends the same frame
+    return encoded_event('send_notification', {'type': 'notification', 'data': notification})
+
+
+def get_circle_member_ids(circle_id):
+    return list(get_member_ids(circle_id))
+
+
+async def send_to_groups(groups, message, channel_layer=None):
+    """group_send the same message to many groups, batch by batch"""
+    channel_layer = channel_layer or get_channel_layer()
+    groups = list(dict.fromkeys(groups))
+    failed = 0
+    for start in range(0, len(groups), FANOUT_BATCH_SIZE):
+        batch = groups[start:start + FANOUT_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, message) for group in batch),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                log.error('fanout.send_failed', error=result)
+    return len(groups) - failed
+
+
+async def notify_users(user_ids, notification, exclude=None, channel_layer=None):
+    groups = [notification_group(user_id) for user_id in user_ids if user_id != exclude]
+    if not groups:
+        return 0
+    return await send_to_groups(groups, notification_event(notification), channel_layer)
+
+
+async def notify_circle(circle_id, notification, exclude=None, member_ids=None):
+    if member_ids is None:
+        member_ids = await database_sync_to_async(get_circle_member_ids)(circle_id)
+    return await notify_users(member_ids, notification, exclude=exclude)
+
+
+# Sync entry points for the REST views
+notify_users_sync = async_to_sync(notify_users)
+
+
+def notify_circle_sync(circle_id, notification, exclude=None):
+    return notify_users_sync(get_circle_member_ids(circle_id), notification, exclude=exclude)
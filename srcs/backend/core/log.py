@@ -0,0 +1,67 @@
+"""
+Structured logging for the backend.
+
+    log = get_logger(__name__)
+    if DEBUG_ENABLED:
+        log.debug('chat.frame', sample=0.01, room=room)   # about 1 in 100 kept
+    log.error('unread.cache_failed', user=user_id, error=e)
+
+Each record is written as one JSON line: ts, level, logger, event and the
+fields. A disabled level returns after one isEnabledFor check, before any
+field is formatted, but the call itself and its keyword arguments are still
+built (about 0.5µs). Debug lines on hot paths therefore check DEBUG_ENABLED
+first, which skips all of it. The level comes from LOG_LEVEL in settings.
+"""
+import json
+import logging
+import random
+from django.conf import settings
+
+# Read once at import; a module constant is the cheapest check there is
+DEBUG_ENABLED = getattr(logging, str(getattr(settings, 'LOG_LEVEL', 'INFO')).upper(), logging.INFO) <= logging.DEBUG
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StructuredLogger:
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def emit(self, level, event, fields):
+        sample = fields.pop('sample', None)
+        if sample is not None and random.random() >= sample:
+            return
+        self.logger.log(level, event, extra={'fields': fields})
+
+    # The level check comes first so a disabled call does nothing else
+    def debug(self, event, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.emit(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.emit(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.emit(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.emit(logging.ERROR, event, fields)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
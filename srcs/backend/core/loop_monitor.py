@@ -0,0 +1,108 @@
+"""
+Event loop health for Daphne.
+
+Everything a process serves runs on one asyncio loop, so a handler that blocks
+it, or a database pool with no free thread (core.db_executor), stalls every
+socket at once. This module measures both:
+
+  - a sampler task per loop sleeps LOOP_MONITOR_INTERVAL seconds and records
+    how late it wakes up (loop lag) and how many tasks are alive;
+  - watch_handler() wraps every consumer handler: one slower than
+    WS_SLOW_HANDLER is counted and logged with the chain of awaits it is stuck
+    in (captured while it still is; one that returns before the check could
+    run, because it held the loop or the loop was already behind, is logged
+    with its duration only), and one still running after WS_HANDLER_TIMEOUT is
+    cancelled so the socket can go on.
+
+All of it is exported through core.metrics; `manage.py loop_top` shows it live.
+"""
+import asyncio
+import time
+import traceback
+from contextlib import asynccontextmanager
+from django.conf import settings
+from core.log import get_logger
+from core.metrics import LOOP_LAG, LOOP_TASKS, WS_SLOW_HANDLERS, WS_HANDLER_TIMEOUTS
+
+log = get_logger(__name__)
+
+LOOP_MONITOR_INTERVAL = getattr(settings, 'LOOP_MONITOR_INTERVAL', 0.5)
+WS_SLOW_HANDLER = getattr(settings, 'WS_SLOW_HANDLER', 0.25)
+WS_HANDLER_TIMEOUT = getattr(settings, 'WS_HANDLER_TIMEOUT', 30)
+
+
+async def sample_loop():
+    lag, tasks = LOOP_LAG.labels(), LOOP_TASKS.labels()
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL)
+        lag.observe(max(time.perf_counter() - start - LOOP_MONITOR_INTERVAL, 0))
+        tasks.set(len(asyncio.all_tasks()))
+
+
+_sampler_tasks = {}
+
+
+def start_loop_monitor():
+    """One sampler per event loop (i.e. per Daphne process)"""
+    loop = asyncio.get_running_loop()
+    task = _sampler_tasks.get(loop)
+    if task is None or task.done():
+        _sampler_tasks[loop] = loop.create_task(sample_loop())
+
+
+def await_stack(task):
+    """
+    Where a suspended task is waiting, innermost last. Task.print_stack() only
+    shows the outermost coroutine; this follows what each one awaits.
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return ''.join(traceback.StackSummary.extract(frames).format())
+
+
+class HandlerWatch:
+    def __init__(self, consumer, handler):
+        self.consumer = consumer
+        self.handler = handler
+        self.task = asyncio.current_task()
+        self.start = time.perf_counter()
+        self.traced = False
+
+    def trace(self):
+        # Fires while the handler is still awaiting something: its await chain says what
+        self.traced = True
+        self.report(stack=await_stack(self.task))
+
+    def report(self, **fields):
+        WS_SLOW_HANDLERS.labels(self.consumer, self.handler).inc()
+        log.warning('ws.slow_handler', consumer=self.consumer, handler=self.handler, **fields)
+
+
+@asynccontextmanager
+async def watch_handler(consumer, handler):
+    watch = HandlerWatch(consumer, handler)
+    timer = asyncio.get_running_loop().call_later(WS_SLOW_HANDLER, watch.trace) if WS_SLOW_HANDLER else None
+    deadline = asyncio.timeout(WS_HANDLER_TIMEOUT or None)
+    try:
+        async with deadline:
+            yield
+    except TimeoutError:
+        # Only our own deadline; a TimeoutError the handler raised itself is its error
+        if not deadline.expired():
+            raise
+        WS_HANDLER_TIMEOUTS.labels(consumer, handler).inc()
+        log.error('ws.handler_timeout', consumer=consumer, handler=handler, timeout=WS_HANDLER_TIMEOUT)
+    finally:
+        if timer is not None:
+            timer.cancel()
+            elapsed = time.perf_counter() - watch.start
+            if not watch.traced and elapsed >= WS_SLOW_HANDLER:
+                # The check never got to run while the handler was waiting
+                watch.report(duration=round(elapsed, 4))
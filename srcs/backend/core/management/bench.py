@@ -0,0 +1,55 @@
+"""
+Small helpers shared by the bench_* management commands
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def format_summary(label, samples):
+    stats = summarize(samples)
+    return f"{label:<28} n={stats['count']:<6} p50={stats['p50_ms']:>9.3f}ms p99={stats['p99_ms']:>9.3f}ms max={stats['max_ms']:>9.3f}ms"
+
+
+@contextmanager
+def timer(samples):
+    start = time.perf_counter()
+    yield
+    samples.append(time.perf_counter() - start)
+
+
+def throwaway_users(prefix, count):
+    """
+    count new users under names no real account has (the benchmarks run
+    against the configured database); delete them by id afterwards
+    """
+    run = f'{prefix}_{uuid.uuid4().hex[:8]}_'
+    User.objects.bulk_create([User(username=f'{run}{i}') for i in range(count)])
+    return list(User.objects.filter(username__startswith=run).order_by('id'))
+
+
+def throwaway_tokens(users):
+    """DRF token keys of the users, in order; deleted along with them"""
+    tokens = [Token(user=user, key=Token.generate_key()) for user in users]
+    Token.objects.bulk_create(tokens)
+    return [token.key for token in tokens]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.management.bench import throwaway_tokens, throwaway_users
+from core.models import Circle, Message
+from core.message_writer import message_writer
+from core.consumers.publish import BufferedPublishMixin
+
+
+class Command(BaseCommand):
+    help = 'Chat senders on one circle in this process; report persisted messages/sec with batched and write-through persistence'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=10)
+        parser.add_argument('--messages', type=int, default=300, help='Messages per sender')
+        parser.add_argument('--window', type=int, default=20, help='Unacknowledged messages per sender')
+
+    def handle(self, *args, **options):
+        from transcendence.asgi import application
+
+        users = throwaway_users('bench_chat', options['senders'])
+        tokens = throwaway_tokens(users)
+        circle = Circle.objects.create(name='bench: chat throughput', admin=users[0])
+        circle.members.add(*users)
+
+        batch_size, in_flight = message_writer.batch_size, BufferedPublishMixin.max_unpublished
+        try:
+            # Batches of one and one message in flight per socket: every frame waits
+            # for its own transaction, like the old per-frame create
+            for label, size, window in (('write-through', 1, 1), ('batched', batch_size, in_flight)):
+                message_writer.batch_size = size
+                BufferedPublishMixin.max_unpublished = window
+                batches_before = message_writer.batches
+                sent, elapsed = asyncio.run(self.chat(application, circle.id, tokens, options))
+                batches = message_writer.batches - batches_before
+                self.stdout.write(
+                    f'{label:<14} {sent} messages in {elapsed:.2f}s: {sent / elapsed:>7.0f} msg/s, '
+                    f'{sent / max(batches, 1):.1f} messages per write'
+                )
+            stored = Message.objects.filter(circle=circle).count()
+        finally:
+            message_writer.batch_size = batch_size
+            BufferedPublishMixin.max_unpublished = in_flight
+            circle.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        expected = 2 * len(tokens) * options['messages']
+        if stored != expected:
+            raise CommandError(f'{stored} messages stored, expected {expected}')
+
+    async def chat(self, application, circle_id, tokens, options):
+        communicators = []
+        for key in tokens:
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{circle_id}/?token={key}')
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError('Connection rejected')
+            communicators.append(communicator)
+
+        async def send_all(index, communicator):
+            sent = 0
+            while sent < options['messages']:
+                window = min(options['window'], options['messages'] - sent)
+                for i in range(window):
+                    await communicator.send_json_to({'message': f'{index}:{sent + i}', 'client_id': sent + i})
+                # Everyone's broadcasts arrive in between; only our acks matter here
+                acked = 0
+                while acked < window:
+                    event = await communicator.receive_json_from(timeout=10)
+                    if event['type'] == 'message_failed':
+                        raise CommandError(f'Message {event["client_id"]} was not saved')
+                    if event['type'] == 'message_saved':
+                        acked += 1
+                sent += window
+            return sent
+
+        start = time.perf_counter()
+        counts = await asyncio.gather(*(send_all(i, c) for i, c in enumerate(communicators)))
+        elapsed = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return sum(counts), elapsed
@@ -0,0 +1,60 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from core.management.bench import throwaway_users
+from core.models import Circle, Task, ChecklistItem
+from core.serializers import TaskSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Statements and latency of a checklist edit through TaskSerializer.update, at several checklist sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--runs', type=int, default=5, help='Edits timed per size')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'items':>6} {'statements':>11} {'ms/edit':>9}")
+        try:
+            # Fixtures live only for the duration of the benchmark
+            with transaction.atomic():
+                user = throwaway_users('bench_checklist', 1)[0]
+                circle = Circle.objects.create(name='bench: checklist', admin=user)
+                for size in options['sizes']:
+                    statements, elapsed = self.measure(circle, user, size, options['runs'])
+                    self.stdout.write(f'{size:>6} {statements:>11} {elapsed * 1000:>9.1f}')
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, circle, user, size, runs):
+        task = Task.objects.create(circle=circle, title=f'{size} items', created_by=user, task_type='checklist')
+        ChecklistItem.objects.bulk_create(ChecklistItem(task=task, content=f'item {i}') for i in range(size))
+
+        statements, elapsed = 0, 0.0
+        for _ in range(runs):
+            # A typical edit: a tenth of the items reworded, a tenth ticked,
+            # a tenth removed and a tenth added; the rest sent back unchanged
+            items = [{'id': item.id, 'content': item.content, 'is_checked': item.is_checked} for item in task.checklist_items.all()]
+            random.shuffle(items)
+            tenth = max(size // 10, 1)
+            for item in items[:tenth]:
+                item['content'] += ' (edited)'
+            for item in items[tenth:2 * tenth]:
+                item['is_checked'] = not item['is_checked']
+            payload = items[:-tenth] + [{'content': f'new {i}', 'is_checked': False} for i in range(tenth)]
+
+            serializer = TaskSerializer(task, data={'checklist_items': payload}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                task = serializer.save()
+            elapsed += time.perf_counter() - start
+            statements += len(queries)
+        return statements // runs, elapsed / runs
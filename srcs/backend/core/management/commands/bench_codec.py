@@ -0,0 +1,79 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import codec
+
+
+# Representative frames: a chat message, a fresh Sudoku board, a task delta
+FRAMES = {
+    'chat_message': {
+        'type': 'chat_message', 'id': 123456, 'timestamp': '2024-01-01T12:00:00.000000+00:00',
+        'message': 'x' * 120, 'sender': {'username': 'someone', 'id': 42}, 'seq': 9876,
+    },
+    'new_game': {
+        'type': 'new_game', 'board': [[i % 10 for i in range(9)] for _ in range(9)],
+        'initial_board': [[i % 10 for i in range(9)] for _ in range(9)], 'difficulty': 'medium',
+    },
+    'task_update': {
+        'type': 'task_update', 'action': 'update', 'revision': 512, 'task_id': 77,
+        'task': {
+            'id': 77, 'title': 'Ship it', 'description': 'y' * 200, 'status': 'in_progress',
+            'checklist_items': [{'id': i, 'content': f'item {i}', 'is_checked': i % 2 == 0} for i in range(20)],
+        },
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Encode cost of one broadcast at several fan-out sizes: per recipient (stdlib json, orjson) vs once per group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--runs', type=int, default=50, help='Broadcasts timed per case')
+
+    def handle(self, *args, **options):
+        if codec.orjson is None:
+            raise CommandError('orjson is not installed')
+
+        strategies = [
+            ('json per recipient', self.per_recipient(json.dumps)),
+            ('orjson per recipient', self.per_recipient(codec.dumps)),
+            ('orjson once', self.once(lambda text: text)),
+        ]
+        if codec.msgpack is not None:
+            strategies.append(('msgpack per recipient', self.per_recipient(codec.pack)))
+            strategies.append(('msgpack once', self.once(codec.json_to_msgpack)))
+
+        self.stdout.write(f"{'frame':<13} {'recipients':>10}  {'strategy':<22} {'us/broadcast':>13} {'us/recipient':>13}")
+        for name, frame in FRAMES.items():
+            for recipients in options['recipients']:
+                for label, broadcast in strategies:
+                    elapsed = self.measure(broadcast, frame, recipients, options['runs'])
+                    self.stdout.write(
+                        f'{name:<13} {recipients:>10}  {label:<22} {elapsed * 1e6:>13.1f} {elapsed * 1e6 / recipients:>13.3f}'
+                    )
+
+    def per_recipient(self, encode):
+        # What each socket's handler did before: encode the event it received
+        def broadcast(frame, recipients):
+            for _ in range(recipients):
+                encode(frame)
+        return broadcast
+
+    def once(self, convert):
+        # encoded_event at the sender; each socket only converts through the per-process cache
+        def broadcast(frame, recipients):
+            text = codec.encoded_event('bench', frame)['text']
+            for _ in range(recipients):
+                convert(text)
+        return broadcast
+
+    def measure(self, broadcast, frame, recipients, runs):
+        broadcast(dict(frame), recipients)  # warm-up
+        codec.json_to_msgpack.cache_clear()
+        start = time.perf_counter()
+        for _ in range(runs):
+            # A fresh frame each broadcast, as a new message would be
+            broadcast(dict(frame), recipients)
+            codec.json_to_msgpack.cache_clear()
+        return (time.perf_counter() - start) / runs
@@ -0,0 +1,122 @@
+import random
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min, Q
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.models import DirectMessage
+from core.management.bench import format_summary, throwaway_users, timer
+from core.pagination import DirectMessagePagination
+from core.views import DirectMessageViewSet
+
+# Postgres seeds in one statement per batch; thread p is (lows[p], highs[p])
+SEED_SQL = """
+INSERT INTO core_directmessage (sender_id, receiver_id, user_low_id, user_high_id, content, timestamp, is_read)
+SELECT
+    CASE WHEN g %% 2 = 0 THEN k.lows[s.p] ELSE k.highs[s.p] END,
+    CASE WHEN g %% 2 = 0 THEN k.highs[s.p] ELSE k.lows[s.p] END,
+    k.lows[s.p], k.highs[s.p], 'message ' || g,
+    now() - (%(total)s - g) * interval '1 millisecond', true
+FROM (SELECT g, g %% %(threads)s + 1 AS p FROM generate_series(%(start)s, %(stop)s) g) s,
+     (SELECT %(lows)s::int[] AS lows, %(highs)s::int[] AS highs) k
+"""
+
+
+class Command(BaseCommand):
+    help = 'Seed millions of DMs over many threads and compare thread page latency: keyset on the thread index vs the old sender/receiver OR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10_000_000)
+        parser.add_argument('--threads', type=int, default=1000)
+        parser.add_argument('--pages', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--limit', type=int, default=DirectMessagePagination.default_limit)
+        parser.add_argument('--batch', type=int, default=1_000_000)
+        parser.add_argument('--keep', action='store_true', help='Do not delete the seeded users and DMs afterwards')
+
+    def handle(self, *args, **options):
+        users = throwaway_users('bench_dm', options['threads'] + 1)
+        # Every thread is between the first user and one other, so its inbox is the busiest
+        threads = [(users[0], user) for user in users[1:]]
+
+        try:
+            self.seed(threads, options['messages'], options['batch'])
+            self.run(threads, options['messages'], options['pages'], options['limit'])
+        finally:
+            if not options['keep']:
+                # Plain DELETE; the ORM would load every row to cascade to Conversation
+                with connection.cursor() as cursor:
+                    cursor.execute('DELETE FROM core_directmessage WHERE user_low_id = %s', [users[0].id])
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    def seed(self, threads, total, batch):
+        self.stdout.write(f'Seeding {total} DMs over {len(threads)} threads...')
+        lows = [min(a.id, b.id) for a, b in threads]
+        highs = [max(a.id, b.id) for a, b in threads]
+        created = 0
+        while created < total:
+            size = min(batch, total - created)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(SEED_SQL, {
+                        'total': total, 'threads': len(threads), 'start': created, 'stop': created + size - 1,
+                        'lows': lows, 'highs': highs,
+                    })
+            else:
+                DirectMessage.objects.bulk_create(
+                    (
+                        DirectMessage(
+                            sender_id=lows[i % len(threads)], receiver_id=highs[i % len(threads)],
+                            user_low_id=lows[i % len(threads)], user_high_id=highs[i % len(threads)],
+                            content=f'message {i}', is_read=True,
+                        )
+                        for i in range(created, created + size)
+                    ),
+                    batch_size=10_000,
+                )
+            created += size
+            self.stdout.write(f'  {created}/{total}')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_directmessage')
+
+    def run(self, threads, total, pages, limit):
+        factory = APIRequestFactory()
+        view = DirectMessageViewSet.as_view({'get': 'list'})
+        paginator = DirectMessagePagination()
+
+        def fetch(user, peer, **params):
+            request = factory.get('/api/direct-messages/', {'target_id': peer.id, 'limit': limit, **params})
+            force_authenticate(request, user=user)
+            response = view(request)
+            response.render()
+            return response
+
+        def legacy(user, peer):
+            # What the endpoint used to run, cut to the same page size
+            return list(DirectMessage.objects.filter(
+                Q(sender=user, receiver=peer) | Q(sender=peer, receiver=user)
+            ).select_related('sender__profile', 'receiver__profile').order_by('-timestamp', '-id')[:limit])
+
+        picks = [random.choice(threads) for _ in range(pages)]
+        # A random cursor inside each picked thread
+        cursors = []
+        for user, peer in picks:
+            thread = DirectMessage.objects.filter(user_low_id=min(user.id, peer.id), user_high_id=max(user.id, peer.id))
+            bounds = thread.aggregate(low=Min('id'), high=Max('id'))
+            row = thread.filter(id__gte=random.randint(bounds['low'], bounds['high'])).order_by('id').values_list('timestamp', 'id').first()
+            cursors.append(paginator.encode_raw(row))
+
+        newest, before, old = [], [], []
+        for user, peer in picks:
+            with timer(newest):
+                fetch(user, peer)
+        for (user, peer), cursor in zip(picks, cursors):
+            with timer(before):
+                fetch(user, peer, before=cursor)
+        for user, peer in picks:
+            with timer(old):
+                legacy(user, peer)
+
+        self.stdout.write(f'{total} DMs, {len(threads)} threads, page size {limit}')
+        self.stdout.write(format_summary('newest page', newest))
+        self.stdout.write(format_summary('before cursor (random)', before))
+        self.stdout.write(format_summary('old OR query, newest page', old))
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from core.fanout import notification_group, notification_event, notify_users
+from core.management.bench import format_summary
+
+
+class Command(BaseCommand):
+    help = 'Compare serial vs batched notification fan-out latency per chat message'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--messages', type=int, default=50, help='Messages per circle size')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['sizes'], options['messages']))
+
+    async def run(self, sizes, messages):
+        layer = get_channel_layer()
+        self.stdout.write(f'Channel layer: {layer.__class__.__name__}')
+        # Fake user ids well away from real ones
+        base = 10_000_000
+
+        for size in sizes:
+            user_ids = list(range(base, base + size))
+            # One connected socket per member, like a real circle
+            channels = []
+            for user_id in user_ids:
+                channel = await layer.new_channel()
+                await layer.group_add(notification_group(user_id), channel)
+                channels.append((user_id, channel))
+
+            notification = {'type': 'circle_message', 'sender': 'bench', 'circle_id': 0, 'message': 'x' * 64}
+            serial, batched = [], []
+            for _ in range(messages):
+                start = time.perf_counter()
+                for user_id in user_ids:
+                    await layer.group_send(notification_group(user_id), notification_event(notification))
+                serial.append(time.perf_counter() - start)
+                await self.drain(layer, channels)
+
+                start = time.perf_counter()
+                await notify_users(user_ids, notification, channel_layer=layer)
+                batched.append(time.perf_counter() - start)
+                await self.drain(layer, channels)
+
+            self.stdout.write(format_summary(f'{size} members, serial', serial))
+            self.stdout.write(format_summary(f'{size} members, batched', batched))
+
+            for user_id, channel in channels:
+                await layer.group_discard(notification_group(user_id), channel)
+
+    async def drain(self, layer, channels):
+        # Keep per-channel queues from filling up (capacity) between rounds
+        await asyncio.gather(*(layer.receive(channel) for _, channel in channels))
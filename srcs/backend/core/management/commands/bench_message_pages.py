@@ -0,0 +1,77 @@
+import random
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Min
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.models import Circle, Message
+from core.management.bench import format_summary, throwaway_users, timer
+from core.pagination import MessagePagination
+from core.views import MessageViewSet
+
+
+class Command(BaseCommand):
+    help = 'Seed a large circle and measure keyset page latency of /api/messages/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--pages', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--limit', type=int, default=MessagePagination.default_limit)
+        parser.add_argument('--batch', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='Do not delete the seeded circle and user afterwards')
+
+    def handle(self, *args, **options):
+        user = throwaway_users('bench_messages', 1)[0]
+        circle = Circle.objects.create(name='bench: message pages', admin=user)
+        circle.members.add(user)
+
+        try:
+            self.seed(circle, user, options['messages'], options['batch'])
+            self.run(circle, user, options['pages'], options['limit'])
+        finally:
+            if not options['keep']:
+                circle.delete()
+                user.delete()
+
+    def seed(self, circle, user, total, batch):
+        self.stdout.write(f'Seeding {total} messages into circle {circle.id}...')
+        created = 0
+        while created < total:
+            size = min(batch, total - created)
+            Message.objects.bulk_create(
+                Message(circle=circle, sender=user, content=f'message {created + i}') for i in range(size)
+            )
+            created += size
+
+    def run(self, circle, user, pages, limit):
+        factory = APIRequestFactory()
+        view = MessageViewSet.as_view({'get': 'list'})
+        paginator = MessagePagination()
+
+        def fetch(**params):
+            request = factory.get('/api/messages/', {'circle_id': circle.id, 'limit': limit, **params})
+            force_authenticate(request, user=user)
+            response = view(request)
+            response.render()
+            return response
+
+        # Random cursors spread over the whole history
+        messages = Message.objects.filter(circle=circle)
+        bounds = messages.aggregate(total=Count('id'), low=Min('id'), high=Max('id'))
+        total, low, high = bounds['total'], bounds['low'], bounds['high']
+        sample = messages.filter(id__in=[random.randint(low, high) for _ in range(pages)]).values_list('timestamp', 'id')
+        cursors = [paginator.encode_raw(position) for position in sample]
+
+        newest, before, after = [], [], []
+        for _ in range(pages):
+            with timer(newest):
+                fetch()
+        for cursor in cursors:
+            with timer(before):
+                fetch(before=cursor)
+        for cursor in cursors:
+            with timer(after):
+                fetch(after=cursor)
+
+        self.stdout.write(f'{total} messages, page size {limit}')
+        self.stdout.write(format_summary('newest page', newest))
+        self.stdout.write(format_summary('before cursor (random)', before))
+        self.stdout.write(format_summary('after cursor (random)', after))
@@ -0,0 +1,112 @@
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from channels.testing import WebsocketCommunicator
+from core.management.bench import throwaway_tokens, throwaway_users
+from core.models import Circle
+
+
+class Command(BaseCommand):
+    help = (
+        'Connect every user with a circle chat, a DM, the Sudoku board, notifications and presence, '
+        'once as one socket per stream and once over ws/session/; report sockets and memory per 10k users'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--concurrency', type=int, default=200, help='Users connecting at once')
+
+    def handle(self, *args, **options):
+        from transcendence.asgi import application
+
+        count = options['users']
+        users = throwaway_users('bench_session', count)
+        keys = dict(zip((user.id for user in users), throwaway_tokens(users)))
+        # bulk_create skips save(), which fills invite_code; ten characters never clash with the generated eight
+        circles = Circle.objects.bulk_create([
+            Circle(name='bench: session', admin=user, invite_code=f'B{i:09d}') for i, user in enumerate(users)
+        ])
+        Circle.members.through.objects.bulk_create([
+            Circle.members.through(circle_id=circle.id, user_id=user.id) for circle, user in zip(circles, users)
+        ])
+
+        # What one dashboard tab with the Sudoku board open subscribes to
+        tabs = [
+            (keys[user.id], [f'chat:{circle.id}', f'dm:{users[(i + 1) % count].id}', f'sudoku:{circle.id}', 'notifications', 'presence'])
+            for i, (user, circle) in enumerate(zip(users, circles))
+        ]
+        try:
+            # Warm up lazily created state (puzzle pool, stores) outside the measurement
+            asyncio.run(self.measure(application, tabs[:5], options['concurrency'], self.open_sockets))
+            asyncio.run(self.measure(application, tabs[:5], options['concurrency'], self.open_session))
+
+            self.stdout.write(f"{'':<18} {'sockets':>8} {'MB':>8} {'KB/user':>8} {'MB/10k users':>13} {'s':>6}")
+            for label, open_tab in (('socket per stream', self.open_sockets), ('ws/session/', self.open_session)):
+                sockets, used, elapsed = asyncio.run(self.measure(application, tabs, options['concurrency'], open_tab))
+                self.stdout.write(
+                    f'{label:<18} {sockets:>8} {used / 2**20:>8.1f} {used / count / 1024:>8.1f} '
+                    f'{used / count * 10_000 / 2**20:>13.1f} {elapsed:>6.1f}'
+                )
+        finally:
+            Circle.objects.filter(id__in=[circle.id for circle in circles]).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    async def measure(self, application, tabs, concurrency, open_tab):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(tab):
+            async with semaphore:
+                return await open_tab(application, *tab)
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        sockets = [s for tab_sockets in await asyncio.gather(*(connect(tab) for tab in tabs)) for s in tab_sockets]
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        for socket in sockets:
+            await socket.disconnect()
+        return len(sockets), used, elapsed
+
+    async def open_sockets(self, application, key, topics):
+        sockets = []
+        for topic in topics:
+            name, _, arg = topic.partition(':')
+            path = {
+                'chat': f'/ws/chat/{arg}/',
+                'dm': f'/ws/chat/dm/{arg}/',
+                'sudoku': f'/ws/sudoku/{arg}/',
+                'notifications': '/ws/notifications/',
+                'presence': '/ws/online/',
+            }[name]
+            communicator = WebsocketCommunicator(application, f'{path}?token={key}')
+            connected, _ = await communicator.connect(timeout=60)
+            if not connected:
+                raise CommandError(f'{path} rejected')
+            sockets.append(communicator)
+        return sockets
+
+    async def open_session(self, application, key, topics):
+        communicator = WebsocketCommunicator(application, f'/ws/session/?token={key}')
+        connected, _ = await communicator.connect(timeout=60)
+        if not connected:
+            raise CommandError('ws/session/ rejected')
+        for topic in topics:
+            await communicator.send_to(json.dumps({'type': 'subscribe', 'topic': topic}))
+        subscribed = 0
+        while subscribed < len(topics):
+            text = await communicator.receive_from(timeout=30)
+            if text.startswith('{'):
+                frame = json.loads(text)
+                if frame.get('type') != 'subscribed':
+                    raise CommandError(f'Subscription failed: {frame}')
+                subscribed += 1
+        return [communicator]
@@ -0,0 +1,82 @@
+import asyncio
+import random
+import time
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.management.bench import throwaway_tokens, throwaway_users
+from core.models import Circle, SudokuGame
+from core.sudoku.boards import board_registry
+
+
+class Command(BaseCommand):
+    help = 'Many players hammer one Sudoku board; verify no edit is lost and report DB writes/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=20)
+        parser.add_argument('--edits', type=int, default=500, help='Edits per player')
+
+    def handle(self, *args, **options):
+        from transcendence.asgi import application
+
+        players = throwaway_users('bench_sudoku', options['players'])
+        tokens = throwaway_tokens(players)
+        circle = Circle.objects.create(name='bench: sudoku', admin=players[0])
+        circle.members.add(*players)
+        empty = [[0] * 9 for _ in range(9)]
+        SudokuGame.objects.create(circle=circle, board=empty, initial_board=empty, solution=[])
+
+        try:
+            expected, elapsed, writes = asyncio.run(self.hammer(application, circle.id, tokens, options['edits']))
+            board = SudokuGame.objects.get(circle=circle).board
+        finally:
+            circle.delete()
+            User.objects.filter(id__in=[user.id for user in players]).delete()
+
+        lost = [(row, col) for (row, col), value in expected.items() if board[row][col] != value]
+        total = len(tokens) * options['edits']
+        self.stdout.write(f'{len(tokens)} players, {total} edits in {elapsed:.2f}s ({total / elapsed:.0f} edits/sec)')
+        self.stdout.write(f'DB writes: {writes} ({writes / elapsed:.1f}/sec, {total / max(writes, 1):.0f} edits per write)')
+        if lost:
+            raise CommandError(f'{len(lost)} cells lost their last edit: {lost[:10]}')
+        self.stdout.write('No edits lost')
+
+    async def hammer(self, application, circle_id, tokens, edits):
+        communicators = []
+        for key in tokens:
+            communicator = WebsocketCommunicator(application, f'/ws/sudoku/{circle_id}/?token={key}')
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError('Connection rejected')
+            await communicator.receive_json_from()  # game_state
+            communicators.append(communicator)
+
+        # Everyone edits every cell, so writes genuinely race; the last edit the
+        # server applied per cell is what must end up in the database. Edits go
+        # out in rounds (one per player, concurrently) so channel layer queues
+        # stay under their capacity instead of silently dropping broadcasts.
+        expected = {}
+        writes_before = board_registry.writes
+        listener = communicators[0]
+
+        async def edit(communicator):
+            row, col, value = random.randrange(9), random.randrange(9), random.randint(1, 9)
+            await communicator.send_json_to({'type': 'update_cell', 'row': row, 'col': col, 'value': value})
+
+        start = time.perf_counter()
+        for _ in range(edits):
+            await asyncio.gather(*(edit(c) for c in communicators))
+            # Every player sees every applied edit in server order; replay them from one player's stream
+            updates = 0
+            while updates < len(communicators):
+                event = await listener.receive_json_from(timeout=10)
+                if event['type'] == 'board_update':
+                    expected[(event['row'], event['col'])] = event['value']
+                    updates += 1
+        elapsed = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        # The last disconnect flushes the board
+        writes = board_registry.writes - writes_before
+        return expected, elapsed, writes
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.sudoku import engine
+from core.sudoku.pool import PuzzlePool
+
+
+class Command(BaseCommand):
+    help = 'Sudoku engine throughput: puzzles generated and solved per second, per difficulty, and pool latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puzzles', type=int, default=50, help='Puzzles per difficulty')
+
+    def handle(self, *args, **options):
+        count = options['puzzles']
+        for difficulty in engine.DIFFICULTIES:
+            start = time.perf_counter()
+            puzzles = [engine.generate(difficulty) for _ in range(count)]
+            generated = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for puzzle, solution in puzzles:
+                if engine.solve(puzzle) != solution:
+                    raise CommandError(f'{difficulty}: solver disagrees with the generator')
+            solved = time.perf_counter() - start
+
+            graded = sum(engine.grade(puzzle) == difficulty for puzzle, _ in puzzles)
+            self.stdout.write(
+                f'{difficulty:<6} generate {count / generated:>8.1f}/sec   solve {count / solved:>8.1f}/sec   '
+                f'graded {difficulty}: {graded}/{count}'
+            )
+
+        # new_game latency with a warm pool vs an empty one
+        pool = PuzzlePool(count)
+        for difficulty in engine.DIFFICULTIES:
+            pool.pools[difficulty].extend(engine.generate(difficulty) for _ in range(count))
+        warm = asyncio.run(self.take_all(pool, count))
+        cold = asyncio.run(self.take_all(PuzzlePool(0), count))
+        self.stdout.write(f'new_game from pool:  {warm * 1000 / count:.3f} ms')
+        self.stdout.write(f'new_game on a miss:  {cold * 1000 / count:.3f} ms')
+
+    async def take_all(self, pool, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            await pool.get('hard')
+        return time.perf_counter() - start
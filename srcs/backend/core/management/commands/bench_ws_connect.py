@@ -0,0 +1,53 @@
+import asyncio
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from channels.testing import WebsocketCommunicator
+from core.management.bench import throwaway_tokens, throwaway_users
+from core.token_cache import token_user_cache
+
+
+class Command(BaseCommand):
+    help = 'Reconnect storm: open many /ws/notifications/ sockets at once and report connects/sec, cold vs cached auth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=2_000, help='Distinct tokens; the rest are extra tabs')
+        parser.add_argument('--concurrency', type=int, default=1_000, help='Handshakes in flight at once')
+
+    def handle(self, *args, **options):
+        from transcendence.asgi import application
+
+        users = throwaway_users('bench_ws', options['users'])
+        tokens = throwaway_tokens(users)
+        keys = [tokens[i % len(tokens)] for i in range(options['connections'])]
+
+        try:
+            # Cold: every handshake resolves its token from the database, as before the cache
+            token_user_cache.clear()
+            cold = asyncio.run(self.storm(application, keys, options['concurrency'], cold=True))
+            # Warm: the storm after a deploy hits tokens this process has already seen
+            warm = asyncio.run(self.storm(application, keys, options['concurrency'], cold=False))
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(f"{len(keys)} connects over {len(tokens)} tokens")
+        self.stdout.write(f"cold (db lookup per connect): {len(keys) / cold:>10.1f} connects/sec")
+        self.stdout.write(f"warm (token cache):           {len(keys) / warm:>10.1f} connects/sec")
+
+    async def storm(self, application, keys, concurrency, cold):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(key):
+            async with semaphore:
+                if cold:
+                    token_user_cache.invalidate_token(key)
+                communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={key}')
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise RuntimeError('Connection rejected')
+                await communicator.disconnect()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect(key) for key in keys))
+        return time.perf_counter() - start
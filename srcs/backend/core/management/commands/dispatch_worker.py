@@ -0,0 +1,47 @@
+import asyncio
+import json
+import socket
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from core.dispatch import STREAM_NAME, STREAM_GROUP, run_job
+
+
+class Command(BaseCommand):
+    help = 'Execute notification dispatch jobs queued on the Redis stream (NOTIFICATION_DISPATCH_BACKEND=redis)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default=socket.gethostname(), help='Consumer name within the stream group')
+        parser.add_argument('--count', type=int, default=100, help='Jobs read per round-trip')
+        parser.add_argument('--block', type=int, default=5000, help='Milliseconds to wait for new jobs')
+
+    def handle(self, *args, **options):
+        redis = get_redis_connection('default')
+        try:
+            redis.xgroup_create(STREAM_NAME, STREAM_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.stdout.write(f"Dispatch worker '{options['name']}' reading {STREAM_NAME}")
+
+        # Start with anything this consumer read but never acknowledged (e.g. after a crash)
+        cursor = '0'
+        while True:
+            response = redis.xreadgroup(
+                STREAM_GROUP, options['name'], {STREAM_NAME: cursor},
+                count=options['count'], block=None if cursor == '0' else options['block']
+            )
+            entries = response[0][1] if response else []
+            if cursor == '0' and not entries:
+                cursor = '>'
+                continue
+
+            for entry_id, fields in entries:
+                try:
+                    loop.run_until_complete(run_job(json.loads(fields[b'job'])))
+                except Exception as e:
+                    self.stderr.write(f"Error dispatching {entry_id}: {e}")
+                redis.xack(STREAM_NAME, STREAM_GROUP, entry_id)
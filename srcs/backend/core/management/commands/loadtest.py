@@ -0,0 +1,417 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from core.management.bench import throwaway_tokens, throwaway_users
+from core.metrics import DB_QUERIES
+from core.models import Circle
+from core.sudoku.boards import board_registry
+
+SCENARIOS = ('chat', 'sudoku', 'tasks', 'presence')
+
+# Everything in this process, as in development: no Redis needed
+# (transcendence.settings_sqlite also drops Postgres)
+MEMORY_BACKENDS = {
+    # Membership and the other django_redis caches
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'core.channel_layers.InMemoryChannelLayer'}},
+    'PRESENCE_BACKEND': 'memory',
+    'REPLAY_BACKEND': 'memory',
+    'DM_UNREAD_BACKEND': 'database',
+    # On the consumers' loop, as the in-memory layer requires (core.dispatch.InProcessQueue)
+    'NOTIFICATION_DISPATCH_BACKEND': 'inprocess',
+}
+
+
+class Client:
+    def __init__(self, index, user, key, circle_id, position):
+        self.index = index
+        self.user = user
+        self.key = key
+        self.circle_id = circle_id
+        self.position = position  # among the circle's members
+
+
+class Run:
+    """Latency samples and errors of one scenario, by operation name"""
+
+    def __init__(self, operations):
+        self.operations = operations  # counted for throughput and queries per operation
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.start = self.elapsed = None
+        self.queries = 0
+
+    def record(self, operation, seconds):
+        self.samples[operation].append(seconds)
+
+    def error(self, operation):
+        self.errors[operation] += 1
+
+    def begin(self):
+        self.queries = -total_queries()
+        self.start = time.perf_counter()
+
+    def end(self):
+        self.elapsed = time.perf_counter() - self.start
+        self.queries += total_queries()
+
+    def result(self):
+        operations = sum(len(self.samples[name]) + self.errors[name] for name in self.operations)
+        return {
+            'seconds': round(self.elapsed, 3),
+            'operations': operations,
+            'throughput': round(operations / self.elapsed, 1),
+            'db_queries': self.queries,
+            'db_queries_per_operation': round(self.queries / max(operations, 1), 2),
+            'latency': {
+                name: summarize(samples, self.errors[name], self.elapsed)
+                for name, samples in sorted(self.samples.items())
+            },
+        }
+
+
+def total_queries():
+    # Every statement on every connection, counted by core.metrics
+    return sum(child.value for child in DB_QUERIES.children.values())
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples, errors, elapsed):
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0, 'errors': errors}
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'per_second': round(len(ordered) / elapsed, 1),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(percentile(ordered, .5) * 1000, 2),
+        'p99_ms': round(percentile(ordered, .99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive simulated clients against the ASGI application in this process (chat bursts, Sudoku edits, '
+        'task churn with notifications, presence storms); report throughput, p50/p99 latency and DB queries '
+        'per operation, and optionally write them as JSON to compare runs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Any of {', '.join(SCENARIOS)}; default: all")
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--circle-size', type=int, default=20, help='Clients per circle')
+        parser.add_argument('--ops', type=int, default=10, help='Operations per client and scenario')
+        parser.add_argument('--burst', type=int, default=5, help='Chat messages sent before waiting for their acks')
+        parser.add_argument('--concurrency', type=int, default=200, help='Sockets or requests opening at once')
+        parser.add_argument(
+            '--backends', choices=('memory', 'configured'), default='memory',
+            help='memory: local-memory cache, in-memory channel layer, presence and replay; configured: whatever settings say (Redis)'
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        from transcendence.asgi import application
+
+        scenarios = options['scenarios'] or SCENARIOS
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = self.read(options['compare']) if options['compare'] else None
+        override = override_settings(**MEMORY_BACKENDS) if options['backends'] == 'memory' else None
+        if override:
+            override.enable()
+        clients, circles = self.create_clients(options['clients'], options['circle_size'])
+        config = {
+            'clients': len(clients),
+            'circle_size': options['circle_size'],
+            'ops': options['ops'],
+            'burst': options['burst'],
+            'backends': options['backends'],
+            'database': connection.vendor,
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+        }
+        if baseline and baseline.get('config') != config:
+            self.stdout.write(self.style.WARNING(f"The compared run used {baseline.get('config')}"))
+        started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        results = {}
+        try:
+            for name in scenarios:
+                run = asyncio.run(self.run_scenario(name, application, clients, options))
+                results[name] = run.result()
+                self.report(name, results[name], baseline and baseline['scenarios'].get(name))
+        finally:
+            Circle.objects.filter(id__in=circles).delete()
+            User.objects.filter(id__in=[client.user.id for client in clients]).delete()
+            if override:
+                override.disable()
+
+        document = {'started': started, 'config': config, 'scenarios': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def create_clients(self, count, circle_size):
+        users = throwaway_users('loadtest', count)
+        keys = dict(zip((user.id for user in users), throwaway_tokens(users)))
+        run = uuid.uuid4().hex[:4]
+        groups = [users[i:i + circle_size] for i in range(0, len(users), circle_size)]
+        # bulk_create skips save(), which fills invite_code; ten characters never clash with the generated
+        # eight, and the run tag keeps them apart from the circles of an interrupted run
+        circles = Circle.objects.bulk_create([
+            Circle(name='loadtest', admin=members[0], invite_code=f'L{run}{i:05d}') for i, members in enumerate(groups)
+        ])
+        Circle.members.through.objects.bulk_create([
+            Circle.members.through(circle_id=circle.id, user_id=user.id)
+            for circle, members in zip(circles, groups) for user in members
+        ])
+
+        clients = []
+        for circle, members in zip(circles, groups):
+            for position, user in enumerate(members):
+                clients.append(Client(len(clients), user, keys[user.id], circle.id, position))
+        return clients, [circle.id for circle in circles]
+
+    async def run_scenario(self, name, application, clients, options):
+        try:
+            return await getattr(self, f'scenario_{name}')(application, clients, options)
+        finally:
+            # Every board was released, but its lock is bound to this run's event loop
+            board_registry.locks.clear()
+
+    async def connect_all(self, application, clients, path, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(client):
+            async with semaphore:
+                communicator = WebsocketCommunicator(application, path(client))
+                connected, _ = await communicator.connect(timeout=60)
+                if not connected:
+                    raise CommandError(f'{path(client)}: connection rejected')
+                return communicator
+
+        return await asyncio.gather(*(connect(client) for client in clients))
+
+    async def disconnect_all(self, sockets):
+        await asyncio.gather(*(socket.disconnect(timeout=60) for socket in sockets))
+
+    async def scenario_chat(self, application, clients, options):
+        """Every member of every circle sends bursts of messages; time the ack and the broadcast back"""
+        run = Run(('chat.send',))
+        sockets = await self.connect_all(
+            application, clients, lambda c: f'/ws/chat/{c.circle_id}/?token={c.key}', options['concurrency']
+        )
+
+        async def chat(client, socket):
+            acks, echoes = {}, {}
+            for first in range(0, options['ops'], options['burst']):
+                for i in range(first, min(first + options['burst'], options['ops'])):
+                    text = f'loadtest {client.index}:{i}'
+                    acks[i] = echoes[text] = time.perf_counter()
+                    await socket.send_json_to({'message': text, 'client_id': i})
+                # Everyone's broadcasts arrive in between; only our own are timed
+                while acks or echoes:
+                    frame = await socket.receive_json_from(timeout=60)
+                    kind = frame.get('type')
+                    if kind == 'message_saved' and frame['client_id'] in acks:
+                        run.record('chat.send', time.perf_counter() - acks.pop(frame['client_id']))
+                    elif kind == 'message_failed' and frame['client_id'] in acks:
+                        acks.pop(frame['client_id'])
+                        run.error('chat.send')
+                        echoes.pop(f'loadtest {client.index}:{frame["client_id"]}', None)
+                    elif kind == 'chat_message' and frame.get('message') in echoes:
+                        run.record('chat.broadcast', time.perf_counter() - echoes.pop(frame['message']))
+
+        run.begin()
+        await asyncio.gather(*(chat(client, socket) for client, socket in zip(clients, sockets)))
+        run.end()
+        await self.disconnect_all(sockets)
+        return run
+
+    async def scenario_sudoku(self, application, clients, options):
+        """Every player edits (and clears) a cell of the circle's board; time until their edit is broadcast"""
+        run = Run(('sudoku.edit',))
+        sockets = await self.connect_all(
+            application, clients, lambda c: f'/ws/sudoku/{c.circle_id}/?token={c.key}', options['concurrency']
+        )
+
+        async def game_started(socket):
+            # Not the game_state of an earlier run's board, sent on connect
+            while True:
+                frame = await socket.receive_json_from(timeout=60)
+                if frame.get('type') == 'new_game':
+                    return frame['initial_board']
+
+        # One new game per circle, started by its first member
+        for client, socket in zip(clients, sockets):
+            if client.position == 0:
+                await socket.send_json_to({'type': 'new_game', 'difficulty': 'easy'})
+        boards = await asyncio.gather(*(game_started(socket) for socket in sockets))
+
+        async def play(client, socket, initial):
+            empty = [(row, col) for row in range(9) for col in range(9) if not initial[row][col]]
+            row, col = empty[client.position % len(empty)]
+            for i in range(options['ops']):
+                # Set, then clear: the board is never solved, so every edit is applied
+                value = (i // 2) % 9 + 1 if i % 2 == 0 else 0
+                sent = time.perf_counter()
+                await socket.send_json_to({'type': 'update_cell', 'row': row, 'col': col, 'value': value})
+                while True:
+                    frame = await socket.receive_json_from(timeout=60)
+                    if (frame.get('type') == 'board_update' and frame['sender_id'] == client.user.id
+                            and (frame['row'], frame['col'], frame['value']) == (row, col, value)):
+                        run.record('sudoku.edit', time.perf_counter() - sent)
+                        break
+
+        run.begin()
+        await asyncio.gather(*(play(c, s, board) for c, s, board in zip(clients, sockets, boards)))
+        run.end()
+        await self.disconnect_all(sockets)
+        return run
+
+    async def scenario_tasks(self, application, clients, options):
+        """
+        Every member creates a note, completes it and deletes it over REST while
+        the whole circle listens on ws/notifications/; time each request and how
+        long until the first other member is notified.
+        """
+        run = Run(('tasks.create', 'tasks.update', 'tasks.delete'))
+        sockets = await self.connect_all(
+            application, clients, lambda c: f'/ws/notifications/?token={c.key}', options['concurrency']
+        )
+        notified = {}  # (notification type, task id) -> first arrival
+
+        async def listen(socket):
+            while True:
+                frame = await socket.receive_json_from(timeout=3600)
+                data = frame.get('data') or {}
+                notified.setdefault((data.get('type'), data.get('task_id')), time.perf_counter())
+
+        listeners = [asyncio.create_task(listen(socket)) for socket in sockets]
+        # Django runs every request on its own thread and connection; SQLite would time them out on its write lock
+        semaphore = asyncio.Semaphore(1 if connection.vendor == 'sqlite' else options['concurrency'])
+        sent = {}  # (notification type, task id) -> request start
+        host = next((h for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost').lstrip('.')
+
+        async def request(client, operation, method, path, body=None):
+            payload = json.dumps(body).encode() if body is not None else b''
+            headers = [
+                (b'host', host.encode()),
+                (b'authorization', f'Token {client.key}'.encode()),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode()),
+            ]
+            async with semaphore:
+                start = time.perf_counter()
+                communicator = HttpCommunicator(application, method, path, payload, headers)
+                response = await communicator.get_response(timeout=60)
+                await communicator.wait()
+            if response['status'] >= 400:
+                run.error(operation)
+                return start, None
+            run.record(operation, time.perf_counter() - start)
+            return start, json.loads(response['body']) if response['body'] else {}
+
+        async def churn(client):
+            for i in range(options['ops']):
+                start, task = await request(client, 'tasks.create', 'POST', '/api/tasks/', {
+                    'title': f'loadtest {client.index}:{i}', 'task_type': 'note', 'circle_id': client.circle_id,
+                })
+                if task is None:
+                    continue
+                sent[('note_created', task['id'])] = start
+                start, updated = await request(
+                    client, 'tasks.update', 'PATCH', f"/api/tasks/{task['id']}/", {'status': 'done'}
+                )
+                if updated is not None:
+                    sent[('task_completed', task['id'])] = start
+                await request(client, 'tasks.delete', 'DELETE', f"/api/tasks/{task['id']}/")
+
+        run.begin()
+        await asyncio.gather(*(churn(client) for client in clients))
+        # Notifications are dispatched after commit; give the last ones a moment
+        for _ in range(50):
+            if all(key in notified for key in sent):
+                break
+            await asyncio.sleep(0.1)
+        run.end()
+        for key, start in sent.items():
+            if key in notified:
+                run.record('tasks.notify', notified[key] - start)
+            elif options['circle_size'] > 1:
+                run.error('tasks.notify')
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await self.disconnect_all(sockets)
+        return run
+
+    async def scenario_presence(self, application, clients, options):
+        """Everyone reconnects to ws/online/ over and over; time connect-to-initial-state and disconnect"""
+        run = Run(('presence.connect',))
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def reconnect(client):
+            for _ in range(options['ops']):
+                async with semaphore:
+                    start = time.perf_counter()
+                    socket = WebsocketCommunicator(application, f'/ws/online/?token={client.key}')
+                    connected, _ = await socket.connect(timeout=60)
+                    if not connected:
+                        run.error('presence.connect')
+                        continue
+                    # Other members' status changes may come first
+                    while (await socket.receive_json_from(timeout=60)).get('type') != 'initial_state':
+                        pass
+                    run.record('presence.connect', time.perf_counter() - start)
+                    start = time.perf_counter()
+                    await socket.disconnect(timeout=60)
+                    run.record('presence.disconnect', time.perf_counter() - start)
+
+        run.begin()
+        await asyncio.gather(*(reconnect(client) for client in clients))
+        run.end()
+        return run
+
+    def report(self, name, result, baseline=None):
+        self.stdout.write(
+            f"{name}: {result['operations']} operations in {result['seconds']}s, "
+            f"{result['throughput']:.0f}/s, {result['db_queries_per_operation']} DB queries per operation"
+            + (f" (was {baseline['throughput']:.0f}/s, {baseline['db_queries_per_operation']})" if baseline else '')
+        )
+        self.stdout.write(f"  {'':<20} {'count':>7} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for operation, latency in result['latency'].items():
+            if not latency['count']:
+                self.stdout.write(f"  {operation:<20} {0:>7} {latency['errors']:>6}")
+                continue
+            line = (
+                f"  {operation:<20} {latency['count']:>7} {latency['errors']:>6} "
+                f"{latency['p50_ms']:>8} {latency['p99_ms']:>8} {latency['max_ms']:>8}"
+            )
+            before = baseline and baseline['latency'].get(operation)
+            if before and before.get('count'):
+                change = (latency['p99_ms'] - before['p99_ms']) / max(before['p99_ms'], 0.01) * 100
+                line += f"  p99 {change:+.0f}% vs {before['p99_ms']}"
+            self.stdout.write(line)
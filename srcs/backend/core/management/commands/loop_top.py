@@ -0,0 +1,121 @@
+import re
+import time
+from collections import defaultdict
+from urllib.request import Request, urlopen
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """{(name, ((label, value), ...)): float} of a /metrics body"""
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, tuple(LABEL.findall(labels or '')))] = float(value)
+    return samples
+
+
+def delta(now, before):
+    return {key: value - before.get(key, 0) for key, value in now.items()}
+
+
+def quantile(samples, name, q, match=()):
+    """Upper bound of the bucket holding the q-quantile of histogram `name`"""
+    buckets = sorted(
+        (float(dict(labels)['le']), value)
+        for (n, labels), value in samples.items()
+        if n == f'{name}_bucket' and set(match) <= set(labels)
+    )
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    target = q * buckets[-1][1]
+    return next(bound for bound, count in buckets if count >= target)
+
+
+def ms(seconds):
+    if seconds is None:
+        return '-'
+    return '>10s' if seconds == float('inf') else f'{seconds * 1000:.1f}ms'
+
+
+class Command(BaseCommand):
+    help = 'Live view of event loop lag, the database thread pool and the slowest consumer handlers, read from /metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/metrics')
+        parser.add_argument('--token', default=settings.METRICS_TOKEN, help='METRICS_TOKEN of the scraped process')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between scrapes')
+        parser.add_argument('--top', type=int, default=10, help='Handlers listed')
+        parser.add_argument('--once', action='store_true', help='Print one interval and exit')
+
+    def scrape(self, url, token):
+        request = Request(url, headers={'Authorization': f'Bearer {token}'} if token else {})
+        try:
+            with urlopen(request, timeout=5) as response:
+                return parse(response.read().decode())
+        except OSError as e:
+            raise CommandError(f'Could not read {url}: {e}')
+
+    def handle(self, *args, **options):
+        before = self.scrape(options['url'], options['token'])
+        while True:
+            time.sleep(options['interval'])
+            now = self.scrape(options['url'], options['token'])
+            if not options['once']:
+                self.stdout.write('\033[2J\033[H', ending='')
+            self.report(now, delta(now, before), options['interval'], options['top'])
+            if options['once']:
+                return
+            before = now
+
+    def report(self, now, diff, interval, top):
+        gauge = lambda name: sum(value for (n, _), value in now.items() if n == name)
+        # Lag over the interval if the loop was sampled in it, else since start
+        lag = diff if diff.get(('asyncio_loop_lag_seconds_count', ()), 0) > 0 else now
+        self.stdout.write(
+            f'event loop  lag p50 {ms(quantile(lag, "asyncio_loop_lag_seconds", .5))}'
+            f'  p99 {ms(quantile(lag, "asyncio_loop_lag_seconds", .99))}'
+            f'  tasks {gauge("asyncio_tasks"):.0f}'
+        )
+        wait = diff if diff.get(('db_executor_wait_seconds_count', ()), 0) > 0 else now
+        self.stdout.write(
+            f'db pool     threads {gauge("db_executor_threads"):.0f}  active {gauge("db_executor_active"):.0f}'
+            f'  queued {gauge("db_executor_queued"):.0f}'
+            f'  wait p99 {ms(quantile(wait, "db_executor_wait_seconds", .99))}'
+            f'  calls/s {diff.get(("db_executor_wait_seconds_count", ()), 0) / interval:.0f}'
+        )
+        frames_in = sum(v for (n, _), v in diff.items() if n == 'ws_frames_received_total')
+        frames_out = sum(v for (n, _), v in diff.items() if n == 'ws_frames_sent_total')
+        self.stdout.write(f'frames/s    in {frames_in / interval:.0f}  out {frames_out / interval:.0f}')
+
+        sockets = defaultdict(float)
+        for (n, labels), value in now.items():
+            if n == 'ws_open_connections':
+                labels = dict(labels)
+                sockets[f'{labels["consumer"]} ({labels["transport"]})'] += value
+        self.stdout.write('\nopen sockets')
+        for name, value in sorted(sockets.items(), key=lambda item: -item[1]):
+            if value:
+                self.stdout.write(f'  {value:8.0f}  {name}')
+
+        handlers = []
+        for (n, labels), count in diff.items():
+            if n != 'ws_handler_duration_seconds_count' or count <= 0:
+                continue
+            total = diff.get(('ws_handler_duration_seconds_sum', labels), 0)
+            slow = diff.get(('ws_slow_handlers_total', labels), 0)
+            timeouts = diff.get(('ws_handler_timeouts_total', labels), 0)
+            p99 = quantile(diff, 'ws_handler_duration_seconds', .99, labels)
+            handlers.append((total / count, count, p99, slow, timeouts, dict(labels)))
+        handlers.sort(key=lambda handler: -handler[0])
+        self.stdout.write(f'\n{"mean":>9} {"p99":>9} {"calls/s":>8} {"slow":>5} {"t/o":>4}  handler')
+        for mean, count, p99, slow, timeouts, labels in handlers[:top]:
+            self.stdout.write(
+                f'{ms(mean):>9} {ms(p99):>9} {count / interval:8.1f} {slow:5.0f} {timeouts:4.0f}'
+                f'  {labels["consumer"]}.{labels["handler"]}'
+            )
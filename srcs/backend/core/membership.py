@@ -0,0 +1,59 @@
+"""
+Circle membership index.
+
+The member IDs of a circle are cached as one set per circle in the Django cache
+(Redis in production, so every Daphne/Gunicorn process shares it). Membership
+tests and member lists read that set instead of loading member rows; the
+m2m_changed and delete handlers in core.signals drop a circle's entry whenever
+its members change, and tell the sockets of anyone who lost access to close.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from core.models import Circle
+
+CIRCLE_MEMBERS_CACHE_TTL = getattr(settings, 'CIRCLE_MEMBERS_CACHE_TTL', 3600)
+
+
+def members_key(circle_id):
+    return f'circle_members:{circle_id}'
+
+
+def chat_group(circle_id):
+    """Joined by the circle's chat sockets; task events and member changes go here too"""
+    return f'chat_{circle_id}'
+
+
+def access_group(circle_id, user_id):
+    """Joined by a user's sockets on a circle; receives membership_revoked"""
+    return f'access_{circle_id}_{user_id}'
+
+
+def get_member_ids(circle_id):
+    """frozenset of the circle's member IDs (empty for an unknown circle)"""
+    key = members_key(circle_id)
+    member_ids = cache.get(key)
+    if member_ids is None:
+        member_ids = frozenset(
+            Circle.members.through.objects.filter(circle_id=circle_id).values_list('user_id', flat=True)
+        )
+        cache.set(key, member_ids, CIRCLE_MEMBERS_CACHE_TTL)
+    return member_ids
+
+
+def is_member(user_id, circle_id):
+    try:
+        circle_id = int(circle_id)
+    except (TypeError, ValueError):
+        return False
+    return user_id in get_member_ids(circle_id)
+
+
+def invalidate(circle_ids):
+    keys = [members_key(circle_id) for circle_id in circle_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # A request that read the old rows before our commit may have cached them
+    # again in the meantime; drop the entry once more when the change is visible
+    transaction.on_commit(lambda: cache.delete_many(keys))
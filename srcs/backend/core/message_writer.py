@@ -0,0 +1,109 @@
+"""
+Buffered persistence for chat and DM messages.
+
+Consumers hand their Message / DirectMessage instances to message_writer.submit()
+instead of creating them one by one. Messages arriving from all sockets of the
+process are collected and written with one bulk_create per model (plus one
+conversation UPDATE per DM thread) in a single transaction, either every
+MESSAGE_FLUSH_INTERVAL ms or as soon as MESSAGE_FLUSH_BATCH are waiting. The
+future returned by submit() resolves once the batch has committed, with the id
+and timestamp filled in, so the consumer can acknowledge persistence to the
+sender (see core.consumers.publish).
+
+A burst of N frames thus costs a handful of thread-pool hops and statements
+instead of N of each. If a batch fails (say a circle was deleted meanwhile),
+its messages are retried one by one so only the bad ones are rejected.
+"""
+import asyncio
+from core.db_executor import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from core.conversations import record_messages
+from core.models import DirectMessage, Message
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+MESSAGE_FLUSH_INTERVAL = getattr(settings, 'MESSAGE_FLUSH_INTERVAL', 5)
+MESSAGE_FLUSH_BATCH = getattr(settings, 'MESSAGE_FLUSH_BATCH', 200)
+
+
+class MessageWriter:
+    def __init__(self, flush_interval_ms, batch_size):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.pending = []      # (message, future) in arrival order
+        self.full = None       # set when a whole batch is waiting
+        self.flusher = None
+        self.batches = 0       # bulk writes issued, for load tests
+
+    def submit(self, message):
+        """Queue a Message or DirectMessage; the future resolves to it once committed"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        self.start_flusher()
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+        return future
+
+    def start_flusher(self):
+        if self.flusher is None or self.flusher.done():
+            self.full = asyncio.Event()
+            self.flusher = asyncio.get_running_loop().create_task(self.run_flusher())
+
+    async def run_flusher(self):
+        while self.pending:
+            if len(self.pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.full.clear()
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        messages = [message for message, _ in batch]
+        try:
+            await database_sync_to_async(self.write)(messages)
+            self.batches += 1
+            results = [None] * len(batch)
+        except Exception as e:
+            log.warning('writer.batch_failed', messages=len(batch), error=e)
+            results = await database_sync_to_async(self.write_each)(messages)
+
+        for (message, future), error in zip(batch, results):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(message)
+            else:
+                future.set_exception(error)
+
+    @transaction.atomic
+    def write(self, messages):
+        chat = [message for message in messages if isinstance(message, Message)]
+        direct = [message for message in messages if isinstance(message, DirectMessage)]
+        if chat:
+            Message.objects.bulk_create(chat)
+        if direct:
+            for message in direct:
+                message.fill_thread_key()
+            DirectMessage.objects.bulk_create(direct)
+            record_messages(direct)
+
+    def write_each(self, messages):
+        errors = []
+        for message in messages:
+            try:
+                # A failed bulk_create may have assigned ids on some backends
+                message.pk = None
+                self.write([message])
+                errors.append(None)
+            except Exception as e:
+                log.error('writer.write_failed', user=message.sender_id, error=e)
+                errors.append(e)
+        return errors
+
+
+message_writer = MessageWriter(MESSAGE_FLUSH_INTERVAL, MESSAGE_FLUSH_BATCH)
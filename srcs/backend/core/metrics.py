@@ -0,0 +1,230 @@
+"""
+Process metrics in the Prometheus text format, served at /metrics to the
+internal network or to scrapers holding METRICS_TOKEN (see scrape_allowed).
+
+Counters, gauges and histograms live in this process's memory (Daphne serves
+both REST and WebSocket traffic, so one scrape covers both); updating one is a
+dict lookup and a short lock. What is measured:
+
+  http_request_duration_seconds   per DRF view (URL name), method and status
+  http_request_db_queries         statements per request, per view
+  db_queries_total, db_query_duration_seconds
+                                  every statement, REST and consumers alike
+  ws_open_connections             per consumer, for plain sockets and ws/session/ topics
+  ws_frames_received_total, ws_frames_sent_total, ws_handler_duration_seconds
+                                  per consumer (and handler)
+  channel_layer_group_send_seconds
+                                  per event type, see core.channel_layers
+  ws_slow_handlers_total, ws_handler_timeouts_total,
+  asyncio_loop_lag_seconds, asyncio_tasks, db_executor_*
+                                  see core.loop_monitor and core.db_executor
+"""
+import hmac
+import ipaddress
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self.children.items()):
+            lines.extend(self.render_child(values, child))
+        return lines
+
+
+class Value:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def new_child(self):
+        return Value()
+
+    def render_child(self, values, child):
+        return [f'{self.name}{format_labels(self.label_names, values)} {child.value}']
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def render_child(self, values, child):
+        with child.lock:
+            counts, count, total = list(child.counts), child.count, child.sum
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{format_labels(self.label_names, values, [("le", bound)])} {cumulative}')
+        lines.append(f'{self.name}_bucket{format_labels(self.label_names, values, [("le", "+Inf")])} {count}')
+        lines.append(f'{self.name}_sum{format_labels(self.label_names, values)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.label_names, values)} {count}')
+        return lines
+
+
+REGISTRY = []
+
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'REST request latency', ('view', 'method', 'status')
+)
+HTTP_QUERIES = Histogram(
+    'http_request_db_queries', 'Database statements per REST request', ('view',), buckets=COUNT_BUCKETS
+)
+DB_QUERIES = Counter('db_queries_total', 'Database statements executed', ('alias',))
+DB_LATENCY = Histogram('db_query_duration_seconds', 'Database statement latency', ('alias',))
+WS_OPEN = Gauge('ws_open_connections', 'Open WebSocket connections', ('consumer', 'transport'))
+WS_FRAMES_IN = Counter('ws_frames_received_total', 'WebSocket frames received', ('consumer',))
+WS_FRAMES_OUT = Counter('ws_frames_sent_total', 'WebSocket frames sent', ('consumer',))
+WS_HANDLER_LATENCY = Histogram(
+    'ws_handler_duration_seconds', 'Consumer handler latency', ('consumer', 'handler')
+)
+GROUP_SEND_LATENCY = Histogram(
+    'channel_layer_group_send_seconds', 'Channel layer group_send latency', ('event',)
+)
+WS_SLOW_HANDLERS = Counter(
+    'ws_slow_handlers_total', 'Handlers slower than WS_SLOW_HANDLER', ('consumer', 'handler')
+)
+WS_HANDLER_TIMEOUTS = Counter(
+    'ws_handler_timeouts_total', 'Handlers cancelled after WS_HANDLER_TIMEOUT', ('consumer', 'handler')
+)
+LOOP_LAG = Histogram('asyncio_loop_lag_seconds', 'Event loop lag: how late a sleep wakes up')
+LOOP_TASKS = Gauge('asyncio_tasks', 'Tasks alive on the event loop')
+DB_EXECUTOR_THREADS = Gauge('db_executor_threads', 'Size of the database thread pool')
+DB_EXECUTOR_ACTIVE = Gauge('db_executor_active', 'Database calls running on the pool')
+DB_EXECUTOR_QUEUED = Gauge('db_executor_queued', 'Database calls waiting for a pool thread')
+DB_EXECUTOR_WAIT = Histogram('db_executor_wait_seconds', 'Time a database call waits for a pool thread')
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+
+def scrape_allowed(request):
+    """
+    With METRICS_TOKEN set, only scrapers presenting it. Without one, only
+    direct requests from loopback or private addresses: Caddy does not route
+    /metrics, but Daphne's port may still be reachable from elsewhere.
+    """
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    if 'X-Forwarded-For' in request.headers:
+        # Relayed by a proxy, so the client is somewhere else
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR') or '')
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Statements run by the current REST request; set by MetricsMiddleware
+request_queries = ContextVar('request_queries', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        alias = context['connection'].alias
+        DB_QUERIES.labels(alias).inc()
+        DB_LATENCY.labels(alias).observe(time.perf_counter() - start)
+        counter = request_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # The wrapper list outlives reconnects, so only add ours once
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+connection_created.connect(install_query_counter)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_remove_task_assigned_to_task_assignees'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['circle', 'timestamp', 'id'], name='message_circle_ts_id_idx'),
+        ),
+    ]
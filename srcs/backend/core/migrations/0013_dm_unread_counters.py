@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:09
+
+from django.db import migrations, models
+
+
+def mark_existing_read(apps, schema_editor):
+    # Nothing ever set is_read before counters existed; start everyone at zero
+    # instead of showing the whole history as unread
+    apps.get_model('core', 'DirectMessage').objects.filter(is_read=False).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_task_revisions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(fields=['receiver', 'sender', 'is_read'], name='dm_receiver_sender_read_idx'),
+        ),
+        migrations.RunPython(mark_existing_read, migrations.RunPython.noop),
+    ]
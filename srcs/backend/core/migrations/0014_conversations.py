@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def build_conversations(apps, schema_editor):
+    # One row per pair that has exchanged DMs, with each side's unread count
+    DirectMessage = apps.get_model('core', 'DirectMessage')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    last_ids = {}
+    for row in DirectMessage.objects.values('sender_id', 'receiver_id').annotate(last_id=Max('id')):
+        pair = tuple(sorted((row['sender_id'], row['receiver_id'])))
+        last_ids[pair] = max(last_ids.get(pair, 0), row['last_id'])
+    last_messages = DirectMessage.objects.in_bulk(list(last_ids.values()))
+    unread = {
+        (row['receiver_id'], row['sender_id']): row['count']
+        for row in DirectMessage.objects.filter(is_read=False).values('receiver_id', 'sender_id').annotate(count=Count('id'))
+    }
+
+    Conversation.objects.bulk_create([
+        Conversation(
+            user_low_id=low, user_high_id=high,
+            last_message_id=last_id, last_message_at=last_messages[last_id].timestamp,
+            unread_low=unread.get((low, high), 0), unread_high=unread.get((high, low), 0),
+        )
+        for (low, high), last_id in last_ids.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0013_dm_unread_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField()),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.directmessage')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_low', '-last_message_at', '-id'], name='conversation_low_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_high', '-last_message_at', '-id'], name='conversation_high_inbox_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_pair_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(check=models.Q(('user_low__lte', models.F('user_high'))), name='conversation_pair_ordered'),
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Greatest, Least
+import django.db.models.deletion
+
+
+def fill_thread_key(apps, schema_editor):
+    apps.get_model('core', 'DirectMessage').objects.update(
+        user_low=Least('sender_id', 'receiver_id'), user_high=Greatest('sender_id', 'receiver_id')
+    )
+
+
+# Filled here and made required in 0016: Postgres refuses to alter a table that
+# still has deferred FK checks pending from the UPDATE in the same transaction
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0014_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='user_low',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='directmessage',
+            name='user_high',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_thread_key, migrations.RunPython.noop),
+    ]
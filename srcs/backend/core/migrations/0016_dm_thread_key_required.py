@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0015_dm_thread_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='directmessage',
+            name='user_low',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='directmessage',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(fields=['user_low', 'user_high', 'timestamp', 'id'], name='dm_thread_ts_id_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
-from django.db import models
+from django.db import connection, models
+from django.db.models import F
 from django.contrib.auth.models import User
 
 class Circle(models.Model):
@@ -9,11 +10,19 @@ class Circle(models.Model):
     admin = models.ForeignKey(User, related_name='managed_circles', on_delete=models.CASCADE, null=True, blank=True)
     members = models.ManyToManyField(User, related_name='circles')
     invite_code = models.CharField(max_length=10, unique=True, blank=True)
+    # Bumped on every task change in the circle; clients catch up with ?since_rev=
+    task_revision = models.BigIntegerField(default=0)
     
     def save(self, *args, **kwargs):
         if not self.invite_code:
             self.invite_code = str(uuid.uuid4())[:8].upper()
         super().save(*args, **kwargs)
+
+    @staticmethod
+    def next_task_revision(circle_id):
+        # The UPDATE row-locks the circle until commit, so revisions are handed out in order
+        Circle.objects.filter(id=circle_id).update(task_revision=F('task_revision') + 1)
+        return Circle.objects.filter(id=circle_id).values_list('task_revision', flat=True).get()
     
     def __str__(self):
         return self.name
@@ -39,15 +48,64 @@ class Task(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='todo')
     task_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='assignment')
     created_at = models.DateTimeField(auto_now_add=True)
+    revision = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['circle', 'revision'], name='task_circle_revision_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+class TaskTombstone(models.Model):
+    """Remembers deleted tasks so ?since_rev= can report them"""
+    circle = models.ForeignKey(Circle, related_name='task_tombstones', on_delete=models.CASCADE)
+    task_id = models.BigIntegerField()
+    revision = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['circle', 'revision'], name='tombstone_circle_revision_idx'),
+        ]
+
 class ChecklistItem(models.Model):
     task = models.ForeignKey(Task, related_name='checklist_items', on_delete=models.CASCADE)
     content = models.CharField(max_length=255)
     is_checked = models.BooleanField(default=False)
 
+    @staticmethod
+    def toggle(task_id, item_ids, user_id, is_checked=None):
+        """
+        Flip the given items of a task (or set them to is_checked) in one
+        conditional UPDATE, provided user_id is a member of the task's circle.
+        The database does the flip under the row lock, so concurrent clicks are
+        never lost. Returns (id, content, is_checked, circle_id) per changed row.
+        """
+        if not item_ids:
+            return []
+        items, tasks = ChecklistItem._meta.db_table, Task._meta.db_table
+        members = Circle.members.through._meta.db_table
+        # Parameters in the order their placeholders appear
+        if is_checked is None:
+            assignment, condition = 'NOT is_checked', ''
+            params = [task_id, *item_ids, user_id]
+        else:
+            assignment, condition = '%s', 'AND is_checked <> %s'
+            params = [is_checked, task_id, *item_ids, is_checked, user_id]
+        sql = f"""
+            UPDATE {items} SET is_checked = {assignment}
+            WHERE task_id = %s AND id IN ({', '.join(['%s'] * len(item_ids))}) {condition}
+              AND task_id IN (
+                  SELECT t.id FROM {tasks} t JOIN {members} m ON m.circle_id = t.circle_id WHERE m.user_id = %s
+              )
+            RETURNING id, content, is_checked, (SELECT circle_id FROM {tasks} WHERE {tasks}.id = {items}.task_id)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(row[0], row[1], bool(row[2]), row[3]) for row in cursor.fetchall()]
+
     def __str__(self):
         return self.content
 
@@ -59,6 +117,10 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination walks (circle, timestamp, id) in either direction
+            models.Index(fields=['circle', 'timestamp', 'id'], name='message_circle_ts_id_idx'),
+        ]
 
 
 class UserProfile(models.Model):
@@ -77,9 +139,58 @@ class DirectMessage(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Thread key: the two users in ID order, whichever of them sent the message.
+    # user_low is covered by dm_thread_ts_id_idx, so it needs no index of its own
+    user_low = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE, db_index=False)
+    user_high = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Marking a conversation read touches only its unread rows
+            models.Index(fields=['receiver', 'sender', 'is_read'], name='dm_receiver_sender_read_idx'),
+            # A thread page is one range scan, in either direction
+            models.Index(fields=['user_low', 'user_high', 'timestamp', 'id'], name='dm_thread_ts_id_idx'),
+        ]
+
+    def fill_thread_key(self):
+        # bulk_create skips save(), so batch writers call this themselves
+        if self.user_low_id is None or self.user_high_id is None:
+            self.user_low_id, self.user_high_id = sorted((self.sender_id, self.receiver_id))
+
+    def save(self, *args, **kwargs):
+        self.fill_thread_key()
+        super().save(*args, **kwargs)
+
+
+class Conversation(models.Model):
+    # One row per pair of users (user_low <= user_high, like the dm_<a>_<b> groups),
+    # written in the same transaction as each of their messages
+    user_low = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(DirectMessage, related_name='+', null=True, on_delete=models.SET_NULL)
+    last_message_at = models.DateTimeField()
+    unread_low = models.PositiveIntegerField(default=0)  # unread by user_low
+    unread_high = models.PositiveIntegerField(default=0)  # unread by user_high
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='conversation_pair_uniq'),
+            models.CheckConstraint(check=models.Q(user_low__lte=F('user_high')), name='conversation_pair_ordered'),
+        ]
+        indexes = [
+            # A user's inbox page is merged from one range scan per side, newest first
+            models.Index(fields=['user_low', '-last_message_at', '-id'], name='conversation_low_inbox_idx'),
+            models.Index(fields=['user_high', '-last_message_at', '-id'], name='conversation_high_inbox_idx'),
+        ]
+
+    @staticmethod
+    def pair(a, b):
+        return (a, b) if a < b else (b, a)
+
+    def unread_for(self, user_id):
+        return self.unread_low if user_id == self.user_low_id else self.unread_high
+
 
 class SudokuGame(models.Model):
     circle = models.OneToOneField(Circle, related_name='sudoku_game', on_delete=models.CASCADE)
@@ -0,0 +1,124 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a (timestamp, id) key.
+
+    ?limit=N            -> newest N rows
+    ?before=<cursor>    -> N rows older than the cursor
+    ?after=<cursor>     -> N rows newer than the cursor
+
+    Every page is a bounded index range scan, so it costs the same whether it
+    is the first page or ten thousand pages deep. Results are returned oldest
+    first, like the unpaginated endpoint used to, unless newest_first is set.
+
+    A list of querysets is paged as their union: each gets its own bounded
+    scan (e.g. one per index) and the page is merged from those.
+    """
+    default_limit = 50
+    max_limit = 200
+    timestamp_field = 'timestamp'
+    id_field = 'id'
+    newest_first = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        before = self.decode_cursor(request.query_params.get('before'))
+        after = self.decode_cursor(request.query_params.get('after'))
+        ts, pk = self.timestamp_field, self.id_field
+
+        querysets = queryset if isinstance(queryset, list) else [queryset]
+
+        if after:
+            rows = self.fetch([
+                part.filter(
+                    Q(**{f'{ts}__gt': after[0]}) | Q(**{ts: after[0], f'{pk}__gt': after[1]})
+                ).order_by(ts, pk)
+                for part in querysets
+            ], descending=False)
+            self.has_newer = len(rows) > self.limit
+            rows = rows[:self.limit]
+            # We came from somewhere, so there is always something older
+            self.has_older = True
+        else:
+            if before:
+                querysets = [
+                    part.filter(
+                        Q(**{f'{ts}__lt': before[0]}) | Q(**{ts: before[0], f'{pk}__lt': before[1]})
+                    )
+                    for part in querysets
+                ]
+            rows = self.fetch([part.order_by(f'-{ts}', f'-{pk}') for part in querysets], descending=True)
+            self.has_older = len(rows) > self.limit
+            rows = rows[:self.limit][::-1]
+            self.has_newer = bool(before)
+
+        self.after = after
+        self.rows = rows
+        return rows[::-1] if self.newest_first else rows
+
+    def fetch(self, querysets, descending):
+        """Up to limit + 1 rows, in key order, of the ordered querysets together"""
+        if len(querysets) == 1:
+            return list(querysets[0][:self.limit + 1])
+        rows = [row for part in querysets for row in part[:self.limit + 1]]
+        key = lambda row: (getattr(row, self.timestamp_field), getattr(row, self.id_field))
+        return sorted(rows, key=key, reverse=descending)[:self.limit + 1]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'older': self.encode_cursor(self.rows[0]) if self.rows and self.has_older else None,
+            # Clients poll "after" the newest row they hold, so always hand it back
+            'newer': self.encode_cursor(self.rows[-1]) if self.rows else self.encode_raw(self.after),
+            'has_newer': self.has_newer,
+        })
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def encode_cursor(self, row):
+        return self.encode_raw((getattr(row, self.timestamp_field), getattr(row, self.id_field)))
+
+    def encode_raw(self, position):
+        if not position:
+            return None
+        raw = f'{position[0].isoformat()}|{position[1]}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            timestamp, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class MessagePagination(KeysetPagination):
+    default_limit = 50
+
+
+class DirectMessagePagination(KeysetPagination):
+    default_limit = 50
+
+
+class ConversationPagination(KeysetPagination):
+    # Inbox order; a conversation that gets a new message moves to the top,
+    # where clients pick it up from the DM notification rather than a page
+    default_limit = 30
+    timestamp_field = 'last_message_at'
+    newest_first = True
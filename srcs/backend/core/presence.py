@@ -0,0 +1,290 @@
+"""
+Presence engine.
+
+Who is online lives in Redis, not Postgres:
+
+  presence:conns:<user>  sorted set of the user's open sockets (tabs), scored by
+                         heartbeat expiry, so several tabs count as one user and
+                         a crashed tab simply ages out
+  presence:online        sorted set of online users, scored by their latest expiry
+  presence:dirty         users whose online flag changed since the last flush
+
+Status changes are only sent to the people who can actually see the user (circle
+co-members and DM partners) and only to those of them who are online, through
+their personal presence_<id> groups. UserProfile.is_online is written by a
+periodic batch flush instead of on every connect/disconnect.
+"""
+import asyncio
+import time
+from core.db_executor import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from core.codec import encoded_event
+from core.fanout import send_to_groups
+from core.models import Circle, Conversation, UserProfile
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 90)
+PRESENCE_FLUSH_INTERVAL = getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 15)
+
+ONLINE_KEY = 'presence:online'
+DIRTY_KEY = 'presence:dirty'
+FLUSH_BATCH_SIZE = 1000
+
+
+def conns_key(user_id):
+    return f'presence:conns:{user_id}'
+
+
+def presence_group(user_id):
+    return f'presence_{user_id}'
+
+
+# KEYS: conns, online, dirty  ARGV: conn, user, now, expires, key ttl
+CONNECT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[2])
+if redis.call('ZCARD', KEYS[1]) == 1 then
+    redis.call('SADD', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS: conns, online, dirty  ARGV: conn, user, now, expires, key ttl
+# A heartbeat after the user was swept brings them back online
+HEARTBEAT_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[2])
+if not score or tonumber(score) <= tonumber(ARGV[3]) then
+    redis.call('SADD', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS: conns, online, dirty  ARGV: conn, user, now
+DISCONNECT_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    redis.call('SADD', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS: online, dirty  ARGV: now
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, user in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], user)
+    redis.call('SADD', KEYS[2], user)
+end
+return expired
+"""
+
+
+class RedisPresenceStore:
+    def __init__(self, url, ttl):
+        self.url = url
+        self.ttl = ttl
+        # redis.asyncio clients are bound to the loop they were created on
+        self.clients = {}
+
+    def client(self):
+        import redis.asyncio as redis
+        loop = asyncio.get_running_loop()
+        if loop not in self.clients:
+            client = redis.from_url(self.url)
+            self.clients[loop] = (
+                client,
+                client.register_script(CONNECT_SCRIPT),
+                client.register_script(HEARTBEAT_SCRIPT),
+                client.register_script(DISCONNECT_SCRIPT),
+                client.register_script(SWEEP_SCRIPT),
+            )
+        return self.clients[loop]
+
+    async def connect(self, user_id, conn_id):
+        _, connect, _, _, _ = self.client()
+        now = time.time()
+        keys = [conns_key(user_id), ONLINE_KEY, DIRTY_KEY]
+        return bool(await connect(keys=keys, args=[conn_id, user_id, now, now + self.ttl, self.ttl * 2]))
+
+    async def heartbeat(self, user_id, conn_id):
+        """True if the user had been swept offline and is back"""
+        _, _, heartbeat, _, _ = self.client()
+        now = time.time()
+        keys = [conns_key(user_id), ONLINE_KEY, DIRTY_KEY]
+        return bool(await heartbeat(keys=keys, args=[conn_id, user_id, now, now + self.ttl, self.ttl * 2]))
+
+    async def disconnect(self, user_id, conn_id):
+        _, _, _, disconnect, _ = self.client()
+        keys = [conns_key(user_id), ONLINE_KEY, DIRTY_KEY]
+        return bool(await disconnect(keys=keys, args=[conn_id, user_id, time.time()]))
+
+    async def online_among(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        client, _, _, _, _ = self.client()
+        now = time.time()
+        scores = await client.zmscore(ONLINE_KEY, user_ids)
+        return [user_id for user_id, score in zip(user_ids, scores) if score is not None and score > now]
+
+    async def sweep(self):
+        """Users whose every tab stopped heartbeating; they are marked offline"""
+        _, _, _, _, sweep = self.client()
+        return [int(user_id) for user_id in await sweep(keys=[ONLINE_KEY, DIRTY_KEY], args=[time.time()])]
+
+    async def take_dirty(self):
+        client, _, _, _, _ = self.client()
+        user_ids = [int(user_id) for user_id in await client.spop(DIRTY_KEY, FLUSH_BATCH_SIZE) or []]
+        online = set(await self.online_among(user_ids))
+        return [u for u in user_ids if u in online], [u for u in user_ids if u not in online]
+
+
+class MemoryPresenceStore:
+    """Single-process stand-in with the same semantics, for development"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.conns = {}   # user id -> {conn id: expires}
+        self.online = {}  # user id -> expires
+        self.dirty = set()
+
+    def _prune(self, user_id, now):
+        conns = self.conns.get(user_id, {})
+        for conn_id in [c for c, expires in conns.items() if expires <= now]:
+            del conns[conn_id]
+        return conns
+
+    async def connect(self, user_id, conn_id):
+        now = time.time()
+        conns = self._prune(user_id, now)
+        conns[conn_id] = self.online[user_id] = now + self.ttl
+        self.conns[user_id] = conns
+        if len(conns) == 1:
+            self.dirty.add(user_id)
+            return True
+        return False
+
+    async def heartbeat(self, user_id, conn_id):
+        now = time.time()
+        came_back = self.online.get(user_id, 0) <= now
+        self.conns.setdefault(user_id, {})[conn_id] = self.online[user_id] = now + self.ttl
+        if came_back:
+            self.dirty.add(user_id)
+        return came_back
+
+    async def disconnect(self, user_id, conn_id):
+        conns = self.conns.get(user_id, {})
+        conns.pop(conn_id, None)
+        if not self._prune(user_id, time.time()):
+            self.conns.pop(user_id, None)
+            self.online.pop(user_id, None)
+            self.dirty.add(user_id)
+            return True
+        return False
+
+    async def online_among(self, user_ids):
+        now = time.time()
+        return [user_id for user_id in user_ids if self.online.get(user_id, 0) > now]
+
+    async def sweep(self):
+        now = time.time()
+        expired = [user_id for user_id, expires in self.online.items() if expires <= now]
+        for user_id in expired:
+            self.online.pop(user_id)
+            self.conns.pop(user_id, None)
+            self.dirty.add(user_id)
+        return expired
+
+    async def take_dirty(self):
+        user_ids, self.dirty = list(self.dirty), set()
+        online = set(await self.online_among(user_ids))
+        return [u for u in user_ids if u in online], [u for u in user_ids if u not in online]
+
+
+_store = None
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        if getattr(settings, 'PRESENCE_BACKEND', 'redis') == 'memory':
+            _store = MemoryPresenceStore(PRESENCE_TTL)
+        else:
+            _store = RedisPresenceStore(settings.PRESENCE_REDIS_URL, PRESENCE_TTL)
+    return _store
+
+
+def get_presence_audience(user_id):
+    """Everyone who shares a view with the user: circle co-members and DM partners"""
+    memberships = Circle.members.through.objects
+    circle_ids = memberships.filter(user_id=user_id).values('circle_id')
+    audience = set(memberships.filter(circle_id__in=circle_ids).values_list('user_id', flat=True))
+    # One row per partner, kept by core.conversations, rather than the whole DM history
+    partners = Conversation.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id)).values_list('user_low_id', 'user_high_id')
+    for low, high in partners:
+        audience.update((low, high))
+    audience.discard(user_id)
+    return audience
+
+
+async def announce(user_id, status, audience):
+    online = await get_presence_store().online_among(audience)
+    if online:
+        await send_to_groups(
+            [presence_group(member_id) for member_id in online],
+            encoded_event('user_status', {'type': 'user_status', 'user_id': user_id, 'status': status})
+        )
+
+
+def write_online_flags(online_ids, offline_ids):
+    if online_ids:
+        UserProfile.objects.filter(user_id__in=online_ids).update(is_online=True)
+    if offline_ids:
+        UserProfile.objects.filter(user_id__in=offline_ids).update(is_online=False)
+
+
+async def flush_online_flags():
+    store = get_presence_store()
+    while True:
+        online_ids, offline_ids = await store.take_dirty()
+        if not online_ids and not offline_ids:
+            return
+        await database_sync_to_async(write_online_flags)(online_ids, offline_ids)
+
+
+async def maintenance_loop():
+    store = get_presence_store()
+    while True:
+        await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+        try:
+            # Tabs that vanished without a clean disconnect (crash, lost network)
+            for user_id in await store.sweep():
+                audience = await database_sync_to_async(get_presence_audience)(user_id)
+                await announce(user_id, 'offline', audience)
+            await flush_online_flags()
+        except Exception as e:
+            log.error('presence.maintenance_failed', error=e)
+
+
+_maintenance_tasks = {}
+
+
+def start_maintenance():
+    """One sweep/flush task per event loop (i.e. per Daphne process)"""
+    loop = asyncio.get_running_loop()
+    task = _maintenance_tasks.get(loop)
+    if task is None or task.done():
+        _maintenance_tasks[loop] = loop.create_task(maintenance_loop())
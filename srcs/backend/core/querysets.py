@@ -0,0 +1,39 @@
+"""
+Queryset shaping for the REST endpoints.
+
+Every serializer that nests UserSerializer reads user.profile, so each helper
+here pulls users together with their profiles (and whatever else the
+serializer walks) up front. That keeps list endpoints at a fixed number of
+queries no matter how many rows or members are returned.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+
+
+def users_with_profile():
+    return User.objects.select_related('profile')
+
+
+def shape_circles(queryset):
+    return queryset.select_related('admin__profile').prefetch_related(
+        Prefetch('members', queryset=users_with_profile()),
+    )
+
+
+def shape_tasks(queryset):
+    return queryset.select_related('created_by__profile').prefetch_related(
+        Prefetch('assignees', queryset=users_with_profile()),
+        'checklist_items',
+    )
+
+
+def shape_messages(queryset):
+    return queryset.select_related('sender__profile')
+
+
+def shape_direct_messages(queryset):
+    return queryset.select_related('sender__profile', 'receiver__profile')
+
+
+def shape_conversations(queryset):
+    return queryset.select_related('user_low__profile', 'user_high__profile', 'last_message')
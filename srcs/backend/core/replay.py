@@ -0,0 +1,130 @@
+"""
+Sequenced chat frames and the replay buffer behind resume-after-reconnect.
+
+Every chat_message frame broadcast to a room (a circle chat or a DM
+conversation) gets the next number of that room's sequence and is kept in a
+bounded buffer, both in Redis so every backend process shares them:
+
+  replay:seq:<room>     INCR counter, the room's latest sequence number
+  replay:frames:<room>  sorted set of "<seq>|<frame json>", scored by seq and
+                        trimmed to the newest REPLAY_BUFFER_SIZE frames
+
+A client that reconnects sends the last seq it saw and gets exactly the frames
+after it. If some of them have already been trimmed (or the room's keys
+expired), it is told to resync from the REST history instead.
+"""
+import asyncio
+import json
+from collections import deque
+from django.conf import settings
+
+REPLAY_BUFFER_SIZE = getattr(settings, 'REPLAY_BUFFER_SIZE', 500)
+REPLAY_TTL = getattr(settings, 'REPLAY_TTL', 86400)
+
+
+def seq_key(room):
+    return f'replay:seq:{room}'
+
+
+def frames_key(room):
+    return f'replay:frames:{room}'
+
+
+# KEYS: seq, frames  ARGV: frame json, buffer size, ttl
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], seq, seq .. '|' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+
+def missed(current, oldest, last_seq, frames):
+    """frames after last_seq, or None if some of them are no longer buffered"""
+    if last_seq > current:
+        # The room's sequence restarted (its keys expired); the client's numbers mean nothing
+        return None
+    if last_seq == current:
+        return []
+    if oldest is None or oldest > last_seq + 1:
+        return None
+    return frames
+
+
+class RedisReplayStore:
+    def __init__(self, url, size, ttl):
+        self.url = url
+        self.size = size
+        self.ttl = ttl
+        # redis.asyncio clients are bound to the loop they were created on
+        self.clients = {}
+
+    def client(self):
+        import redis.asyncio as redis
+        loop = asyncio.get_running_loop()
+        if loop not in self.clients:
+            client = redis.from_url(self.url)
+            self.clients[loop] = (client, client.register_script(APPEND_SCRIPT))
+        return self.clients[loop]
+
+    async def append(self, room, frame):
+        """Buffer the frame; returns its sequence number"""
+        _, append = self.client()
+        return int(await append(keys=[seq_key(room), frames_key(room)], args=[json.dumps(frame), self.size, self.ttl]))
+
+    async def current(self, room):
+        client, _ = self.client()
+        return int(await client.get(seq_key(room)) or 0)
+
+    async def since(self, room, last_seq):
+        """(current seq, frames after last_seq or None when the client must resync)"""
+        client, _ = self.client()
+        pipe = client.pipeline(transaction=True)
+        pipe.get(seq_key(room))
+        pipe.zrange(frames_key(room), 0, 0, withscores=True)
+        pipe.zrangebyscore(frames_key(room), f'({last_seq}', '+inf')
+        current, oldest, members = await pipe.execute()
+        current = int(current or 0)
+        frames = []
+        for member in members:
+            seq, frame = member.decode().split('|', 1)
+            frames.append({**json.loads(frame), 'seq': int(seq)})
+        return current, missed(current, int(oldest[0][1]) if oldest else None, last_seq, frames)
+
+
+class MemoryReplayStore:
+    """Single-process stand-in with the same semantics, for development"""
+
+    def __init__(self, size):
+        self.size = size
+        self.seqs = {}    # room -> latest seq
+        self.frames = {}  # room -> deque of (seq, frame)
+
+    async def append(self, room, frame):
+        seq = self.seqs[room] = self.seqs.get(room, 0) + 1
+        self.frames.setdefault(room, deque(maxlen=self.size)).append((seq, dict(frame)))
+        return seq
+
+    async def current(self, room):
+        return self.seqs.get(room, 0)
+
+    async def since(self, room, last_seq):
+        current = self.seqs.get(room, 0)
+        buffered = self.frames.get(room, ())
+        frames = [{**frame, 'seq': seq} for seq, frame in buffered if seq > last_seq]
+        return current, missed(current, buffered[0][0] if buffered else None, last_seq, frames)
+
+
+_store = None
+
+
+def get_replay_store():
+    global _store
+    if _store is None:
+        if getattr(settings, 'REPLAY_BACKEND', 'redis') == 'memory':
+            _store = MemoryReplayStore(REPLAY_BUFFER_SIZE)
+        else:
+            _store = RedisReplayStore(settings.REPLAY_REDIS_URL, REPLAY_BUFFER_SIZE, REPLAY_TTL)
+    return _store
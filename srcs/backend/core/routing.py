@@ -7,4 +7,6 @@ websocket_urlpatterns = [
     re_path(r'ws/sudoku/(?P<circle_id>\w+)/$', consumers.SudokuConsumer.as_asgi()),
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
     path('ws/online/', consumers.OnlineStatusConsumer.as_asgi()),
+    # All of the above over one socket, by topic
+    path('ws/session/', consumers.SessionConsumer.as_asgi()),
 ]
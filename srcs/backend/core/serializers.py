@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Circle, UserProfile, Task, Message, ChecklistItem, DirectMessage
+from django.db import transaction
+from .models import Circle, Task, Message, ChecklistItem, DirectMessage, Conversation
 
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.SerializerMethodField()
@@ -27,10 +28,45 @@ class UserSerializer(serializers.ModelSerializer):
         return False
 
 class ChecklistItemSerializer(serializers.ModelSerializer):
+    # Writable so a task update can tell kept items from new ones
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = ChecklistItem
         fields = ['id', 'content', 'is_checked']
 
+
+def sync_checklist_items(task, checklist_data):
+    """
+    Make the task's checklist match checklist_data with at most three
+    statements: one bulk_update for changed items, one bulk_create for new
+    ones and one DELETE for items that are gone. Unknown ids count as new.
+    """
+    existing = {item.id: item for item in task.checklist_items.all()}
+    kept, changed, created = set(), [], []
+
+    for item_data in checklist_data:
+        item = existing.get(item_data.get('id'))
+        if item is None or item.id in kept:
+            created.append(ChecklistItem(
+                task=task, content=item_data.get('content', ''), is_checked=item_data.get('is_checked', False)
+            ))
+            continue
+        kept.add(item.id)
+        content = item_data.get('content', item.content)
+        is_checked = item_data.get('is_checked', item.is_checked)
+        if (content, is_checked) != (item.content, item.is_checked):
+            item.content, item.is_checked = content, is_checked
+            changed.append(item)
+
+    removed = existing.keys() - kept
+    if removed:
+        ChecklistItem.objects.filter(task=task, id__in=removed).delete()
+    if changed:
+        ChecklistItem.objects.bulk_update(changed, ['content', 'is_checked'])
+    if created:
+        ChecklistItem.objects.bulk_create(created)
+
 class TaskSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     assignees = UserSerializer(many=True, read_only=True)
@@ -41,8 +77,8 @@ class TaskSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Task
-        fields = ['id', 'title', 'description', 'status', 'task_type', 'created_by', 'assignees', 'assignee_ids', 'created_at', 'circle', 'checklist_items']
-        read_only_fields = ['created_by', 'circle']
+        fields = ['id', 'title', 'description', 'status', 'task_type', 'created_by', 'assignees', 'assignee_ids', 'created_at', 'circle', 'checklist_items', 'revision']
+        read_only_fields = ['created_by', 'circle', 'revision']
 
     def create(self, validated_data):
         checklist_data = validated_data.pop('checklist_items', [])
@@ -50,10 +86,14 @@ class TaskSerializer(serializers.ModelSerializer):
         task = Task.objects.create(**validated_data)
         if assignees:
             task.assignees.set(assignees)
-        for item_data in checklist_data:
-            ChecklistItem.objects.create(task=task, **item_data)
+        if checklist_data:
+            ChecklistItem.objects.bulk_create(
+                ChecklistItem(task=task, content=item.get('content', ''), is_checked=item.get('is_checked', False))
+                for item in checklist_data
+            )
         return task
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         checklist_data = validated_data.pop('checklist_items', None)
         assignees = validated_data.pop('assignees', None)
@@ -70,27 +110,7 @@ class TaskSerializer(serializers.ModelSerializer):
 
         # Handle Checklist Items if provided
         if checklist_data is not None:
-            existing_items = {item.id: item for item in instance.checklist_items.all()}
-            incoming_item_ids = []
-
-            for item_data in checklist_data:
-                item_id = item_data.get('id')
-                if item_id and item_id in existing_items:
-                    # Update existing item
-                    item = existing_items[item_id]
-                    item.content = item_data.get('content', item.content)
-                    item.is_checked = item_data.get('is_checked', item.is_checked)
-                    item.save()
-                    incoming_item_ids.append(item_id)
-                else:
-                    # Create new item
-                    new_item = ChecklistItem.objects.create(task=instance, **item_data)
-                    incoming_item_ids.append(new_item.id)
-            
-            # Delete items that are not in the incoming list
-            for item_id, item in existing_items.items():
-                if item_id not in incoming_item_ids:
-                    item.delete()
+            sync_checklist_items(instance, checklist_data)
 
         return instance
 
@@ -114,7 +134,8 @@ class CircleSerializer(serializers.ModelSerializer):
         read_only_fields = ['invite_code', 'admin']
         
     def get_member_count(self, obj):
-        return obj.members.count()
+        # len() so a prefetched member list is reused instead of a COUNT per circle
+        return len(obj.members.all())
 
 class CircleDetailSerializer(serializers.ModelSerializer):
     members = UserSerializer(many=True, read_only=True)
@@ -139,3 +160,27 @@ class DirectMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = DirectMessage
         fields = ['id', 'content', 'timestamp', 'sender', 'receiver', 'is_read']
+
+
+class ConversationMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DirectMessage
+        fields = ['id', 'content', 'timestamp', 'sender']
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    # Seen from the requesting user: the other side and their own unread count
+    peer = serializers.SerializerMethodField()
+    last_message = ConversationMessageSerializer(read_only=True)
+    unread = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'peer', 'last_message', 'last_message_at', 'unread']
+
+    def get_peer(self, obj):
+        peer = obj.user_low if obj.user_high_id == self.context['request'].user.id else obj.user_high
+        return UserSerializer(peer).data
+
+    def get_unread(self, obj):
+        return obj.unread_for(self.context['request'].user.id)
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from core import membership
+from core.dispatch import send_to_groups_later
+from core.models import Circle
+from core.token_cache import token_user_cache
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    token_user_cache.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def evict_saved_user(sender, instance, **kwargs):
+    # Covers password changes as well as username/is_active edits
+    token_user_cache.invalidate_user(instance.id)
+
+
+def revoke_access(circle_id, user_ids):
+    # Sent after commit, so a reconnect racing the kick is already refused
+    groups = [membership.access_group(circle_id, user_id) for user_id in user_ids]
+    if groups:
+        send_to_groups_later(groups, {'type': 'membership_revoked', 'circle_id': circle_id})
+
+
+def refresh_chat_members(circle_ids):
+    # Open chat sockets keep the member set in their session; reload it once per change
+    groups = [membership.chat_group(circle_id) for circle_id in circle_ids]
+    if groups:
+        send_to_groups_later(groups, {'type': 'circle_members_changed'})
+
+
+@receiver(m2m_changed, sender=Circle.members.through)
+def sync_circle_members(sender, instance, action, reverse, pk_set, **kwargs):
+    # circle.members.add/remove/clear, or the same from the user.circles side
+    if action == 'pre_clear':
+        # pk_set is None for clear, so remember what is about to go
+        related = instance.circles if reverse else instance.members
+        instance._cleared_pks = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        # instance is the user, pk_set the circles
+        membership.invalidate(pk_set)
+        refresh_chat_members(pk_set)
+        if action != 'post_add':
+            for circle_id in pk_set:
+                revoke_access(circle_id, [instance.pk])
+    else:
+        membership.invalidate([instance.pk])
+        refresh_chat_members([instance.pk])
+        if action != 'post_add':
+            revoke_access(instance.pk, pk_set)
+
+
+@receiver(pre_delete, sender=Circle)
+def revoke_deleted_circle(sender, instance, **kwargs):
+    revoke_access(instance.pk, membership.get_member_ids(instance.pk))
+
+
+@receiver(post_delete, sender=Circle)
+def evict_deleted_circle(sender, instance, **kwargs):
+    membership.invalidate([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def evict_deleted_user_circles(sender, instance, **kwargs):
+    # Cascaded through-rows don't send m2m_changed
+    membership.invalidate(instance.circles.values_list('id', flat=True))
@@ -0,0 +1,3 @@
+"""
+Shared Sudoku game logic used by SudokuConsumer
+"""
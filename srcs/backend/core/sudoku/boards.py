@@ -0,0 +1,243 @@
+"""
+Authoritative in-memory Sudoku boards with write-behind persistence.
+
+While anyone is connected to a circle's board, the board lives here and every
+cell edit is applied in memory on the event loop (one list assignment, no
+await in between, so concurrent edits can never overwrite each other). Dirty
+boards are written back to SudokuGame in coalesced batches every
+SUDOKU_FLUSH_INTERVAL ms, and once more when the last player disconnects.
+
+State is per process, which matches the single Daphne worker we run; several
+workers would each need to own a disjoint set of circles.
+"""
+import asyncio
+import copy
+from core.db_executor import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from core.models import SudokuGame
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+SUDOKU_FLUSH_INTERVAL = getattr(settings, 'SUDOKU_FLUSH_INTERVAL', 500)
+
+
+def units_of(row, col):
+    """Row, column and box of a cell, numbered 0-8, 9-17 and 18-26"""
+    return row, 9 + col, 18 + (row // 3) * 3 + col // 3
+
+
+def unit_cells(unit):
+    if unit < 9:
+        return [(unit, col) for col in range(9)]
+    if unit < 18:
+        return [(row, unit - 9) for row in range(9)]
+    box = unit - 18
+    return [((box // 3) * 3 + r, (box % 3) * 3 + c) for r in range(3) for c in range(3)]
+
+
+class LiveBoard:
+    """
+    Besides the cells, a live board keeps how often each digit occurs in each
+    row, column and box, how many of those digits occur more than once, and
+    how many cells are empty. An edit updates those counters in place, so
+    conflicts and completion are known without rescanning the board.
+    """
+
+    def __init__(self, circle_id, board, initial_board, solution, difficulty, is_solved):
+        self.circle_id = circle_id
+        self.board = board
+        self.initial_board = initial_board
+        self.solution = solution
+        self.difficulty = difficulty
+        self.is_solved = is_solved
+        self.dirty = False
+        self.counts = [0] * 270  # unit * 10 + digit -> occurrences
+        self.conflicts = 0       # (unit, digit) pairs that occur more than once
+        self.empty = 0
+        if self.is_playable():
+            for row in range(9):
+                for col in range(9):
+                    if self.board[row][col]:
+                        self.add(row, col, self.board[row][col])
+                    else:
+                        self.empty += 1
+
+    @classmethod
+    def from_game(cls, game):
+        return cls(game.circle_id, game.board, game.initial_board, game.solution, game.difficulty, game.is_solved)
+
+    def is_playable(self):
+        return len(self.board) == 9 and all(len(row) == 9 for row in self.board)
+
+    def add(self, row, col, value):
+        clash = False
+        for unit in units_of(row, col):
+            key = unit * 10 + value
+            self.counts[key] += 1
+            if self.counts[key] == 2:
+                self.conflicts += 1
+            if self.counts[key] > 1:
+                clash = True
+        return clash
+
+    def remove(self, row, col, value):
+        for unit in units_of(row, col):
+            key = unit * 10 + value
+            if self.counts[key] == 2:
+                self.conflicts -= 1
+            self.counts[key] -= 1
+
+    def set_cell(self, row, col, value):
+        """
+        Apply an edit. None if it is out of range, targets a given cell or the
+        board is already solved; otherwise (conflict, solved) for the new value.
+        """
+        if not self.is_playable() or self.is_solved:
+            return None
+        if not (0 <= row < 9 and 0 <= col < 9 and 0 <= value <= 9):
+            return None
+        if self.initial_board and self.initial_board[row][col] != 0:
+            return None
+
+        previous = self.board[row][col]
+        conflict = False
+        if previous != value:
+            if previous:
+                self.remove(row, col, previous)
+            else:
+                self.empty -= 1
+            if value:
+                conflict = self.add(row, col, value)
+            else:
+                self.empty += 1
+            self.board[row][col] = value
+            self.dirty = True
+        elif value:
+            conflict = any(self.counts[unit * 10 + value] > 1 for unit in units_of(row, col))
+
+        # Every cell filled and no digit twice in a unit: a valid solution
+        if self.empty == 0 and self.conflicts == 0:
+            self.is_solved = True
+            self.dirty = True
+        return conflict, self.is_solved
+
+    def conflicting_cells(self, row, col):
+        """The other cells sharing a unit with (row, col) that hold the same digit"""
+        value = self.board[row][col]
+        cells = set()
+        for unit in units_of(row, col):
+            if self.counts[unit * 10 + value] > 1:
+                cells.update(cell for cell in unit_cells(unit) if self.board[cell[0]][cell[1]] == value)
+        cells.discard((row, col))
+        return sorted(cells)
+
+    def state(self):
+        # The solution stays on the server; clients learn about mistakes and
+        # completion from cell_conflict and game_solved events
+        return {
+            'board': self.board,
+            'initial_board': self.initial_board,
+            'difficulty': self.difficulty,
+            'is_solved': self.is_solved,
+        }
+
+
+class BoardRegistry:
+    def __init__(self, flush_interval_ms):
+        self.flush_interval = flush_interval_ms / 1000
+        self.boards = {}       # circle id -> LiveBoard (None if the circle has no game yet)
+        self.players = {}      # circle id -> open sockets
+        self.locks = {}
+        self.flusher = None
+        self.writes = 0        # DB writes issued, for load tests
+
+    def lock(self, circle_id):
+        return self.locks.setdefault(circle_id, asyncio.Lock())
+
+    async def acquire(self, circle_id):
+        async with self.lock(circle_id):
+            if circle_id not in self.boards:
+                self.boards[circle_id] = await database_sync_to_async(self.load)(circle_id)
+            self.players[circle_id] = self.players.get(circle_id, 0) + 1
+        self.start_flusher()
+        return self.boards[circle_id]
+
+    async def release(self, circle_id):
+        async with self.lock(circle_id):
+            self.players[circle_id] = self.players.get(circle_id, 1) - 1
+            if self.players[circle_id] > 0:
+                return
+            # Last player left: persist and forget the board
+            board = self.boards.pop(circle_id, None)
+            del self.players[circle_id]
+            if board is not None and board.dirty:
+                await self.flush_board(board)
+
+    def get(self, circle_id):
+        return self.boards.get(circle_id)
+
+    async def new_game(self, circle_id, board, initial_board, solution, difficulty):
+        # Rare and user-visible, so written through immediately
+        live = LiveBoard(circle_id, board, initial_board, solution, difficulty, False)
+        async with self.lock(circle_id):
+            await database_sync_to_async(self.save_game)(live)
+            self.writes += 1
+            if circle_id in self.players:
+                self.boards[circle_id] = live
+        return live
+
+    async def flush(self):
+        for circle_id, board in list(self.boards.items()):
+            if board is not None and board.dirty:
+                await self.flush_circle(circle_id, board)
+
+    async def flush_circle(self, circle_id, board):
+        # Under the circle's lock so a stale snapshot can never land after a new game
+        async with self.lock(circle_id):
+            if self.boards.get(circle_id) is board and board.dirty:
+                await self.flush_board(board)
+
+    async def flush_board(self, board):
+        snapshot = copy.deepcopy(board.board)
+        board.dirty = False
+        try:
+            await database_sync_to_async(self.write_board)(board.circle_id, snapshot, board.is_solved)
+            self.writes += 1
+        except Exception as e:
+            board.dirty = True
+            log.error('sudoku.persist_failed', circle=board.circle_id, error=e)
+
+    def start_flusher(self):
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.get_running_loop().create_task(self.run_flusher())
+
+    async def run_flusher(self):
+        while self.boards:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def load(self, circle_id):
+        try:
+            return LiveBoard.from_game(SudokuGame.objects.get(circle_id=circle_id))
+        except SudokuGame.DoesNotExist:
+            return None
+
+    def write_board(self, circle_id, board, is_solved):
+        SudokuGame.objects.filter(circle_id=circle_id).update(board=board, is_solved=is_solved, updated_at=timezone.now())
+
+    def save_game(self, live):
+        SudokuGame.objects.update_or_create(
+            circle_id=live.circle_id,
+            defaults={
+                'board': live.board,
+                'initial_board': live.initial_board,
+                'solution': live.solution,
+                'difficulty': live.difficulty,
+                'is_solved': False
+            }
+        )
+
+
+board_registry = BoardRegistry(SUDOKU_FLUSH_INTERVAL)
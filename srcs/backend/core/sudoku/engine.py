@@ -0,0 +1,244 @@
+"""
+Sudoku solver, uniqueness checker, grader and generator.
+
+Boards are 9x9 lists of ints with 0 for an empty cell, the same shape the
+consumer and SudokuGame store. Internally the grid is flattened to 81 cells and
+every row, column and box keeps a bitmask of the digits it already holds (bit
+d-1 for digit d), so the candidates of a cell are one OR and one NOT away.
+
+The search fills naked singles (one candidate left in a cell) and hidden
+singles (a digit with one place left in a unit) before it guesses, and it
+always guesses on the cell with the fewest candidates.
+"""
+import random
+
+ALL = 0x1FF
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+ROW = [i // 9 for i in range(81)]
+COL = [i % 9 for i in range(81)]
+BOX = [(i // 27) * 3 + (i % 9) // 3 for i in range(81)]
+UNITS = (
+    [[r * 9 + c for c in range(9)] for r in range(9)]
+    + [[r * 9 + c for r in range(9)] for c in range(9)]
+    + [[b // 3 * 27 + b % 3 * 3 + r * 9 + c for r in range(3) for c in range(3)] for b in range(9)]
+)
+POPCOUNT = [bin(mask).count('1') for mask in range(512)]
+DIGIT = {1 << d: d + 1 for d in range(9)}
+
+# Givens kept when digging holes; the grader then decides whether the puzzle
+# really is of the requested difficulty
+CLUE_TARGETS = {'easy': 40, 'medium': 32, 'hard': 25}
+
+
+def to_board(cells):
+    return [cells[r * 9:r * 9 + 9] for r in range(9)]
+
+
+class Grid:
+    __slots__ = ('cells', 'rows', 'cols', 'boxes')
+
+    def __init__(self, cells, rows, cols, boxes):
+        self.cells = cells
+        self.rows = rows
+        self.cols = cols
+        self.boxes = boxes
+
+    @classmethod
+    def from_board(cls, board):
+        """None if the givens already break a rule"""
+        grid = cls([0] * 81, [0] * 9, [0] * 9, [0] * 9)
+        for i in range(81):
+            value = board[i // 9][i % 9]
+            if value:
+                if not 1 <= value <= 9 or not grid.candidates(i) & (1 << (value - 1)):
+                    return None
+                grid.place(i, value)
+        return grid
+
+    def copy(self):
+        return Grid(self.cells[:], self.rows[:], self.cols[:], self.boxes[:])
+
+    def candidates(self, i):
+        return ALL & ~(self.rows[ROW[i]] | self.cols[COL[i]] | self.boxes[BOX[i]])
+
+    def place(self, i, value):
+        bit = 1 << (value - 1)
+        self.cells[i] = value
+        self.rows[ROW[i]] |= bit
+        self.cols[COL[i]] |= bit
+        self.boxes[BOX[i]] |= bit
+
+
+class Stats:
+    """What the search had to do, used by the grader"""
+    __slots__ = ('naked', 'hidden', 'guesses')
+
+    def __init__(self):
+        self.naked = 0
+        self.hidden = 0
+        self.guesses = 0
+
+
+def propagate(grid, stats, hidden=True):
+    """
+    Fill singles until none are left. Returns False on a contradiction,
+    otherwise the empty cell with the fewest candidates (None when solved).
+    """
+    cells = grid.cells
+    while True:
+        best, best_count, progress = None, 10, False
+        for i in range(81):
+            if cells[i]:
+                continue
+            mask = grid.candidates(i)
+            if not mask:
+                return False
+            if not mask & (mask - 1):
+                grid.place(i, DIGIT[mask])
+                stats.naked += 1
+                progress = True
+            elif POPCOUNT[mask] < best_count:
+                best, best_count = i, POPCOUNT[mask]
+        if progress:
+            continue
+        if not hidden or best is None:
+            return best
+
+        for unit in UNITS:
+            once = more = placed = 0
+            for i in unit:
+                if cells[i]:
+                    placed |= 1 << (cells[i] - 1)
+                    continue
+                mask = grid.candidates(i)
+                more |= once & mask
+                once |= mask
+            if once | placed != ALL:
+                return False  # a digit has nowhere to go in this unit
+            singles = once & ~more
+            if not singles:
+                continue
+            for i in unit:
+                if cells[i]:
+                    continue
+                mask = grid.candidates(i) & singles
+                if not mask:
+                    continue
+                if mask & (mask - 1):
+                    return False  # two digits can only go in the same cell
+                grid.place(i, DIGIT[mask])
+                stats.hidden += 1
+                progress = True
+        if not progress:
+            return best
+
+
+def search(grid, limit, solutions, stats, shuffle=False):
+    """Collect up to `limit` solutions of `grid` into `solutions`"""
+    cell = propagate(grid, stats)
+    if cell is False:
+        return
+    if cell is None:
+        solutions.append(grid.cells[:])
+        return
+    mask = grid.candidates(cell)
+    digits = [DIGIT[1 << d] for d in range(9) if mask & (1 << d)]
+    if shuffle:
+        random.shuffle(digits)
+    stats.guesses += 1
+    for value in digits:
+        branch = grid.copy()
+        branch.place(cell, value)
+        search(branch, limit, solutions, stats, shuffle)
+        if len(solutions) >= limit:
+            return
+
+
+def solve(board):
+    """The solved 9x9 board, or None if there is no solution"""
+    grid = Grid.from_board(board)
+    if grid is None:
+        return None
+    solutions = []
+    search(grid, 1, solutions, Stats())
+    if not solutions:
+        return None
+    return to_board(solutions[0])
+
+
+def count_solutions(board, limit=2):
+    grid = Grid.from_board(board)
+    if grid is None:
+        return 0
+    solutions = []
+    search(grid, limit, solutions, Stats())
+    return len(solutions)
+
+
+def has_unique_solution(board):
+    return count_solutions(board, 2) == 1
+
+
+def grade(board):
+    """
+    easy: naked singles alone solve it
+    medium: needs hidden singles too
+    hard: needs at least one guess
+    None if the puzzle has no solution
+    """
+    grid = Grid.from_board(board)
+    if grid is None:
+        return None
+    stats = Stats()
+    cell = propagate(grid, stats, hidden=False)
+    if cell is None:
+        return 'easy'
+    if cell is False:
+        return None
+    cell = propagate(grid, stats)
+    if cell is None:
+        return 'medium'
+    if cell is False:
+        return None
+    return 'hard'
+
+
+def random_solution():
+    grid = Grid([0] * 81, [0] * 9, [0] * 9, [0] * 9)
+    solutions = []
+    search(grid, 1, solutions, Stats(), shuffle=True)
+    return solutions[0]
+
+
+def dig(solution, clues):
+    """Remove givens in random order while the solution stays unique"""
+    cells = solution[:]
+    order = list(range(81))
+    random.shuffle(order)
+    remaining = 81
+    for i in order:
+        if remaining <= clues:
+            break
+        value, cells[i] = cells[i], 0
+        if count_solutions(to_board(cells), 2) == 1:
+            remaining -= 1
+        else:
+            cells[i] = value
+    return cells
+
+
+def generate(difficulty='easy', attempts=20):
+    """
+    A (puzzle, solution) pair of 9x9 boards with a unique solution. Retries
+    until the grader agrees with the requested difficulty; after `attempts`
+    the last unique puzzle is returned anyway.
+    """
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f'Unknown difficulty: {difficulty}')
+    for _ in range(attempts):
+        solution = random_solution()
+        puzzle = dig(solution, CLUE_TARGETS[difficulty])
+        if grade(to_board(puzzle)) == difficulty:
+            break
+    return to_board(puzzle), to_board(solution)
@@ -0,0 +1,65 @@
+"""
+Pre-generated puzzles per difficulty, so starting a game never waits on the
+generator. A daemon thread tops every pool up to SUDOKU_POOL_SIZE and then
+sleeps until a game takes a puzzle out. A game that finds its pool empty
+generates one on a worker thread instead of on the event loop.
+"""
+import collections
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from core.sudoku.engine import DIFFICULTIES, generate
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+SUDOKU_POOL_SIZE = getattr(settings, 'SUDOKU_POOL_SIZE', 20)
+
+
+class PuzzlePool:
+    def __init__(self, size):
+        self.size = size
+        self.pools = {difficulty: collections.deque() for difficulty in DIFFICULTIES}
+        self.wanted = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='sudoku-pool', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wanted.clear()
+            # Lowest pool first, so a burst of hard games doesn't starve easy ones
+            while True:
+                difficulty = min(DIFFICULTIES, key=lambda d: len(self.pools[d]))
+                if len(self.pools[difficulty]) >= self.size:
+                    break
+                try:
+                    self.pools[difficulty].append(generate(difficulty))
+                except Exception as e:
+                    log.error('sudoku.generate_failed', error=e)
+            self.wanted.wait()
+
+    def take(self, difficulty):
+        """(puzzle, solution) from the pool, or None if it is empty"""
+        self.start()
+        try:
+            puzzle = self.pools[difficulty].popleft()
+        except IndexError:
+            puzzle = None
+        self.wanted.set()
+        return puzzle
+
+    async def get(self, difficulty):
+        puzzle = self.take(difficulty)
+        if puzzle is None:
+            puzzle = await sync_to_async(generate, thread_sensitive=False)(difficulty)
+        return puzzle
+
+
+puzzle_pool = PuzzlePool(SUDOKU_POOL_SIZE)
@@ -0,0 +1,91 @@
+"""
+Token -> user cache for WebSocket authentication.
+
+Every dashboard tab opens several sockets and all of them authenticate with
+the same DRF token, so a reconnect storm after a deploy resolves the same few
+thousand tokens over and over. Entries are kept per process in a bounded LRU
+with a TTL, and are evicted when the token is deleted or the user is saved
+(password, username or active flag changes).
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+
+class TokenUserCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # token key -> (expires_at, user)
+        self.keys_by_user = {}        # user id -> {token keys}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return user
+
+    def set(self, key, user):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, user)
+            self.keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_token(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        keys = self.keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_user[user_id]
+
+
+token_user_cache = TokenUserCache(
+    maxsize=getattr(settings, 'WS_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'WS_TOKEN_CACHE_TTL', 300),
+)
+
+
+def get_user_for_token(token_key):
+    """Cached user for a token key, or None. Sync; hits the DB only on a miss."""
+    user = token_user_cache.get(token_key)
+    if user is not None:
+        return user
+    try:
+        user = Token.objects.select_related('user').get(key=token_key).user
+    except Token.DoesNotExist:
+        return None
+    if not user.is_active:
+        return None
+    token_user_cache.set(token_key, user)
+    return user
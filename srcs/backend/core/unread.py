@@ -0,0 +1,172 @@
+"""
+Unread direct-message counters.
+
+Each Conversation row carries the number of unread DMs for both of its users
+(see core.conversations). It is updated in the same transaction as the
+message, so it is always right, and reading a user's badges is one indexed
+query rather than a scan of DirectMessage.
+
+With DM_UNREAD_BACKEND = 'redis' (the default) a hash per user sits in front of
+it, dm_unread:<user> -> {peer: count}: badges are one HGETALL, sends bump the
+hash after commit if it is cached, and a cache miss or a Redis error falls back
+to the table (and refills the hash).
+
+Every change after commit also bumps dm_unread_version:<user>. A refill only
+lands if the version is the one read before the table was, so a send or a
+mark_read committing while the table is read cannot be overwritten by the
+older counts; the next read refills instead.
+"""
+from django.conf import settings
+from django.db.models import Q
+from core.models import Conversation
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+DM_UNREAD_CACHE_TTL = getattr(settings, 'DM_UNREAD_CACHE_TTL', 3600)
+
+# Present in every cached hash, so "no unread DMs" is distinguishable from "not cached"
+LOADED_FIELD = '_'
+
+# KEYS: hash, version  ARGV: peer, amount, ttl
+INCREMENT_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+"""
+
+# KEYS: hash, version  ARGV: peer, ttl
+CLEAR_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return redis.call('HDEL', KEYS[1], ARGV[1])
+"""
+
+# KEYS: hash, version  ARGV: version read before the table ('' for none), ttl, field, count, ...
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def unread_key(user_id):
+    return f'dm_unread:{user_id}'
+
+
+def version_key(user_id):
+    return f'dm_unread_version:{user_id}'
+
+
+def redis_client():
+    if getattr(settings, 'DM_UNREAD_BACKEND', 'redis') != 'redis':
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def get_unread_counts(user_id):
+    """{peer id: unread count} for every peer with unread DMs"""
+    counts, version = cached_counts(user_id)
+    if counts is None:
+        rows = Conversation.objects.filter(
+            Q(user_low_id=user_id, unread_low__gt=0) | Q(user_high_id=user_id, unread_high__gt=0)
+        ).values_list('user_low_id', 'user_high_id', 'unread_low', 'unread_high')
+        counts = {
+            high if low == user_id else low: unread_low if low == user_id else unread_high
+            for low, high, unread_low, unread_high in rows
+        }
+        if version is not None:
+            cache_fill(user_id, counts, version)
+    return counts
+
+
+def cache_increment(user_id, peer_id, amount=1):
+    try:
+        client = redis_client()
+        if client is not None:
+            client.register_script(INCREMENT_SCRIPT)(
+                keys=[unread_key(user_id), version_key(user_id)], args=[peer_id, amount, DM_UNREAD_CACHE_TTL]
+            )
+    except Exception as e:
+        # The table is still right; drop the hash so the next read refills it
+        log.error('unread.cache_update_failed', user=user_id, error=e)
+        cache_drop(user_id)
+
+
+def cache_clear(user_id, peer_id):
+    try:
+        client = redis_client()
+        if client is not None:
+            client.register_script(CLEAR_SCRIPT)(
+                keys=[unread_key(user_id), version_key(user_id)], args=[peer_id, DM_UNREAD_CACHE_TTL]
+            )
+    except Exception as e:
+        log.error('unread.cache_update_failed', user=user_id, error=e)
+        cache_drop(user_id)
+
+
+def cache_drop(user_id):
+    try:
+        client = redis_client()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.delete(unread_key(user_id))
+            # A refill that read the table before the failed update must not land either
+            pipe.incr(version_key(user_id))
+            pipe.expire(version_key(user_id), DM_UNREAD_CACHE_TTL)
+            pipe.execute()
+    except Exception:
+        pass
+
+
+def cached_counts(user_id):
+    """
+    (counts, version): counts is None on a miss, and version is what cache_fill
+    must see to store the table's counts; None as well if Redis is not in use
+    or failed
+    """
+    try:
+        client = redis_client()
+        if client is None:
+            return None, None
+        pipe = client.pipeline(transaction=False)
+        pipe.hgetall(unread_key(user_id))
+        pipe.get(version_key(user_id))
+        fields, version = pipe.execute()
+    except Exception as e:
+        log.error('unread.cache_read_failed', user=user_id, error=e)
+        return None, None
+    version = version.decode() if isinstance(version, bytes) else version or ''
+    if not fields:
+        return None, version
+    counts = {}
+    for peer_id, count in fields.items():
+        peer_id = peer_id.decode() if isinstance(peer_id, bytes) else peer_id
+        if peer_id != LOADED_FIELD and int(count) > 0:
+            counts[int(peer_id)] = int(count)
+    return counts, version
+
+
+def cache_fill(user_id, counts, version):
+    # Refused if a change committed since version was read; the table stays right
+    # and the next read tries again
+    try:
+        client = redis_client()
+        if client is None:
+            return
+        fields = [LOADED_FIELD, 1]
+        for peer_id, count in counts.items():
+            fields += [peer_id, count]
+        client.register_script(FILL_SCRIPT)(
+            keys=[unread_key(user_id), version_key(user_id)], args=[version, DM_UNREAD_CACHE_TTL, *fields]
+        )
+    except Exception as e:
+        log.error('unread.cache_fill_failed', user=user_id, error=e)
@@ -1,12 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CircleViewSet, TaskViewSet, RegisterView, LoginView, MessageViewSet, ProfileView, DirectMessageViewSet, GoogleLoginCallback
+from .views import CircleViewSet, TaskViewSet, RegisterView, LoginView, MessageViewSet, ProfileView, DirectMessageViewSet, ConversationViewSet, GoogleLoginCallback
 
 router = DefaultRouter()
 router.register(r'circles', CircleViewSet)
 router.register(r'tasks', TaskViewSet, basename='task')
 router.register(r'messages', MessageViewSet, basename='message')
 router.register(r'direct-messages', DirectMessageViewSet, basename='direct-message')
+router.register(r'conversations', ConversationViewSet, basename='conversation')
 router.register(r'profile', ProfileView, basename='profile')
 
 urlpatterns = [
@@ -1,5 +1,5 @@
 from .auth import RegisterView, LoginView, GoogleLoginCallback
 from .circles import CircleViewSet
 from .tasks import TaskViewSet
-from .messages import MessageViewSet, DirectMessageViewSet
+from .messages import MessageViewSet, DirectMessageViewSet, ConversationViewSet
 from .profile import ProfileView
@@ -4,8 +4,9 @@ from rest_framework.response import Response
 from django.contrib.auth.models import User
 from core.models import Circle
 from core.serializers import CircleSerializer, CircleDetailSerializer
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from core.querysets import shape_circles
+from core.dispatch import notify_circle_later
+from core.membership import is_member
 
 class CircleViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -28,15 +29,15 @@ class CircleViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if self.action == 'my_circles':
-             return self.request.user.circles.all()
-        return Circle.objects.all()
+             return shape_circles(self.request.user.circles.all())
+        return shape_circles(Circle.objects.all())
 
     @action(detail=False, methods=['post'])
     def join_by_code(self, request):
         code = request.data.get('invite_code')
         try:
             circle = Circle.objects.get(invite_code=code)
-            if request.user in circle.members.all():
+            if is_member(request.user.id, circle.id):
                 return Response({'status': 'already member', 'circle_id': circle.id})
             
             # Notify existing members before adding (or after? usually after to include correct count/list logic elsewhere, but notification is "New member joined")
@@ -44,22 +45,13 @@ class CircleViewSet(viewsets.ModelViewSet):
             circle.members.add(request.user)
             
             # Send Notification
-            channel_layer = get_channel_layer()
-            for member in circle.members.all():
-                if member.id != request.user.id:
-                    async_to_sync(channel_layer.group_send)(
-                        f'notifications_{member.id}',
-                        {
-                            'type': 'send_notification',
-                            'notification': {
-                                'type': 'circle_message', # Reusing type or creating 'member_joined' if frontend handles it
-                                'sender': request.user.username,
-                                'circle_id': circle.id,
-                                'task_id': None,
-                                'message': f"{request.user.username} joined the circle {circle.name}"
-                            }
-                        }
-                    )
+            notify_circle_later(circle.id, {
+                'type': 'circle_message', # Reusing type or creating 'member_joined' if frontend handles it
+                'sender': request.user.username,
+                'circle_id': circle.id,
+                'task_id': None,
+                'message': f"{request.user.username} joined the circle {circle.name}"
+            }, exclude=request.user.id)
             
             return Response({'status': 'joined', 'circle': CircleSerializer(circle).data})
         except Circle.DoesNotExist:
@@ -68,28 +60,19 @@ class CircleViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def join(self, request, pk=None):
         circle = self.get_object()
-        if request.user in circle.members.all():
+        if is_member(request.user.id, circle.id):
              return Response({'status': 'already member'})
              
         circle.members.add(request.user)
         
         # Send Notification
-        channel_layer = get_channel_layer()
-        for member in circle.members.all():
-            if member.id != request.user.id:
-                async_to_sync(channel_layer.group_send)(
-                    f'notifications_{member.id}',
-                    {
-                        'type': 'send_notification',
-                        'notification': {
-                            'type': 'circle_message',
-                            'sender': request.user.username,
-                            'circle_id': circle.id,
-                            'task_id': None,
-                            'message': f"{request.user.username} joined the circle {circle.name}"
-                        }
-                    }
-                )
+        notify_circle_later(circle.id, {
+            'type': 'circle_message',
+            'sender': request.user.username,
+            'circle_id': circle.id,
+            'task_id': None,
+            'message': f"{request.user.username} joined the circle {circle.name}"
+        }, exclude=request.user.id)
         
         return Response({'status': 'joined circle'})
 
@@ -119,6 +102,6 @@ class CircleViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def my_circles(self, request):
-        circles = request.user.circles.all()
+        circles = self.get_queryset()
         serializer = self.get_serializer(circles, many=True)
         return Response(serializer.data)
@@ -1,29 +1,64 @@
-from rest_framework import viewsets, permissions
-from django.db.models import Q
-from core.models import Message, DirectMessage
-from core.serializers import MessageSerializer, DirectMessageSerializer
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from core.models import Message, DirectMessage, Conversation
+from core.serializers import MessageSerializer, DirectMessageSerializer, ConversationSerializer
+from core.pagination import MessagePagination, DirectMessagePagination, ConversationPagination
+from core.querysets import shape_messages, shape_direct_messages, shape_conversations
+from core.membership import is_member
+from core.conversations import conversations_of, inbox_of, mark_read
+from core.unread import get_unread_counts
 
 class MessageViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = MessageSerializer
+    pagination_class = MessagePagination
 
     def get_queryset(self):
         circle_id = self.request.query_params.get('circle_id')
-        if not circle_id:
+        if not circle_id or not is_member(self.request.user.id, circle_id):
             return Message.objects.none()
-        return Message.objects.filter(circle_id=circle_id)
+        return shape_messages(Message.objects.filter(circle_id=circle_id))
 
 class DirectMessageViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = DirectMessageSerializer
+    pagination_class = DirectMessagePagination
 
     def get_queryset(self):
-        target_id = self.request.query_params.get('target_id')
-        if not target_id:
+        try:
+            target_id = int(self.request.query_params.get('target_id'))
+        except (TypeError, ValueError):
             return DirectMessage.objects.none()
-        
-        user = self.request.user
-        return DirectMessage.objects.filter(
-            (Q(sender=user) & Q(receiver_id=target_id)) |
-            (Q(sender_id=target_id) & Q(receiver=user))
-        )
+
+        # Both directions of the thread share one key, so a page is one range scan
+        low, high = Conversation.pair(self.request.user.id, target_id)
+        return shape_direct_messages(DirectMessage.objects.filter(user_low_id=low, user_high_id=high))
+
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        # Badge counts per peer, from the counters rather than the messages
+        counts = get_unread_counts(request.user.id)
+        return Response({'counts': counts, 'total': sum(counts.values())})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        try:
+            target_id = int(request.data.get('target_id'))
+        except (TypeError, ValueError):
+            return Response({'error': 'target_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        updated = mark_read(request.user.id, target_id)
+        return Response({'status': 'read', 'updated': updated})
+
+
+class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
+    # The DM inbox: one row per peer, most recent conversation first
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ConversationSerializer
+    pagination_class = ConversationPagination
+
+    def get_queryset(self):
+        if self.action == 'list':
+            # Paged per side of the pair (core.conversations.inbox_of)
+            return [shape_conversations(side) for side in inbox_of(self.request.user.id)]
+        return shape_conversations(conversations_of(self.request.user.id))
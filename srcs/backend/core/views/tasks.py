@@ -1,10 +1,43 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from core.models import Circle, Task, ChecklistItem
+from django.db import transaction
+from core.models import Circle, Task, ChecklistItem, TaskTombstone
 from core.serializers import TaskSerializer
+from core.querysets import shape_tasks
+from core.codec import encoded_event
+from core.dispatch import group_send_later, notify_users_later, notify_circle_later
+from core.membership import chat_group, is_member
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Checklist items one toggle_checks request may change
+MAX_TOGGLE_ITEMS = 500
+
+def publish_task_event(circle_id, action, task_id, item=None, items=None):
+    """
+    Give the change the circle's next task revision and push it as a delta to
+    chat_{circle_id}, encoded once for every socket. Must run inside the
+    write's transaction; the event is sent once that commits.
+    """
+    revision = Circle.next_task_revision(circle_id)
+    frame = {'type': 'task_update', 'action': action, 'revision': revision, 'task_id': task_id}
+
+    if action == 'delete':
+        TaskTombstone.objects.create(circle_id=circle_id, task_id=task_id, revision=revision)
+    else:
+        Task.objects.filter(id=task_id).update(revision=revision)
+        if item is not None:
+            frame['item'] = item
+        elif items is not None:
+            frame['items'] = items
+        else:
+            frame['task'] = dict(TaskSerializer(shape_tasks(Task.objects.filter(id=task_id)).get()).data)
+
+    group_send_later(chat_group(circle_id), encoded_event('task_update', frame))
+    return revision
 
 class TaskViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -19,96 +52,91 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         # Security: Only show tasks from circles I am a member of
         user_circle_ids = self.request.user.circles.values_list('id', flat=True)
-        return queryset.filter(circle__id__in=user_circle_ids)
+        return shape_tasks(queryset.filter(circle__id__in=user_circle_ids))
+
+    def list(self, request, *args, **kwargs):
+        since_rev = request.query_params.get('since_rev')
+        circle_id = request.query_params.get('circle_id')
+        if since_rev is None or not circle_id:
+            return super().list(request, *args, **kwargs)
 
+        # Incremental catch-up: only tasks changed and deleted after since_rev
+        try:
+            since_rev = int(since_rev)
+        except ValueError:
+            return Response({'error': 'since_rev must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        revision = request.user.circles.filter(id=circle_id).values_list('task_revision', flat=True).first()
+        if revision is None:
+            return Response({'error': 'Circle not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # since_rev=0 is a full snapshot (tasks that predate revisions are still at 0)
+        tasks = self.get_queryset().filter(revision__gt=since_rev) if since_rev else self.get_queryset()
+        deleted = TaskTombstone.objects.filter(circle_id=circle_id, revision__gt=since_rev).values_list('task_id', flat=True)
+        return Response({
+            'revision': revision,
+            'tasks': self.get_serializer(tasks, many=True).data,
+            'deleted': list(deleted),
+        })
+
+    @transaction.atomic
     def perform_create(self, serializer):
         circle_id = self.request.data.get('circle_id')
+        if not is_member(self.request.user.id, circle_id):
+            raise PermissionDenied("You are not a member of this circle.")
         circle = Circle.objects.get(id=circle_id)
         serializer.save(created_by=self.request.user, circle=circle)
         
         # Signal Update
+        serializer.instance.revision = publish_task_event(circle.id, 'create', serializer.instance.id)
+
         try:
-             channel_layer = get_channel_layer()
-             async_to_sync(channel_layer.group_send)(
-                 f'chat_{circle.id}',
-                 {'type': 'task_update', 'action': 'create'}
-             )
-             
              # Notify assignee(s)
-             if serializer.instance.task_type == 'assignment':
-                assignees = serializer.instance.assignees.all()
-                if assignees.exists():
-                     for assignee in assignees:
-                        if assignee != self.request.user:
-                            print(f"DEBUG: Sending assignment notification to {assignee.id}")
-                            async_to_sync(channel_layer.group_send)(
-                                f'notifications_{assignee.id}',
-                                {
-                                    'type': 'send_notification',
-                                    'notification': {
-                                        'type': 'task_assigned',
-                                        'sender': self.request.user.username,
-                                        'circle_id': circle.id,
-                                        'task_id': serializer.instance.id,
-                                        'message': f"Assigned you to task: {serializer.instance.title}"
-                                    }
-                                }
-                            )
+             task = serializer.instance
+             if task.task_type == 'assignment':
+                assignee_ids = list(task.assignees.values_list('id', flat=True))
+                if assignee_ids:
+                     log.debug('task.assignment_notify', task=task.id, users=assignee_ids)
+                     notify_users_later(assignee_ids, {
+                         'type': 'task_assigned',
+                         'sender': self.request.user.username,
+                         'circle_id': circle.id,
+                         'task_id': task.id,
+                         'message': f"Assigned you to task: {task.title}"
+                     }, exclude=self.request.user.id)
                 else:
                     # Assigned to Everyone (if no specific assignees) - Notify all members except creator
-                    print(f"DEBUG: Task assigned to Everyone (no specific assignees) in circle {circle.id}")
-                    for member in circle.members.all():
-                        if member.id != self.request.user.id:
-                            async_to_sync(channel_layer.group_send)(
-                                f'notifications_{member.id}',
-                                {
-                                    'type': 'send_notification',
-                                    'notification': {
-                                        'type': 'task_assigned',
-                                        'sender': self.request.user.username,
-                                        'circle_id': circle.id,
-                                        'task_id': serializer.instance.id,
-                                        'message': f"Assigned everyone to task: {serializer.instance.title}"
-                                    }
-                                }
-                            )
-             elif serializer.instance.task_type in ['note', 'checklist']:
+                    log.debug('task.assignment_notify', task=task.id, circle=circle.id)
+                    notify_circle_later(circle.id, {
+                        'type': 'task_assigned',
+                        'sender': self.request.user.username,
+                        'circle_id': circle.id,
+                        'task_id': task.id,
+                        'message': f"Assigned everyone to task: {task.title}"
+                    }, exclude=self.request.user.id)
+             elif task.task_type in ['note', 'checklist']:
                  # Notify all members about new note/checklist
-                 print(f"DEBUG: New {serializer.instance.task_type} created in circle {circle.id}")
-                 for member in circle.members.all():
-                    if member.id != self.request.user.id:
-                        async_to_sync(channel_layer.group_send)(
-                            f'notifications_{member.id}',
-                            {
-                                'type': 'send_notification',
-                                'notification': {
-                                    'type': f'{serializer.instance.task_type}_created',
-                                    'sender': self.request.user.username,
-                                    'circle_id': circle.id,
-                                    'task_id': serializer.instance.id,
-                                    'message': f"New {serializer.instance.task_type}: {serializer.instance.title}"
-                                }
-                            }
-                        )
+                 log.debug('task.created_notify', task=task.id, task_type=task.task_type, circle=circle.id)
+                 notify_circle_later(circle.id, {
+                     'type': f'{task.task_type}_created',
+                     'sender': self.request.user.username,
+                     'circle_id': circle.id,
+                     'task_id': task.id,
+                     'message': f"New {task.task_type}: {task.title}"
+                 }, exclude=self.request.user.id)
         except Exception as e:
-             print(f"Error sending signal: {e}")
+             log.error('task.notify_failed', task=serializer.instance.id, error=e)
 
+    @transaction.atomic
     def perform_destroy(self, instance):
         if instance.created_by != self.request.user:
             raise permissions.PermissionDenied("You can only delete tasks you created.")
-        circle_id = instance.circle.id
+        circle_id, task_id = instance.circle_id, instance.id
         instance.delete()
         
         # Signal Update
-        try:
-             channel_layer = get_channel_layer()
-             async_to_sync(channel_layer.group_send)(
-                 f'chat_{circle_id}',
-                 {'type': 'task_update', 'action': 'delete'}
-             )
-        except Exception as e:
-             print(f"Error sending signal: {e}")
+        publish_task_event(circle_id, 'delete', task_id)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         instance = self.get_object()
         # Track changes
@@ -127,78 +155,79 @@ class TaskViewSet(viewsets.ModelViewSet):
         added_assignees = new_assignees - old_assignees
         
         if added_assignees:
-             for assignee in added_assignees:
-                 if assignee != self.request.user:
-                     print(f"DEBUG: Task assigned (added) to {assignee.username}")
-                     try:
-                         channel_layer = get_channel_layer()
-                         async_to_sync(channel_layer.group_send)(
-                            f'notifications_{assignee.id}',
-                            {
-                                'type': 'send_notification',
-                                'notification': {
-                                    'type': 'task_assigned',
-                                    'sender': self.request.user.username,
-                                    'circle_id': updated_instance.circle.id,
-                                    'task_id': updated_instance.id,
-                                    'message': f"Assigned you to task: {updated_instance.title}"
-                                }
-                            }
-                        )
-                     except Exception as e:
-                         print(f"Error sending assignment notification: {e}")
+             added_ids = [assignee.id for assignee in added_assignees]
+             log.debug('task.assignment_notify', task=updated_instance.id, users=added_ids)
+             try:
+                 notify_users_later(added_ids, {
+                     'type': 'task_assigned',
+                     'sender': self.request.user.username,
+                     'circle_id': updated_instance.circle_id,
+                     'task_id': updated_instance.id,
+                     'message': f"Assigned you to task: {updated_instance.title}"
+                 }, exclude=self.request.user.id)
+             except Exception as e:
+                 log.error('task.notify_failed', task=updated_instance.id, error=e)
 
         # 2. Check for Completion
         if updated_instance.status == 'done' and old_status != 'done':
-             print(f"DEBUG: Task {updated_instance.id} completed")
+             log.debug('task.completed_notify', task=updated_instance.id)
              try:
-                 channel_layer = get_channel_layer()
-                 for member in updated_instance.circle.members.all():
-                    if member.id != self.request.user.id:
-                        async_to_sync(channel_layer.group_send)(
-                            f'notifications_{member.id}',
-                            {
-                                'type': 'send_notification',
-                                'notification': {
-                                    'type': 'task_completed',
-                                    'sender': self.request.user.username,
-                                    'circle_id': updated_instance.circle.id,
-                                    'task_id': updated_instance.id,
-                                    'message': f"Completed task: {updated_instance.title}"
-                                }
-                            }
-                        )
+                 notify_circle_later(updated_instance.circle_id, {
+                     'type': 'task_completed',
+                     'sender': self.request.user.username,
+                     'circle_id': updated_instance.circle_id,
+                     'task_id': updated_instance.id,
+                     'message': f"Completed task: {updated_instance.title}"
+                 }, exclude=self.request.user.id)
              except Exception as e:
-                 print(f"Error sending completion notification: {e}")
+                 log.error('task.notify_failed', task=updated_instance.id, error=e)
         
         # Signal Update
-        try:
-             channel_layer = get_channel_layer()
-             async_to_sync(channel_layer.group_send)(
-                 f'chat_{instance.circle.id}',
-                 {'type': 'task_update', 'action': 'update'}
-             )
-        except Exception as e:
-             print(f"Error sending signal: {e}")
+        updated_instance.revision = publish_task_event(instance.circle_id, 'update', instance.id)
 
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def toggle_check(self, request, pk=None):
-        item_id = request.data.get('item_id')
         try:
-            item = ChecklistItem.objects.get(id=item_id, task_id=pk)
-            item.is_checked = not item.is_checked
-            item.save()
-            
-            # Signal Update
-            try:
-                 channel_layer = get_channel_layer()
-                 async_to_sync(channel_layer.group_send)(
-                     f'chat_{item.task.circle.id}',
-                     {'type': 'task_update', 'action': 'update'}
-                 )
-            except Exception as e:
-                 print(f"Error sending signal: {e}")
-            
-            return Response({'status': 'toggled', 'is_checked': item.is_checked})
-        except ChecklistItem.DoesNotExist:
+            task_id, item_id = int(pk), int(request.data.get('item_id'))
+        except (TypeError, ValueError):
             return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # One conditional UPDATE flips the item and returns its circle
+        rows = ChecklistItem.toggle(task_id, [item_id], request.user.id)
+        if not rows:
+            return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+        item_id, content, is_checked, circle_id = rows[0]
+
+        # Signal Update
+        publish_task_event(circle_id, 'check', task_id, item={'id': item_id, 'content': content, 'is_checked': is_checked})
+
+        return Response({'status': 'toggled', 'is_checked': is_checked})
+
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def toggle_checks(self, request, pk=None):
+        # Flip many items at once, or set them all with is_checked: true/false
+        item_ids = request.data.get('item_ids')
+        is_checked = request.data.get('is_checked')
+        # A string would iterate digit by digit; the UPDATE takes one placeholder per id
+        if not isinstance(item_ids, list) or len(item_ids) > MAX_TOGGLE_ITEMS:
+            return Response(
+                {'error': f'item_ids must be a list of at most {MAX_TOGGLE_ITEMS} ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            task_id = int(pk)
+            item_ids = [int(item_id) for item_id in item_ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'item_ids must be a list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if is_checked is not None and not isinstance(is_checked, bool):
+            return Response({'error': 'is_checked must be a boolean'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = ChecklistItem.toggle(task_id, item_ids, request.user.id, is_checked=is_checked)
+        items = [{'id': item_id, 'content': content, 'is_checked': checked} for item_id, content, checked, _ in rows]
+        if rows:
+            # Signal Update, one revision for the whole batch
+            publish_task_event(rows[0][3], 'check', task_id, items=items)
+
+        return Response({'status': 'toggled', 'items': items})
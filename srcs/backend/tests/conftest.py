@@ -0,0 +1,98 @@
+import itertools
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.management.commands.loadtest import Command
+from core.models import Circle
+from core.sudoku.boards import board_registry
+from core.token_cache import token_user_cache
+
+usernames = (f'user_{i}' for i in itertools.count())
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('loadtest')
+    group.addoption('--clients', type=int, default=100, help='Simulated clients per benchmark')
+    group.addoption('--circle-size', type=int, default=20, help='Clients per circle')
+    group.addoption('--ops', type=int, default=5, help='Operations per client and round')
+    group.addoption('--rounds', type=int, default=3, help='Rounds per benchmark')
+
+
+@pytest.fixture
+def options(request):
+    """The loadtest command's options, scaled by the command line above"""
+    config = request.config
+    return {
+        'clients': config.getoption('clients'),
+        'circle_size': config.getoption('circle_size'),
+        'ops': config.getoption('ops'),
+        'burst': 5,
+        'concurrency': 200,
+        'backends': 'memory',
+        'rounds': config.getoption('rounds'),
+    }
+
+
+@pytest.fixture
+def loadtest():
+    return Command()
+
+
+@pytest.fixture
+def clients(transactional_db, loadtest, options):
+    # Committed, so the consumers' database threads see them; the database is flushed afterwards
+    clients, _ = loadtest.create_clients(options['clients'], options['circle_size'])
+    return clients
+
+
+@pytest.fixture(autouse=True)
+def process_state():
+    """Per-process caches outlive the database flush between tests"""
+    yield
+    cache.clear()
+    token_user_cache.clear()
+    # Bound to the event loop of the test that created them
+    board_registry.locks.clear()
+
+
+@pytest.fixture
+def application():
+    from transcendence.asgi import application
+    return application
+
+
+@pytest.fixture
+def make_users(db):
+    def make(count):
+        return [User.objects.create(username=next(usernames)) for _ in range(count)]
+    return make
+
+
+@pytest.fixture
+def circle_with_members(make_users):
+    """A circle of `count` new users, administered by the first"""
+    def make(count=2, name='circle'):
+        members = make_users(count)
+        circle = Circle.objects.create(name=name, admin=members[0])
+        circle.members.add(*members)
+        return circle, members
+    return make
+
+
+@pytest.fixture
+def tokens(db):
+    """DRF token keys of the given users, for ?token= on sockets"""
+    def make(users):
+        return [Token.objects.create(user=user).key for user in users]
+    return make
+
+
+@pytest.fixture
+def api_client():
+    def make(user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    return make
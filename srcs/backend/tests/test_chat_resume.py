@@ -0,0 +1,98 @@
+import asyncio
+from unittest.mock import patch
+import pytest
+from channels.testing import WebsocketCommunicator
+from core.membership import chat_group
+from core.replay import get_replay_store
+
+MISSED = 50
+
+
+@pytest.fixture
+def room(transactional_db, circle_with_members, tokens):
+    circle, members = circle_with_members(2)
+    return circle, tokens(members)
+
+
+async def open_chat(application, circle, key):
+    communicator = WebsocketCommunicator(application, f'/ws/chat/{circle.id}/?token={key}')
+    connected, _ = await communicator.connect()
+    assert connected
+    state = await communicator.receive_json_from(timeout=5)
+    assert state.get('type') == 'chat_state'
+    return communicator
+
+
+async def chat_frames(communicator, count):
+    received = []
+    while len(received) < count:
+        frame = await communicator.receive_json_from(timeout=5)
+        if frame.get('type') == 'chat_message':
+            received.append(frame)
+    return received
+
+
+def test_missed_frames_replayed_in_order(application, room):
+    circle, keys = room
+
+    async def run():
+        sender = await open_chat(application, circle, keys[0])
+        reader = await open_chat(application, circle, keys[1])
+
+        # The reader sees one message live, then drops off
+        await sender.send_json_to({'message': 'before'})
+        last_seq = (await chat_frames(reader, 1))[0]['seq']
+        await reader.disconnect()
+
+        for i in range(MISSED):
+            await sender.send_json_to({'message': f'missed {i}', 'client_id': i})
+        await chat_frames(sender, MISSED)
+
+        reader = await open_chat(application, circle, keys[1])
+        await reader.send_json_to({'type': 'resume', 'last_seq': last_seq})
+        replayed = await chat_frames(reader, MISSED)
+        assert await reader.receive_nothing(timeout=0.2)
+        assert [frame['message'] for frame in replayed] == [f'missed {i}' for i in range(MISSED)]
+        assert [frame['seq'] for frame in replayed] == list(range(last_seq + 1, last_seq + MISSED + 1))
+
+        # Roll the buffer past what the reader has seen: it is told to resync
+        store = get_replay_store()
+        for i in range(store.size):
+            await store.append(chat_group(circle.id), {'type': 'chat_message', 'message': f'filler {i}'})
+        await reader.send_json_to({'type': 'resume', 'last_seq': last_seq})
+        assert (await reader.receive_json_from(timeout=5)).get('type') == 'resync'
+        # Likewise for a seq from the future
+        await reader.send_json_to({'type': 'resume', 'last_seq': 10 ** 9})
+        assert (await reader.receive_json_from(timeout=5)).get('type') == 'resync'
+
+        await sender.disconnect()
+        await reader.disconnect()
+
+    asyncio.run(run())
+
+
+def test_resync_after_unsequenced_frame(application, room):
+    circle, keys = room
+
+    async def unavailable(room, frame):
+        raise ConnectionError('replay store down')
+
+    async def run():
+        sender = await open_chat(application, circle, keys[0])
+        reader = await open_chat(application, circle, keys[1])
+
+        # A frame the buffer could not take goes out unsequenced; the next one is preceded by a resync
+        with patch.object(get_replay_store(), 'append', unavailable):
+            await sender.send_json_to({'message': 'unsequenced'})
+            lost = (await chat_frames(reader, 1))[0]
+        await sender.send_json_to({'message': 'after'})
+        reply = await reader.receive_json_from(timeout=5)
+        after = (await chat_frames(reader, 1))[0]
+        assert lost['seq'] is None
+        assert reply.get('type') == 'resync'
+        assert reply.get('seq') == after['seq'] - 1
+
+        await sender.disconnect()
+        await reader.disconnect()
+
+    asyncio.run(run())
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import pytest
+from channels.testing import WebsocketCommunicator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from core.db_executor import database_sync_to_async, db_executor
+from core.message_writer import message_writer
+
+FRAMES = 50
+
+# Statements allowed per batch the message writer flushes; a frame itself may issue none
+BUDGETS = {
+    'chat': 1,   # bulk INSERT of messages
+    'dm': 2,     # bulk INSERT of DMs, conversation UPDATE
+}
+
+# Transaction control (SQLite issues an explicit BEGIN) is not a round-trip we budget
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class ExecutorQueries:
+    """CaptureQueriesContext on every db_executor thread, where the consumers' queries run"""
+
+    def __init__(self):
+        self.contexts = []
+        self.lock = threading.Lock()
+        self.marks = {}
+
+    def enter(self):
+        # This thread's own connection, not the proxy that resolves per calling thread
+        context = CaptureQueriesContext(connections[DEFAULT_DB_ALIAS])
+        context.__enter__()
+        with self.lock:
+            self.contexts.append(context)
+
+    def exit(self):
+        for context in self.contexts:
+            context.__exit__(None, None, None)
+
+    def clear(self):
+        self.marks = {id(context): len(context) for context in self.contexts}
+
+    @property
+    def statements(self):
+        return [
+            query['sql']
+            for context in self.contexts
+            for query in context.captured_queries[self.marks.get(id(context), 0):]
+            if not query['sql'].lstrip().upper().startswith(TRANSACTION_CONTROL)
+        ]
+
+
+@pytest.fixture
+def executor_queries():
+    queries = ExecutorQueries()
+    db_executor.run_on_each_thread(queries.enter)
+    yield queries
+    queries.exit()
+
+
+@pytest.fixture
+def chat(transactional_db, circle_with_members, make_users, tokens):
+    circle, members = circle_with_members(2)
+    outsider = make_users(1)[0]
+    users = [*members, outsider]
+    return circle, users, tokens(users)
+
+
+async def send_frames(communicator, frames):
+    for i in range(frames):
+        await communicator.send_json_to({'message': f'frame {i}', 'client_id': i})
+    acked = 0
+    while acked < frames:
+        event = await communicator.receive_json_from(timeout=10)
+        assert event['type'] != 'message_failed', f'frame {event["client_id"]} was not saved'
+        if event['type'] == 'message_saved':
+            acked += 1
+
+
+@pytest.mark.parametrize('name', BUDGETS)
+def test_frames_only_write(application, chat, executor_queries, name):
+    circle, users, keys = chat
+    path = {
+        'chat': f'/ws/chat/{circle.id}/?token={keys[0]}',
+        'dm': f'/ws/chat/dm/{users[1].id}/?token={keys[0]}',
+    }[name]
+
+    async def run():
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect()
+        assert connected
+        await send_frames(communicator, 1)  # warm up
+
+        executor_queries.clear()
+        batches_before = message_writer.batches
+        await send_frames(communicator, FRAMES)
+        statements = executor_queries.statements
+        batches = message_writer.batches - batches_before
+        await communicator.disconnect()
+        return statements, batches
+
+    statements, batches = asyncio.run(run())
+    assert batches and statements, 'nothing was written, or the capture missed it'
+    assert [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')] == []
+    assert len(statements) <= BUDGETS[name] * batches
+
+
+def test_new_member_notified_without_reconnect(application, chat):
+    circle, users, keys = chat
+
+    async def run():
+        # A member added while the chat is open is notified without the sender reconnecting
+        sender = WebsocketCommunicator(application, f'/ws/chat/{circle.id}/?token={keys[0]}')
+        await sender.connect()
+        await database_sync_to_async(circle.members.add)(users[2])
+        notifications = WebsocketCommunicator(application, f'/ws/notifications/?token={keys[2]}')
+        await notifications.connect()
+        await asyncio.sleep(0.5)
+
+        await send_frames(sender, 1)
+        event = await notifications.receive_json_from(timeout=5)
+        await sender.disconnect()
+        await notifications.disconnect()
+        return event
+
+    assert asyncio.run(run()).get('data', {}).get('type') == 'circle_message'
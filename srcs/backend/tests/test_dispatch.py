@@ -0,0 +1,25 @@
+import asyncio
+from channels.layers import get_channel_layer
+from core.dispatch import InProcessQueue
+
+
+def test_in_memory_jobs_run_on_the_bound_loop():
+    queue = InProcessQueue()
+    # Nothing bound yet: dropped rather than sent from the wrong loop
+    queue.put({'kind': 'group_send', 'group': 'dispatch', 'message': {'type': 'lost'}})
+
+    async def run():
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add('dispatch', channel)
+        queue.bind(asyncio.get_running_loop())
+
+        # Queued from a view's thread, delivered on this loop
+        job = {'kind': 'group_send', 'group': 'dispatch', 'message': {'type': 'sent'}}
+        await asyncio.get_running_loop().run_in_executor(None, queue.put, job)
+        message = await asyncio.wait_for(layer.receive(channel), timeout=5)
+        await layer.group_discard('dispatch', channel)
+        return message
+
+    assert asyncio.run(run()) == {'type': 'sent'}
+    assert not queue.uses_thread()
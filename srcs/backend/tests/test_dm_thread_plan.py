@@ -0,0 +1,65 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import DirectMessage
+
+INDEX = 'dm_thread_ts_id_idx'
+MESSAGES = 5000
+THREADS = 50
+
+# Plan fragments that mean the thread was not read as one ordered range scan
+FORBIDDEN = {
+    'postgresql': {
+        'Sort Key': 'sorts the thread',
+        'BitmapOr': 'merges two index scans',
+        'Seq Scan on core_directmessage': 'scans the whole table',
+    },
+    'sqlite': {
+        'TEMP B-TREE': 'sorts the thread',
+        'MULTI-INDEX OR': 'merges two index scans',
+        'SCAN core_directmessage': 'scans the whole table',
+    },
+}
+EXPLAIN = {'postgresql': 'EXPLAIN', 'sqlite': 'EXPLAIN QUERY PLAN'}
+
+
+@pytest.fixture
+def thread(db, make_users, api_client):
+    if connection.vendor not in FORBIDDEN:
+        pytest.skip(f'no plan expectations for {connection.vendor}')
+    users = make_users(THREADS + 1)
+    me = users[0]
+    DirectMessage.objects.bulk_create(
+        (
+            DirectMessage(
+                sender=me, receiver=users[1 + i % THREADS],
+                user_low=me, user_high=users[1 + i % THREADS], content=f'message {i}'
+            )
+            for i in range(MESSAGES)
+        ),
+        batch_size=5000,
+    )
+    # Statistics for the fresh rows, so the planner sees a realistic table
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE core_directmessage')
+
+    client = api_client(me)
+    url = f'/api/direct-messages/?target_id={users[1].id}'
+    return client, url, client.get(url).data['older']
+
+
+@pytest.mark.parametrize('page', ['newest', 'before', 'after'])
+def test_page_is_a_range_scan_of_the_thread_index(thread, page):
+    client, url, cursor = thread
+    if page != 'newest':
+        url = f'{url}&{page}={cursor}'
+
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).status_code == 200
+    sql = [q['sql'] for q in queries if 'core_directmessage' in q['sql']][0]
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(f'{EXPLAIN[connection.vendor]} {sql}')
+        plan = '\n'.join(' '.join(str(col) for col in row) for row in db_cursor.fetchall())
+
+    assert INDEX in plan, plan
+    assert [reason for fragment, reason in FORBIDDEN[connection.vendor].items() if fragment in plan] == [], plan
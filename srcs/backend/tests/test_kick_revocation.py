@@ -0,0 +1,81 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+
+MEMBERS = 10
+RATE = 200  # chat messages per second during the kick
+QUIET_PERIOD = 1.0  # seconds to watch for leaked frames
+
+
+async def open_socket(application, path, key):
+    communicator = WebsocketCommunicator(application, f'{path}?token={key}')
+    connected, _ = await communicator.connect()
+    assert connected, path
+    return communicator
+
+
+def test_no_frames_after_revocation(application, transactional_db, circle_with_members, tokens, api_client):
+    circle, members = circle_with_members(MEMBERS)
+    keys = tokens(members)
+    victim = members[1]
+    client = api_client(members[0])
+
+    async def run():
+        # The victim has two chat tabs and the Sudoku board open
+        victim_sockets = [
+            await open_socket(application, f'/ws/chat/{circle.id}/', keys[1]),
+            await open_socket(application, f'/ws/chat/{circle.id}/', keys[1]),
+            await open_socket(application, f'/ws/sudoku/{circle.id}/', keys[1]),
+        ]
+        sender = await open_socket(application, f'/ws/chat/{circle.id}/', keys[0])
+        others = [await open_socket(application, f'/ws/chat/{circle.id}/', key) for key in keys[2:]]
+
+        stop = asyncio.Event()
+
+        async def chatter():
+            i = 0
+            while not stop.is_set():
+                await sender.send_json_to({'message': f'load {i}'})
+                i += 1
+                await asyncio.sleep(1 / RATE)
+
+        load = asyncio.create_task(chatter())
+        await asyncio.sleep(0.5)
+
+        response = await sync_to_async(client.post)(
+            f'/api/circles/{circle.id}/kick_member/', {'member_id': victim.id}, format='json'
+        )
+        assert response.status_code == 200
+
+        # Everything up to the revocation frame is fine; after it only the close may follow
+        leaked = []
+        for communicator in victim_sockets:
+            while True:
+                output = await communicator.receive_output(timeout=5)
+                assert output['type'] != 'websocket.close', 'closed without a membership_revoked frame'
+                if json.loads(output.get('text', '{}')).get('type') == 'membership_revoked':
+                    break
+            output = await communicator.receive_output(timeout=5)
+            if output['type'] != 'websocket.close':
+                leaked.append(output)
+
+        # Keep the chat busy and make sure nothing else reaches the victim
+        await asyncio.sleep(QUIET_PERIOD)
+        for communicator in victim_sockets:
+            while not await communicator.receive_nothing(timeout=0.05):
+                leaked.append(await communicator.receive_output())
+
+        stop.set()
+        await load
+        assert leaked == []
+
+        # The member index is already in sync: reconnecting is refused
+        retry = WebsocketCommunicator(application, f'/ws/chat/{circle.id}/?token={keys[1]}')
+        connected, _ = await retry.connect()
+        assert not connected
+
+        for communicator in victim_sockets + [sender] + others:
+            await communicator.disconnect()
+
+    asyncio.run(run())
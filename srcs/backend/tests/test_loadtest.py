@@ -0,0 +1,38 @@
+"""
+The loadtest scenarios as pytest-benchmark benchmarks, against the ASGI
+application with transcendence.settings_sqlite:
+
+    pip install -r requirements-dev.txt
+    pytest --clients 1000 --benchmark-autosave
+    pytest --benchmark-compare
+
+Each round is one run of the scenario; its throughput, p50/p99 latencies and
+DB queries per operation are kept in the benchmark's extra_info, so they are
+saved and compared along with the timings.
+"""
+import asyncio
+import pytest
+from transcendence.asgi import application
+
+
+def run_scenario(benchmark, loadtest, clients, options, name):
+    runs = []
+
+    def once():
+        runs.append(asyncio.run(loadtest.run_scenario(name, application, clients, options)))
+
+    benchmark.pedantic(once, rounds=options['rounds'], iterations=1)
+    result = runs[-1].result()
+    benchmark.extra_info.update(result)
+    return result
+
+
+def errors(result):
+    return {name: latency['errors'] for name, latency in result['latency'].items() if latency['errors']}
+
+
+@pytest.mark.parametrize('name', ['chat', 'sudoku', 'tasks', 'presence'])
+def test_scenario(benchmark, loadtest, clients, options, name):
+    result = run_scenario(benchmark, loadtest, clients, options, name)
+    assert result['operations'] > 0
+    assert not errors(result)
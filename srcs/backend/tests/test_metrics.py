@@ -0,0 +1,65 @@
+import asyncio
+import re
+from unittest.mock import patch
+import pytest
+from channels.testing import WebsocketCommunicator
+
+EXPECTED = [
+    r'http_request_duration_seconds_count\{view="circle-my-circles",method="GET",status="200"\} [1-9]',
+    r'http_request_db_queries_count\{view="circle-my-circles"\} [1-9]',
+    r'db_queries_total\{alias="default"\} [1-9]',
+    r'ws_frames_received_total\{consumer="ChatConsumer"\} [1-9]',
+    r'ws_frames_sent_total\{consumer="ChatConsumer"\} [1-9]',
+    r'ws_handler_duration_seconds_count\{consumer="ChatConsumer",handler="chat_message"\} [1-9]',
+    r'ws_open_connections\{consumer="ChatConsumer",transport="socket"\} 0',
+    r'channel_layer_group_send_seconds_count\{event="chat_message"\} [1-9]',
+]
+PUBLIC, INTERNAL = '93.184.216.34', '172.18.0.5'
+
+
+@pytest.fixture
+def client(db, api_client, make_users):
+    return api_client(make_users(1)[0])
+
+
+def test_rest_and_socket_traffic_reported(application, transactional_db, circle_with_members, tokens, api_client):
+    circle, members = circle_with_members(1)
+    client = api_client(members[0])
+    key = tokens(members)[0]
+    assert client.get('/api/circles/my_circles/').status_code == 200
+
+    async def chat():
+        communicator = WebsocketCommunicator(application, f'/ws/chat/{circle.id}/?token={key}')
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.send_json_to({'message': 'measured'})
+        while (await communicator.receive_json_from(timeout=5)).get('type') != 'chat_message':
+            pass
+        await communicator.disconnect()
+
+    asyncio.run(chat())
+    with patch('core.metrics.METRICS_TOKEN', ''):
+        body = client.get('/metrics').content.decode()
+    assert [pattern for pattern in EXPECTED if not re.search(pattern, body)] == []
+
+
+@pytest.mark.parametrize('headers, status', [
+    ({}, 200),  # APIClient connects from 127.0.0.1
+    ({'REMOTE_ADDR': INTERNAL}, 200),
+    ({'REMOTE_ADDR': PUBLIC}, 403),
+    # Relayed by Caddy
+    ({'REMOTE_ADDR': INTERNAL, 'HTTP_X_FORWARDED_FOR': PUBLIC}, 403),
+])
+def test_scrape_without_token(client, headers, status):
+    with patch('core.metrics.METRICS_TOKEN', ''):
+        assert client.get('/metrics', **headers).status_code == status
+
+
+@pytest.mark.parametrize('headers, status', [
+    ({}, 403),
+    ({'HTTP_AUTHORIZATION': 'Bearer wrong'}, 403),
+    ({'REMOTE_ADDR': PUBLIC, 'HTTP_AUTHORIZATION': 'Bearer scrape-me'}, 200),
+])
+def test_scrape_with_token(client, headers, status):
+    with patch('core.metrics.METRICS_TOKEN', 'scrape-me'):
+        assert client.get('/metrics', **headers).status_code == status
@@ -0,0 +1,53 @@
+import asyncio
+import time
+from unittest.mock import patch
+from channels.testing import WebsocketCommunicator
+from core.presence import PRESENCE_TTL, get_presence_store
+
+
+async def open_online(application, key):
+    communicator = WebsocketCommunicator(application, f'/ws/online/?token={key}')
+    connected, _ = await communicator.connect()
+    assert connected
+    assert (await communicator.receive_json_from(timeout=5)).get('type') == 'initial_state'
+    return communicator
+
+
+async def next_status(communicator, user_id):
+    while True:
+        frame = await communicator.receive_json_from(timeout=5)
+        if frame.get('type') == 'user_status' and frame['user_id'] == user_id:
+            return frame['status']
+
+
+def test_heartbeat_after_sweep_announces_online(application, transactional_db, circle_with_members, tokens):
+    _, members = circle_with_members(2)
+    keys = tokens(members)
+    user_id = members[1].id
+
+    async def run():
+        tab = await open_online(application, keys[1])
+
+        # The tab stalls past the TTL and the maintenance loop sweeps the user
+        store = get_presence_store()
+        with patch('core.presence.time.time', return_value=time.time() + PRESENCE_TTL + 1):
+            assert user_id in await store.sweep()
+        await store.take_dirty()
+        assert not await store.online_among([user_id])
+        watcher = await open_online(application, keys[0])
+
+        # Its next heartbeat brings the user back, for the audience and for the is_online flush
+        await tab.send_json_to({'type': 'heartbeat'})
+        assert await next_status(watcher, user_id) == 'online'
+        assert await store.online_among([user_id]) == [user_id]
+        online, _ = await store.take_dirty()
+        assert user_id in online
+
+        # A heartbeat from a user who is still online announces nothing
+        await tab.send_json_to({'type': 'heartbeat'})
+        assert await watcher.receive_nothing(timeout=0.5)
+
+        await tab.disconnect()
+        await watcher.disconnect()
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import pytest
+from core.conversations import record_message
+from core.membership import get_member_ids
+from core.models import Circle, Task, ChecklistItem, Message, DirectMessage, UserProfile
+
+ROWS = 30
+
+# Queries allowed per request, independent of how many rows come back.
+# Raise a budget only together with the change that justifies it.
+BUDGETS = {
+    'circles/my_circles': 2,   # circles joined with admin/profile, members joined with profile
+    'circles/retrieve': 2,
+    'tasks/list': 3,           # tasks joined with creator/profile, assignees, checklist items
+    'messages/list': 1,        # one keyset page, sender/profile joined; membership from the index
+    'direct-messages/list': 1,
+    'conversations/list': 2,   # a keyset page per side of the pair, both users/profiles and the last message joined
+}
+
+
+@pytest.fixture
+def urls(make_users):
+    """Every endpoint in BUDGETS over ROWS members, tasks and messages, with the caller first"""
+    users = make_users(ROWS)
+    UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+    me, peer = users[0], users[1]
+
+    circles = []
+    for i in range(3):
+        circle = Circle.objects.create(name=f'query budget {i}', admin=me)
+        circle.members.add(*users)
+        circles.append(circle)
+    circle = circles[0]
+
+    for i in range(ROWS):
+        task = Task.objects.create(circle=circle, title=f'task {i}', created_by=users[i], task_type='checklist')
+        task.assignees.add(*users[:3])
+        ChecklistItem.objects.bulk_create(ChecklistItem(task=task, content=f'item {j}') for j in range(3))
+    Message.objects.bulk_create(Message(circle=circle, sender=users[i], content='hi') for i in range(ROWS))
+    low, high = sorted([me, peer], key=lambda user: user.id)
+    DirectMessage.objects.bulk_create(
+        DirectMessage(sender=[me, peer][i % 2], receiver=[peer, me][i % 2], user_low=low, user_high=high, content='hi')
+        for i in range(ROWS)
+    )
+    # An inbox with a conversation per user
+    for other in users[1:]:
+        record_message(DirectMessage.objects.create(sender=other, receiver=me, content='hi'))
+
+    # Budgets are for steady state, where the circle's membership index is warm
+    get_member_ids(circle.id)
+
+    return me, {
+        'circles/my_circles': '/api/circles/my_circles/',
+        'circles/retrieve': f'/api/circles/{circle.id}/',
+        'tasks/list': f'/api/tasks/?circle_id={circle.id}',
+        'messages/list': f'/api/messages/?circle_id={circle.id}',
+        'direct-messages/list': f'/api/direct-messages/?target_id={peer.id}',
+        'conversations/list': '/api/conversations/',
+    }
+
+
+@pytest.mark.parametrize('name, budget', BUDGETS.items())
+def test_list_within_budget(urls, api_client, django_assert_max_num_queries, name, budget):
+    me, paths = urls
+    client = api_client(me)
+    with django_assert_max_num_queries(budget):
+        response = client.get(paths[name])
+    assert response.status_code == 200
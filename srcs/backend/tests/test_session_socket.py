@@ -0,0 +1,158 @@
+import asyncio
+import json
+from unittest.mock import patch
+import pytest
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from core import codec
+from core.consumers.multiplex import TOPICS
+
+
+@pytest.fixture
+def session(transactional_db, circle_with_members, tokens):
+    circle, members = circle_with_members(2)
+    return circle, members, tokens(members)
+
+
+async def open_session(application, key, **kwargs):
+    communicator = WebsocketCommunicator(application, f'/ws/session/?token={key}', **kwargs)
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+async def expect(communicator, match):
+    """Next frame satisfying match, as (topic, frame); others are skipped"""
+    while True:
+        text = await communicator.receive_from(timeout=5)
+        if text.startswith('{'):
+            topic, frame = None, json.loads(text)
+        else:
+            topic, _, payload = text.partition('\n')
+            frame = json.loads(payload)
+        if match(topic, frame):
+            return topic, frame
+
+
+async def subscribe(communicator, topic):
+    await communicator.send_to(json.dumps({'type': 'subscribe', 'topic': topic}))
+    _, frame = await expect(communicator, lambda t, f: f.get('topic') == topic)
+    return frame
+
+
+def test_frames_routed_by_topic(application, session):
+    circle, (admin, member), keys = session
+
+    async def run():
+        reader = await open_session(application, keys[1])
+        for topic in [f'chat:{circle.id}', f'sudoku:{circle.id}', f'dm:{admin.id}', 'notifications', 'presence']:
+            assert (await subscribe(reader, topic))['type'] == 'subscribed'
+        writer = await open_session(application, keys[0])
+        await subscribe(writer, f'chat:{circle.id}')
+
+        # A chat message reaches the reader on its chat topic, and as a notification
+        await writer.send_to(f'chat:{circle.id}\n' + json.dumps({'message': 'over the session'}))
+        topic, frame = await expect(reader, lambda t, f: f.get('type') == 'chat_message')
+        assert topic == f'chat:{circle.id}'
+        assert frame['message'] == 'over the session' and frame.get('seq')
+        topic, _ = await expect(reader, lambda t, f: f.get('type') == 'notification')
+        assert topic == 'notifications'
+
+        await reader.disconnect()
+        await writer.disconnect()
+
+    asyncio.run(run())
+
+
+def test_bad_and_crashed_topics(application, session):
+    _, _, keys = session
+
+    async def crash(scope, receive, send):
+        raise RuntimeError('consumer crashed')
+
+    async def run():
+        reader = await open_session(application, keys[1])
+        await subscribe(reader, 'presence')
+
+        # Unknown and duplicate topics are refused without touching the others
+        assert (await subscribe(reader, 'nope:1'))['error'] == 'unknown topic'
+        assert (await subscribe(reader, 'presence'))['error'] == 'already subscribed'
+        assert (await subscribe(reader, 'dm:abc'))['error'] == 'unknown topic'
+
+        # A topic whose consumer crashes is reported with 1011 and frees its slot
+        with patch.dict(TOPICS, {'sudoku': (crash, 'circle_id')}):
+            for _ in range(2):
+                frame = await subscribe(reader, 'sudoku:999999')
+                assert (frame['type'], frame.get('code')) == ('unsubscribed', 1011)
+
+        await reader.disconnect()
+
+    asyncio.run(run())
+
+
+def test_kick_closes_only_circle_topics(application, session, api_client):
+    circle, (admin, member), keys = session
+    client = api_client(admin)
+
+    async def run():
+        reader = await open_session(application, keys[1])
+        for topic in [f'chat:{circle.id}', f'sudoku:{circle.id}', f'dm:{admin.id}']:
+            await subscribe(reader, topic)
+        writer = await open_session(application, keys[0])
+
+        # Kicked: the circle's topics close with 4403, the session and its other topics stay
+        response = await sync_to_async(client.post)(
+            f'/api/circles/{circle.id}/kick_member/', {'member_id': member.id}, format='json'
+        )
+        assert response.status_code == 200
+        closed = {}
+        while len(closed) < 2:
+            _, frame = await expect(reader, lambda t, f: f.get('type') == 'unsubscribed')
+            closed[frame['topic']] = frame.get('code')
+        assert closed == {f'chat:{circle.id}': 4403, f'sudoku:{circle.id}': 4403}
+        assert (await subscribe(reader, f'chat:{circle.id}'))['type'] == 'unsubscribed'
+
+        await subscribe(writer, f'dm:{member.id}')
+        await writer.send_to(f'dm:{member.id}\n' + json.dumps({'message': 'still here'}))
+        topic, frame = await expect(reader, lambda t, f: f.get('type') == 'chat_message')
+        assert topic == f'dm:{admin.id}' and frame['message'] == 'still here'
+
+        await reader.disconnect()
+        await writer.disconnect()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(codec.msgpack is None, reason='msgpack is not installed')
+def test_msgpack_session(application, session):
+    _, (admin, member), keys = session
+    topic = f'dm:{member.id}'
+
+    async def run():
+        reader = await open_session(application, keys[1])
+        await subscribe(reader, f'dm:{admin.id}')
+
+        # Offered msgpack: stream frames are binary both ways, and JSON peers are unaffected
+        packed = await open_session(application, keys[0], subprotocols=[codec.MSGPACK])
+        await packed.send_to(json.dumps({'type': 'subscribe', 'topic': topic}))
+        while True:
+            output = await packed.receive_output(timeout=5)
+            if output.get('text') and json.loads(output['text']).get('type') == 'subscribed':
+                break
+        await packed.send_to(bytes_data=topic.encode() + b'\n' + codec.pack({'message': 'packed'}))
+        while True:
+            output = await packed.receive_output(timeout=5)
+            if output.get('bytes') is None:
+                continue
+            name, _, payload = output['bytes'].partition(b'\n')
+            frame = codec.unpack(payload)
+            if frame.get('type') == 'chat_message':
+                break
+        assert name.decode() == topic and frame['message'] == 'packed'
+        _, frame = await expect(reader, lambda t, f: f.get('type') == 'chat_message')
+        assert frame['message'] == 'packed'
+
+        await packed.disconnect()
+        await reader.disconnect()
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from django.db import close_old_connections
+from rest_framework.test import APIClient
+from core.models import Circle, Task, ChecklistItem
+
+CLICKS = 101
+THREADS = 8
+
+
+@pytest.fixture
+def checklist(transactional_db, circle_with_members):
+    # Committed, so every worker thread's connection sees it
+    circle, members = circle_with_members(THREADS)
+    task = Task.objects.create(circle=circle, title='race', created_by=members[0], task_type='checklist')
+    return task, members
+
+
+def click_all(users, click):
+    local = threading.local()
+
+    def run(i):
+        # One client (and one DB connection) per worker thread
+        if not hasattr(local, 'client'):
+            local.client = APIClient()
+            local.client.force_authenticate(users[i % len(users)])
+        try:
+            return click(local.client)
+        finally:
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(run, range(CLICKS)))
+
+
+def test_parallel_toggles_on_one_item(checklist):
+    task, users = checklist
+    item = ChecklistItem.objects.create(task=task, content='contended')
+    revision_before = Circle.objects.get(id=task.circle_id).task_revision
+
+    responses = click_all(
+        users, lambda client: client.post(f'/api/tasks/{task.id}/toggle_check/', {'item_id': item.id}, format='json')
+    )
+    assert [r.status_code for r in responses if r.status_code != 200] == []
+
+    # Every click flipped the value exactly once: parity decides the end state,
+    # and each one got its own revision
+    item.refresh_from_db()
+    assert item.is_checked == (CLICKS % 2 == 1)
+    assert sum(r.data['is_checked'] for r in responses) == (CLICKS + 1) // 2
+    assert Circle.objects.get(id=task.circle_id).task_revision - revision_before == CLICKS
+
+
+def test_parallel_batch_toggles(checklist):
+    task, users = checklist
+    items = ChecklistItem.objects.bulk_create(ChecklistItem(task=task, content=f'batch {i}') for i in range(5))
+    ids = [item.id for item in items]
+
+    responses = click_all(
+        users, lambda client: client.post(f'/api/tasks/{task.id}/toggle_checks/', {'item_ids': ids}, format='json')
+    )
+    assert [r.status_code for r in responses if r.status_code != 200] == []
+
+    states = set(ChecklistItem.objects.filter(id__in=ids).values_list('is_checked', flat=True))
+    assert states == {CLICKS % 2 == 1}
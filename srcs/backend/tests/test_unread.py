@@ -0,0 +1,61 @@
+from unittest.mock import patch
+import pytest
+from core import unread
+from core.conversations import mark_read, record_message
+from core.models import DirectMessage
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def redis():
+    client = fakeredis.FakeRedis()
+    with patch('core.unread.redis_client', return_value=client):
+        yield client
+
+
+@pytest.fixture
+def send(make_users, django_capture_on_commit_callbacks):
+    def send(sender, receiver):
+        # The cache is updated after commit
+        with django_capture_on_commit_callbacks(execute=True):
+            record_message(DirectMessage.objects.create(sender=sender, receiver=receiver, content='hi'))
+    return send
+
+
+def test_miss_fills_and_sends_update_the_hash(redis, make_users, send):
+    me, peer = make_users(2)
+    send(peer, me)
+
+    assert unread.get_unread_counts(me.id) == {peer.id: 1}
+    assert unread.cached_counts(me.id)[0] == {peer.id: 1}
+    send(peer, me)
+    assert unread.cached_counts(me.id)[0] == {peer.id: 2}
+
+
+def test_fill_racing_a_send_is_refused(redis, make_users, send):
+    me, peer = make_users(2)
+    send(peer, me)
+
+    # A reader misses and reads the table; a send commits before it fills
+    counts, version = unread.cached_counts(me.id)
+    assert counts is None
+    stale = {peer.id: 1}
+    send(peer, me)
+    unread.cache_fill(me.id, stale, version)
+
+    assert unread.cached_counts(me.id)[0] is None
+    assert unread.get_unread_counts(me.id) == {peer.id: 2}
+    assert unread.cached_counts(me.id)[0] == {peer.id: 2}
+
+
+def test_fill_racing_mark_read_is_refused(redis, make_users, send, django_capture_on_commit_callbacks):
+    me, peer = make_users(2)
+    send(peer, me)
+
+    counts, version = unread.cached_counts(me.id)
+    with django_capture_on_commit_callbacks(execute=True):
+        mark_read(me.id, peer.id)
+    unread.cache_fill(me.id, {peer.id: 1}, version)
+
+    assert unread.get_unread_counts(me.id) == {}
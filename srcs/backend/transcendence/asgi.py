@@ -8,18 +8,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transcendence.settings')
 django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 import core.routing
 
+from core.dispatch import DispatchLoopMiddleware
 from transcendence.middleware import TokenAuthMiddleware
 
-application = ProtocolTypeRouter({
+application = DispatchLoopMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
+    # TokenAuthMiddleware falls back to AuthMiddlewareStack (session) when no token is given
     "websocket": TokenAuthMiddleware(
-        AuthMiddlewareStack(
-            URLRouter(
-                core.routing.websocket_urlpatterns
-            )
+        URLRouter(
+            core.routing.websocket_urlpatterns
         )
     ),
-})
+}))
@@ -1,36 +1,64 @@
+import time
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
-from channels.db import database_sync_to_async
+from channels.auth import AuthMiddlewareStack
+from core.db_executor import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.db import close_old_connections
 from urllib.parse import parse_qs
+from core.metrics import HTTP_LATENCY, HTTP_QUERIES, request_queries
+from core.token_cache import token_user_cache, get_user_for_token
 
-@database_sync_to_async
-def get_user(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
-        return AnonymousUser()
+async def get_user(token_key):
+    # Cache hits are answered on the event loop without touching the thread pool
+    user = token_user_cache.get(token_key)
+    if user is None:
+        user = await database_sync_to_async(get_user_for_token)(token_key)
+    return user or AnonymousUser()
 
 class TokenAuthMiddleware(BaseMiddleware):
+    """
+    Resolves the user once per connection and puts it in scope['user'];
+    consumers read it from there instead of looking the token up again.
+    Connections without a token fall back to Django session auth.
+    """
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.session_inner = AuthMiddlewareStack(inner)
+
     async def __call__(self, scope, receive, send):
         close_old_connections()
         try:
             query_string = scope.get('query_string', b'').decode()
             query_params = parse_qs(query_string)
             token_key = query_params.get('token', [None])[0]
-            
-            if token_key:
-                user = await get_user(token_key)
-                scope['user'] = user
-            else:
-                # If no token in query params, user might be authenticated by AuthMiddlewareStack (session)
-                # But if we rely solely on token for React, we can check if user is already set
-                pass
-                
-        except Exception as e:
-            # print(f"Middleware Error: {e}")
-            pass
-            
+        except Exception:
+            token_key = None
+
+        if not token_key:
+            # No token (e.g. admin with a session cookie); let the session stack resolve the user
+            return await self.session_inner(scope, receive, send)
+
+        scope = dict(scope)
+        scope['user'] = await get_user(token_key)
         return await super().__call__(scope, receive, send)
+
+class MetricsMiddleware:
+    """Latency and statement count of every REST request, by view (see core.metrics)"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+        token = request_queries.set(queries)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            request_queries.reset(token)
+            match = request.resolver_match
+            view = (match.url_name or match.view_name) if match else 'unmatched'
+            HTTP_LATENCY.labels(view, request.method, status).observe(time.perf_counter() - start)
+            HTTP_QUERIES.labels(view).observe(queries[0])
@@ -35,6 +35,8 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the whole request
+    'transcendence.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -122,13 +124,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Channels Configuration
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        # channels_redis with group_send latency metrics
+        'BACKEND': 'core.channel_layers.RedisChannelLayer',
         'CONFIG': {
             "hosts": [f"redis://:{config('REDIS_PASSWORD', default='redis123')}@{config('REDIS_HOST', default='redis')}:{config('REDIS_PORT', default='6379')}/0"],
         },
     },
 }
 
+# Where notifications sent from REST views are executed:
+# 'inprocess' (worker thread inside each backend process) or
+# 'redis' (Redis stream served by `python manage.py dispatch_worker`)
+NOTIFICATION_DISPATCH_BACKEND = config('NOTIFICATION_DISPATCH_BACKEND', default='inprocess')
+
+# Per-process token -> user cache used to authenticate WebSocket connections
+WS_TOKEN_CACHE_SIZE = config('WS_TOKEN_CACHE_SIZE', default=10000, cast=int)
+WS_TOKEN_CACHE_TTL = config('WS_TOKEN_CACHE_TTL', default=300, cast=int)
+
+# Presence: 'redis' (shared by all backend processes) or 'memory' (single process, development)
+PRESENCE_BACKEND = config('PRESENCE_BACKEND', default='redis')
+PRESENCE_REDIS_URL = f"redis://:{config('REDIS_PASSWORD', default='redis123')}@{config('REDIS_HOST', default='redis')}:{config('REDIS_PORT', default='6379')}/2"
+# Seconds a tab stays online without a heartbeat, and how often is_online is flushed to Postgres
+PRESENCE_TTL = config('PRESENCE_TTL', default=90, cast=int)
+PRESENCE_FLUSH_INTERVAL = config('PRESENCE_FLUSH_INTERVAL', default=15, cast=int)
+
+# Milliseconds between write-behind flushes of live Sudoku boards
+SUDOKU_FLUSH_INTERVAL = config('SUDOKU_FLUSH_INTERVAL', default=500, cast=int)
+# Ready-made puzzles kept per difficulty
+SUDOKU_POOL_SIZE = config('SUDOKU_POOL_SIZE', default=20, cast=int)
+
+# Chat/DM messages are written in batches: every MESSAGE_FLUSH_INTERVAL ms or once MESSAGE_FLUSH_BATCH are waiting
+MESSAGE_FLUSH_INTERVAL = config('MESSAGE_FLUSH_INTERVAL', default=5, cast=int)
+MESSAGE_FLUSH_BATCH = config('MESSAGE_FLUSH_BATCH', default=200, cast=int)
+
+# Chat frames carry per-room sequence numbers; the newest REPLAY_BUFFER_SIZE per room are
+# kept for REPLAY_TTL seconds so reconnecting clients get what they missed.
+# 'redis' (shared by all backend processes) or 'memory' (single process, development)
+REPLAY_BACKEND = config('REPLAY_BACKEND', default='redis')
+REPLAY_REDIS_URL = f"redis://:{config('REDIS_PASSWORD', default='redis123')}@{config('REDIS_HOST', default='redis')}:{config('REDIS_PORT', default='6379')}/3"
+REPLAY_BUFFER_SIZE = config('REPLAY_BUFFER_SIZE', default=500, cast=int)
+REPLAY_TTL = config('REPLAY_TTL', default=86400, cast=int)
+
+# Unread DM counters: 'redis' caches them in front of the table, 'database' reads the table directly
+DM_UNREAD_BACKEND = config('DM_UNREAD_BACKEND', default='redis')
+
+# Consumers' database calls run on a pool of DB_EXECUTOR_THREADS threads (core.db_executor);
+# keep it below the database's connection limit divided by the number of backend processes (1 on SQLite,
+# which takes one writer at a time)
+DB_EXECUTOR_THREADS = config('DB_EXECUTOR_THREADS', default=8, cast=int)
+# Event loop lag is sampled every LOOP_MONITOR_INTERVAL seconds; consumer handlers slower than
+# WS_SLOW_HANDLER seconds are logged with their stack, and cancelled after WS_HANDLER_TIMEOUT (0: never)
+LOOP_MONITOR_INTERVAL = config('LOOP_MONITOR_INTERVAL', default=0.5, cast=float)
+WS_SLOW_HANDLER = config('WS_SLOW_HANDLER', default=0.25, cast=float)
+WS_HANDLER_TIMEOUT = config('WS_HANDLER_TIMEOUT', default=30, cast=float)
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -140,6 +189,26 @@ REST_FRAMEWORK = {
     ],
 }
 
+# /metrics (core.metrics) requires "Authorization: Bearer <METRICS_TOKEN>" when set; otherwise it
+# only answers direct requests from loopback and private addresses
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Structured JSON logs (core.log); DEBUG turns on the per-connection lines
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.log.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # Social Auth / Google OAuth Configuration
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
@@ -0,0 +1,38 @@
+"""
+Everything in one process, without Postgres or Redis: SQLite, the local-memory
+cache, the in-memory channel layer and the in-memory presence and replay
+stores. For the load test and the benchmarks (tests/), and for poking at the
+backend outside docker:
+
+    DJANGO_SETTINGS_MODULE=transcendence.settings_sqlite python manage.py loadtest
+"""
+from decouple import config
+from transcendence.settings import *  # noqa: F401,F403
+from transcendence.settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+        # Consumers and views write from several threads; wait for the write lock instead of failing
+        'OPTIONS': {'timeout': 20},
+        # A file, not the shared in-memory database, so every thread sees committed rows
+        'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+    }
+}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'core.channel_layers.InMemoryChannelLayer'},
+}
+
+PRESENCE_BACKEND = 'memory'
+REPLAY_BACKEND = 'memory'
+DM_UNREAD_BACKEND = 'database'
+NOTIFICATION_DISPATCH_BACKEND = 'inprocess'
+
+# SQLite takes one writer at a time
+DB_EXECUTOR_THREADS = 1
@@ -2,7 +2,7 @@ import React from 'react';
 import './DashboardMembers.css';
 
 const DashboardMembers = ({
-    selectedEnv, user, onlineUsers, startDM, setPreselectedAssignee,
+    selectedEnv, user, onlineUsers, unreadCounts, startDM, setPreselectedAssignee,
     setShowCreateTask, handleKick, handleLeaveCircle
 }) => {
     return (
@@ -45,6 +45,7 @@ const DashboardMembers = ({
                                     <>
                                         <button onClick={() => startDM(member)} className="btn btn-sm btn-custom-green rounded-pill px-3">
                                             Message
+                                            {unreadCounts?.[member.id] > 0 && <span className="badge bg-danger rounded-pill ms-2">{unreadCounts[member.id]}</span>}
                                         </button>
                                         <button onClick={() => { setPreselectedAssignee(member.id); setShowCreateTask(true); }} className="btn btn-sm btn-outline-secondary rounded-pill px-3">
                                             Assign Task
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import './Dashboard.css';
 import { CreateCircleModal, CreateTaskModal, InviteModal, JoinCircleModal, TaskDetailModal, ConfirmationModal } from '../components/DashboardModals';
 import Sudoku from './Sudoku';
+import { openTopic } from '../sessionSocket';
 import DashboardSidebar from '../components/DashboardSidebar';
 import DashboardTopbar from '../components/DashboardTopbar';
 import DashboardSettings from '../components/DashboardSettings';
@@ -54,6 +55,9 @@ const Dashboard = () => {
 	const [chatInput, setChatInput] = useState('');
 	const [isConnected, setIsConnected] = useState(false);
 	const ws = React.useRef(null);
+	const taskRevision = React.useRef({ circleId: null, revision: 0 });
+	const [unreadCounts, setUnreadCounts] = useState({}); // peer id -> unread DMs
+	const openDmPeer = React.useRef(null); // Peer of the open DM, whose messages are read as they arrive
 	const messagesEndRef = React.useRef(null);
 
 	// Settings States
@@ -243,17 +247,23 @@ const Dashboard = () => {
 
 		fetchUserData();
 		fetchCircles();
+		fetchUnreadCounts();
 
 		// Connect to Presence WebSocket
 		const token = localStorage.getItem('token');
 		if (token) {
-			const wsScheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
-			const wsUrl = `${wsScheme}://${window.location.host}/ws/online/?token=${token}`;
-			console.log("Connecting to Presence WS:", wsUrl);
-			const presenceWs = new WebSocket(wsUrl);
+			// Presence, notifications and the open chat share the tab's session socket
+			const presenceWs = openTopic('presence');
 
+			// Presence expires on the server unless the tab keeps sending heartbeats
+			let heartbeat = null;
 			presenceWs.onopen = () => {
 				console.log("Presence WS Connected");
+				heartbeat = setInterval(() => {
+					if (presenceWs.readyState === WebSocket.OPEN) {
+						presenceWs.send(JSON.stringify({ type: 'heartbeat' }));
+					}
+				}, 30000);
 			};
 
 			presenceWs.onerror = (e) => {
@@ -262,6 +272,7 @@ const Dashboard = () => {
 
 			presenceWs.onclose = (e) => {
 				console.log("Presence WS Closed:", e.code, e.reason);
+				clearInterval(heartbeat);
 			};
 
 			presenceWs.onmessage = (e) => {
@@ -289,9 +300,7 @@ const Dashboard = () => {
 		const token = localStorage.getItem('token');
 		if (!token) return;
 
-		const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-		const wsUrl = `${protocol}//${window.location.host}/ws/notifications/?token=${token}`;
-		const notifWs = new WebSocket(wsUrl);
+		const notifWs = openTopic('notifications');
 
 		notifWs.onopen = () => console.log("Notification WS Connected");
 
@@ -300,6 +309,10 @@ const Dashboard = () => {
 				const data = JSON.parse(event.data);
 				if (data.type === 'notification' && data.data) {
 					const notif = data.data;
+					if (notif.type === 'direct_message' && notif.sender_id !== openDmPeer.current) {
+						setUnreadCounts(prev => ({ ...prev, [notif.sender_id]: (prev[notif.sender_id] || 0) + 1 }));
+					}
+
 					// Add to toasts (popup)
 					setToasts(prev => [...prev, {
 						id: Date.now(),
@@ -341,26 +354,71 @@ const Dashboard = () => {
 		} catch (e) { console.error(e); }
 	};
 
+	// Merge changed/deleted tasks into the list (and the open task, if any)
+	const applyTaskChanges = (changed, deletedIds) => {
+		setTasks(prev => {
+			const byId = new Map(prev.map(t => [t.id, t]));
+			changed.forEach(t => byId.set(t.id, t));
+			deletedIds.forEach(id => byId.delete(id));
+			return [...byId.values()].sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
+		});
+		setSelectedTask(prev => {
+			if (!prev) return prev;
+			if (deletedIds.includes(prev.id)) return null;
+			return changed.find(t => t.id === prev.id) || prev;
+		});
+	};
+
+	// Full snapshot the first time for a circle, then only what changed since the last revision we saw
 	const fetchTasks = async (circleId) => {
 		const token = localStorage.getItem('token');
 		if (!token) return;
+		const known = taskRevision.current;
+		const sinceRev = known.circleId === circleId ? known.revision : 0;
 		try {
-			const res = await fetch(`/api/tasks/?circle_id=${circleId}`, {
+			const res = await fetch(`/api/tasks/?circle_id=${circleId}&since_rev=${sinceRev}`, {
 				headers: { 'Authorization': `Token ${token}` }
 			});
 			if (res.ok) {
 				const data = await res.json();
-				setTasks(data);
-				// Also update selected task if open
-				if (selectedTask) {
-					const updated = data.find(t => t.id === selectedTask.id);
-					if (updated) setSelectedTask(updated);
-					else { setSelectedTask(null); setShowTaskDetail(false); }
+				if (sinceRev === 0) {
+					setTasks([]);
 				}
+				applyTaskChanges(data.tasks, data.deleted);
+				taskRevision.current = { circleId, revision: Math.max(data.revision, sinceRev) };
 			}
 		} catch (e) { console.error(e); }
 	};
 
+	const handleTaskEvent = (event, circleId) => {
+		const known = taskRevision.current;
+		if (known.circleId !== circleId || event.revision <= known.revision) return; // stale or already applied
+		if (event.revision !== known.revision + 1) {
+			// Missed something; catch up from the server
+			fetchTasks(circleId);
+			return;
+		}
+		taskRevision.current = { circleId, revision: event.revision };
+		if (event.action === 'delete') {
+			applyTaskChanges([], [event.task_id]);
+		} else if (event.action === 'check') {
+			// One toggled item, or a batch from toggle_checks
+			const changed = new Map((event.items || [event.item]).map(i => [i.id, i]));
+			setTasks(prev => prev.map(t => t.id !== event.task_id ? t : {
+				...t,
+				checklist_items: t.checklist_items
+					.map(i => changed.get(i.id) || i)
+					.sort((a, b) => (a.is_checked - b.is_checked) || (a.id - b.id))
+			}));
+			setSelectedTask(prev => prev && prev.id === event.task_id ? {
+				...prev,
+				checklist_items: prev.checklist_items.map(i => changed.get(i.id) || i)
+			} : prev);
+		} else {
+			applyTaskChanges([event.task], []);
+		}
+	};
+
 	const fetchMessages = async (circleId) => {
 		const token = localStorage.getItem('token');
 		if (!token) return;
@@ -369,8 +427,9 @@ const Dashboard = () => {
 				headers: { 'Authorization': `Token ${token}` }
 			});
 			if (res.ok) {
+				// Newest page only; older history is available via ?before=<data.older>
 				const data = await res.json();
-				setMessages(data);
+				setMessages(data.results);
 				scrollToBottom();
 			}
 		} catch (e) { console.error(e); }
@@ -384,10 +443,32 @@ const Dashboard = () => {
 				headers: { 'Authorization': `Token ${token}` }
 			});
 			if (res.ok) {
+				// Newest page only; older history is available via ?before=<data.older>
 				const data = await res.json();
-				setMessages(data);
+				setMessages(data.results);
 				scrollToBottom();
 			}
+			// Opening the conversation reads it
+			setUnreadCounts(prev => ({ ...prev, [targetId]: 0 }));
+			await fetch('/api/direct-messages/mark_read/', {
+				method: 'POST',
+				headers: { 'Content-Type': 'application/json', 'Authorization': `Token ${token}` },
+				body: JSON.stringify({ target_id: targetId })
+			});
+		} catch (e) { console.error(e); }
+	};
+
+	const fetchUnreadCounts = async () => {
+		const token = localStorage.getItem('token');
+		if (!token) return;
+		try {
+			const res = await fetch('/api/direct-messages/unread/', {
+				headers: { 'Authorization': `Token ${token}` }
+			});
+			if (res.ok) {
+				const data = await res.json();
+				setUnreadCounts(data.counts);
+			}
 		} catch (e) { console.error(e); }
 	};
 
@@ -407,52 +488,102 @@ const Dashboard = () => {
 
 			setMessages([]); // Clear messages on switch
 
-			const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-			let wsUrl = '';
+			const topic = activeChatMode === 'circle' ? `chat:${selectedEnv.id}` : `dm:${dmTarget.id}`;
 
-			if (activeChatMode === 'circle') {
-				wsUrl = `${protocol}//${window.location.host}/ws/chat/${selectedEnv.id}/?token=${token}`;
-			} else {
-				wsUrl = `${protocol}//${window.location.host}/ws/chat/dm/${dmTarget.id}/?token=${token}`;
-			}
+			openDmPeer.current = activeChatMode === 'dm' ? dmTarget.id : null;
 
-			ws.current = new WebSocket(wsUrl);
+			// Last chat frame seq seen with nothing missing before it; sent back after a
+			// reconnect so the server replays what was missed. Frames can arrive out of
+			// order, so seqs seen past a gap wait in `ahead` until the gap fills.
+			let lastSeq = null;
+			const ahead = new Set();
+			const advance = () => {
+				ahead.forEach(seq => { if (seq <= lastSeq) ahead.delete(seq); });
+				while (ahead.has(lastSeq + 1)) {
+					lastSeq += 1;
+					ahead.delete(lastSeq);
+				}
+			};
+			let closing = false;
+			let retries = 0;
+			let retryTimer = null;
 
-			ws.current.onopen = () => {
-				setIsConnected(true);
+			const refetch = () => {
+				if (activeChatMode === 'circle') fetchMessages(selectedEnv.id);
+				else fetchDMMessages(dmTarget.id);
 			};
 
-			ws.current.onmessage = (event) => {
-				const data = JSON.parse(event.data);
+			const connect = () => {
+				const socket = openTopic(topic);
+				ws.current = socket;
 
-				if (data.type === 'task_update') {
-					if (selectedEnv) fetchTasks(selectedEnv.id);
-				} else if (data.type === 'chat_message' || data.message) {
-					setMessages(prev => [...prev, {
-						content: data.message,
-						sender: data.sender,
-						timestamp: new Date().toISOString()
-					}]);
-					scrollToBottom();
-				}
-			};
+				socket.onopen = () => {
+					setIsConnected(true);
+					retries = 0;
+					if (lastSeq !== null) {
+						socket.send(JSON.stringify({ type: 'resume', last_seq: lastSeq }));
+					}
+				};
+
+				socket.onmessage = (event) => {
+					const data = JSON.parse(event.data);
+
+					if (data.type === 'chat_state') {
+						if (lastSeq === null) {
+							lastSeq = data.seq;
+							advance();
+						}
+					} else if (data.type === 'resync') {
+						// Missed more than the server keeps: reload the newest page
+						lastSeq = data.seq;
+						ahead.clear();
+						refetch();
+					} else if (data.type === 'task_update') {
+						if (selectedEnv) handleTaskEvent(data, selectedEnv.id);
+					} else if (data.type === 'membership_revoked') {
+						// Kicked (or left from another tab): the server closes this socket
+						showToast("You are no longer a member of this circle.", "System");
+						fetchCircles();
+					} else if (data.type === 'chat_message' || data.message) {
+						if (data.seq != null) {
+							ahead.add(data.seq);
+							if (lastSeq !== null) advance();
+						}
+						setMessages(prev => prev.some(m => m.id && m.id === data.id) ? prev : [...prev, {
+							id: data.id,
+							content: data.message,
+							sender: data.sender,
+							timestamp: data.timestamp || new Date().toISOString()
+						}]);
+						scrollToBottom();
+						// Seen as it arrives, so it doesn't count as unread
+						if (activeChatMode === 'dm' && data.sender && data.sender.id === dmTarget.id) {
+							socket.send(JSON.stringify({ type: 'mark_read' }));
+						}
+					}
+				};
 
-			ws.current.onclose = () => {
-				setIsConnected(false);
+				socket.onclose = (e) => {
+					setIsConnected(false);
+					// 4403: access revoked; otherwise reconnect with backoff unless we closed it
+					if (closing || e.code === 4403 || retries >= 5) return;
+					retries += 1;
+					retryTimer = setTimeout(connect, 1000 * 2 ** (retries - 1));
+				};
+
+				socket.onerror = (e) => {
+					console.error("WS Error", e);
+				};
 			};
 
-			ws.current.onerror = (e) => {
-				console.error("WS Error", e);
-			};
+			connect();
 
 			// Initial fetch based on mode
-			if (activeChatMode === 'circle') {
-				fetchMessages(selectedEnv.id);
-			} else {
-				fetchDMMessages(dmTarget.id);
-			}
+			refetch();
 
 			return () => {
+				closing = true;
+				clearTimeout(retryTimer);
 				if (ws.current) {
 					ws.current.close();
 					ws.current = null;
@@ -466,6 +597,7 @@ const Dashboard = () => {
 		if (selectedEnv) {
 			fetchTasks(selectedEnv.id);
 		} else {
+			taskRevision.current = { circleId: null, revision: 0 };
 			setTasks([]);
 		}
 	}, [selectedEnv]);
@@ -708,6 +840,7 @@ const Dashboard = () => {
 							selectedEnv={selectedEnv}
 							user={user}
 							onlineUsers={onlineUsers}
+							unreadCounts={unreadCounts}
 							startDM={startDM}
 							setPreselectedAssignee={setPreselectedAssignee}
 							setShowCreateTask={setShowCreateTask}
@@ -1,11 +1,11 @@
 import React, { useState, useEffect, useCallback, useRef } from 'react';
-import sudokuGenerator from '../utils/sudokuGenerator';
 import './Sudoku.css';
+import { openTopic } from '../sessionSocket';
 
 const Sudoku = ({ circleId, showToast }) => {
 	const [board, setBoard] = useState(Array(9).fill().map(() => Array(9).fill(0)));
 	const [initialBoard, setInitialBoard] = useState(Array(9).fill().map(() => Array(9).fill(0)));
-	const [solution, setSolution] = useState(null);
+	const [errors, setErrors] = useState({}); // "row-col" -> true for cells the server flagged as conflicting
 	const [selectedCell, setSelectedCell] = useState(null);
 	const [mistakes, setMistakes] = useState(0); // This is local-only for now, arguably could be shared but let's keep it simple
 	const [isSolved, setIsSolved] = useState(false);
@@ -14,16 +14,16 @@ const Sudoku = ({ circleId, showToast }) => {
 	const [nextDifficulty, setNextDifficulty] = useState('easy'); // Difficulty selected for the next game
 
 	const ws = useRef(null);
+	const myEdits = useRef({}); // Last value this player sent per cell, to count our own mistakes
+	const showToastRef = useRef(showToast);
+	showToastRef.current = showToast;
 
 	// WebSocket Connection
 	useEffect(() => {
 		if (!circleId) return;
 
-		const token = localStorage.getItem('token');
-		const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-		const wsUrl = `${protocol}//${window.location.host}/ws/sudoku/${circleId}/?token=${token}`;
-
-		ws.current = new WebSocket(wsUrl);
+		// Carried by the tab's session socket alongside the chat
+		ws.current = openTopic(`sudoku:${circleId}`);
 
 		ws.current.onopen = () => {
 			console.log("Sudoku WS Connected");
@@ -36,7 +36,7 @@ const Sudoku = ({ circleId, showToast }) => {
 			if (data.type === 'game_state') {
 				setBoard(data.board);
 				setInitialBoard(data.initial_board);
-				setSolution(data.solution);
+				setErrors({});
 				setIsSolved(data.is_solved);
 				setGameDifficulty(data.difficulty);
 				setNextDifficulty(data.difficulty); // Sync selector to current game initially
@@ -51,10 +51,27 @@ const Sudoku = ({ circleId, showToast }) => {
 					newBoard[data.row][data.col] = data.value;
 					return newBoard;
 				});
+				// A new value clears the cell's flag; a cell_conflict follows if it still clashes
+				setErrors(prev => {
+					const next = { ...prev };
+					delete next[`${data.row}-${data.col}`];
+					return next;
+				});
+			} else if (data.type === 'cell_conflict') {
+				setErrors(prev => ({ ...prev, [`${data.row}-${data.col}`]: true }));
+				if (myEdits.current[`${data.row}-${data.col}`] === data.value) {
+					setMistakes(prev => prev + 1);
+				}
+			} else if (data.type === 'membership_revoked') {
+				if (showToastRef.current) showToastRef.current("You are no longer a member of this circle.", "Sudoku");
+			} else if (data.type === 'game_solved') {
+				setIsSolved(true);
+				if (showToastRef.current) showToastRef.current("Puzzle Solved!", "Sudoku");
 			} else if (data.type === 'new_game') {
 				setBoard(data.board);
 				setInitialBoard(data.initial_board);
-				setSolution(data.solution);
+				setErrors({});
+				myEdits.current = {};
 				setIsSolved(false);
 				setMistakes(0); // Reset mistakes on new game
 				setGameDifficulty(data.difficulty);
@@ -75,14 +92,9 @@ const Sudoku = ({ circleId, showToast }) => {
 	const startNewGame = useCallback(() => {
 		if (!isConnected) return;
 
-		const { solved, initial } = sudokuGenerator.generate(nextDifficulty);
-
-		// Send to server
+		// The server picks a puzzle from its pool and sends it to everyone
 		ws.current.send(JSON.stringify({
 			type: 'new_game',
-			board: initial, // current board starts as initial
-			initial_board: initial,
-			solution: solved,
 			difficulty: nextDifficulty
 		}));
 	}, [isConnected, nextDifficulty]);
@@ -98,18 +110,8 @@ const Sudoku = ({ circleId, showToast }) => {
 		// Cannot edit initial cells
 		if (initialBoard && initialBoard[row][col] !== 0) return;
 
-		// Optimistic update? 
-		// Ideally we wait for server, but for responsiveness we can check locally if we have solution
-
-		// Logic:
-		// 1. Check valid/invalid against solution if we have it
-		if (solution) {
-			if (num !== 0 && num !== solution[row][col]) {
-				setMistakes(prev => prev + 1);
-				// We still allow placing the wrong number? 
-				// The previous implementation allowed it but counted mistake.
-			}
-		}
+		// The server checks the edit and answers with cell_conflict / game_solved
+		myEdits.current[`${row}-${col}`] = num;
 
 		// Send to server
 		ws.current.send(JSON.stringify({
@@ -151,25 +153,6 @@ const Sudoku = ({ circleId, showToast }) => {
 		return () => window.removeEventListener('keydown', handleKeyDown);
 	}, [selectedCell, handleNumberInput]);
 
-	// Check win condition locally if board updates
-	useEffect(() => {
-		if (solution && board && board.length > 0) {
-			let won = true;
-			for (let i = 0; i < 9; i++) {
-				for (let j = 0; j < 9; j++) {
-					if (board[i][j] !== solution[i][j]) {
-						won = false;
-						break;
-					}
-				}
-			}
-			if (won && !isSolved) {
-				setIsSolved(true);
-				if (showToast) showToast("Puzzle Solved!", "Sudoku");
-			}
-		}
-	}, [board, solution, isSolved, showToast]);
-
 	if (!circleId) return <div className="container text-center mt-5 text-white">Please join a circle to play Sudoku.</div>;
 
 	return (
@@ -192,7 +175,7 @@ const Sudoku = ({ circleId, showToast }) => {
 						row.map((cell, colIndex) => {
 							const isInitial = initialBoard && initialBoard[rowIndex] && initialBoard[rowIndex][colIndex] !== 0;
 							const isSelected = selectedCell?.row === rowIndex && selectedCell?.col === colIndex;
-							const isError = !isInitial && cell !== 0 && solution && cell !== solution[rowIndex][colIndex];
+							const isError = !isInitial && cell !== 0 && errors[`${rowIndex}-${colIndex}`];
 
 							return (
 								<div
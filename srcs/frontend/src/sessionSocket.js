@@ -0,0 +1,114 @@
+/**
+ * One WebSocket per tab (ws/session/) carrying every stream as a topic:
+ * chat:<circle>, dm:<user>, sudoku:<circle>, notifications, presence.
+ *
+ * openTopic(topic) returns an object used like a WebSocket for that stream
+ * (onopen / onmessage / onclose / onerror, send, close, readyState), so the
+ * pages keep their handlers. The session socket opens with the first topic and
+ * closes after the last one.
+ */
+
+let socket = null;
+const topics = new Map(); // topic -> TopicSocket
+
+class TopicSocket {
+	constructor(topic) {
+		this.topic = topic;
+		this.readyState = WebSocket.CONNECTING;
+		this.onopen = null;
+		this.onmessage = null;
+		this.onclose = null;
+		this.onerror = null;
+	}
+
+	send(payload) {
+		if (this.readyState !== WebSocket.OPEN || !socket) return;
+		socket.send(`${this.topic}\n${payload}`);
+	}
+
+	close() {
+		if (this.readyState === WebSocket.CLOSED) return;
+		if (topics.get(this.topic) === this) {
+			topics.delete(this.topic);
+			sendControl({ type: 'unsubscribe', topic: this.topic });
+		}
+		this.closed(1000);
+		if (topics.size === 0 && socket) {
+			socket.close();
+			socket = null;
+		}
+	}
+
+	opened() {
+		this.readyState = WebSocket.OPEN;
+		if (this.onopen) this.onopen();
+	}
+
+	closed(code) {
+		if (this.readyState === WebSocket.CLOSED) return;
+		this.readyState = WebSocket.CLOSED;
+		if (this.onclose) this.onclose({ code });
+	}
+}
+
+const sendControl = (frame) => {
+	if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify(frame));
+};
+
+const connect = () => {
+	const token = localStorage.getItem('token');
+	const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+	const current = new WebSocket(`${protocol}//${window.location.host}/ws/session/?token=${token}`);
+	socket = current;
+
+	current.onopen = () => {
+		topics.forEach((_, topic) => sendControl({ type: 'subscribe', topic }));
+	};
+
+	current.onmessage = (event) => {
+		const text = event.data;
+		if (text.startsWith('{')) {
+			const frame = JSON.parse(text);
+			const topicSocket = topics.get(frame.topic);
+			if (!topicSocket) return;
+			if (frame.type === 'subscribed') {
+				topicSocket.opened();
+			} else if (frame.type === 'unsubscribed' || frame.type === 'error') {
+				// Rejected or closed by the server (4403: no longer a member)
+				topics.delete(frame.topic);
+				topicSocket.closed(frame.code || 1006);
+			}
+			return;
+		}
+		const split = text.indexOf('\n');
+		const topicSocket = topics.get(text.slice(0, split));
+		if (topicSocket && topicSocket.onmessage) topicSocket.onmessage({ data: text.slice(split + 1) });
+	};
+
+	current.onerror = (e) => {
+		topics.forEach(topicSocket => topicSocket.onerror && topicSocket.onerror(e));
+	};
+
+	current.onclose = (e) => {
+		// Closed by us after the last topic; a newer socket may already be open
+		if (socket !== current) return;
+		socket = null;
+		// Every stream is gone with the socket; their owners reconnect as they did before
+		const open = [...topics.values()];
+		topics.clear();
+		open.forEach(topicSocket => topicSocket.closed(e.code));
+	};
+};
+
+export const openTopic = (topic) => {
+	const previous = topics.get(topic);
+	if (previous) previous.close();
+
+	const topicSocket = new TopicSocket(topic);
+	topics.set(topic, topicSocket);
+	if (!socket) connect();
+	else sendControl({ type: 'subscribe', topic });
+	return topicSocket;
+};
+
+export default openTopic;